@@ -118,7 +118,7 @@ class AsyncWrapper(ABC):
             self.manager.add_wrapper(self)
 
     @abstractmethod
-    def wait(self):
+    def wait(self, timeout=None):
         pass
 
     def fetch_target(self):
@@ -179,17 +179,26 @@ class LoopMixin(AsyncWrapper):
             self.task(**kwargs)
             time.sleep(self.__interval)
 
-    def stop(self):
+    def stop(self, timeout: float = None):
         if self.__cont:
             self.__cont = False
         else:
             logger.warning("Async object has already been stopped.")
-        self.wait()
+        self.wait(timeout)
 
     @property
     def continue_flag(self) -> bool:
         return self.__cont
 
+    @property
+    def interval(self) -> float:
+        return self.__interval
+
+    @interval.setter
+    def interval(self, value: float):
+        # Takes effect after the ongoing sleep.
+        self.__interval = value
+
 
 class Manager(ABC):
 
@@ -220,7 +229,20 @@ class Manager(ABC):
         if reverse:
             wrapper.implement_manager(manager, reverse=reverse)
 
-        self.__wrappers[wrapper.name] = wrapper
+        # Copy on write: wrappers can be added while other threads iterate the current dict.
+        self.__wrappers = {**self.__wrappers, wrapper.name: wrapper}
+
+    def remove_wrapper(self, name: str) -> AsyncWrapper:
+        """
+        Removes a wrapper from the Manager (it is not stopped) and returns it.
+        """
+        wrappers = dict(self.__wrappers)
+        try:
+            wrapper = wrappers.pop(name)
+        except KeyError:
+            raise WrapperNameError(WrapperNameError.does_not_exist)
+        self.__wrappers = wrappers
+        return wrapper
 
     def start_all(self, *args, **kwargs):
         # Only use if strictly explicit
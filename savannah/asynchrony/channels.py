@@ -0,0 +1,257 @@
+#
+# channels functionality
+#
+# A broadcast channel lets one or more producers hand the same data to many
+# processes. The payload is pickled once and written once into a ring of
+# shared-memory slots; every subscriber keeps its own read cursor.
+# Slow subscribers are handled with one of two policies:
+#   - 'drop': the producer overwrites the oldest slots; subscribers skip ahead
+#     and count how many messages they have lost.
+#   - 'block': the producer waits until every subscriber has read the slot
+#     that is about to be overwritten.
+#
+# Shared memory layout (all integers are unsigned 64 bits):
+#
+#   [write_seq][cursor_0 ... cursor_n-1][slot_0 ... slot_m-1]
+#   slot: [seq][length][payload (slot_size bytes)]
+#
+# write_seq is the number of messages published. Message k is stored in slot
+# k % m with seq = k + 1 (0 means the slot is empty or being written).
+# Readers validate seq before and after copying the payload, so a slot that is
+# overwritten while being read is detected and the read is retried.
+#
+
+import pickle
+import struct
+import time
+import queue
+from typing import Dict
+import multiprocessing as mp
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # Python < 3.8
+    shared_memory = None
+
+
+__all__ = [
+    "BroadcastChannel", "Subscription", "ChannelPolicy"
+]
+
+
+_U64 = struct.Struct('Q')
+_SLOT_HEADER = struct.Struct('QQ')
+_INACTIVE = 2 ** 64 - 1
+
+
+class ChannelPolicy:
+    DROP = 'drop'
+    BLOCK = 'block'
+
+    ALL = (DROP, BLOCK)
+
+
+class BroadcastChannel:
+    """
+    Shared-memory ring buffer with a read cursor per subscriber.
+    Subscribers must be registered (.subscribe) before the processes that use
+    the channel are started, since processes receive a copy of the channel.
+    """
+
+    def __init__(self, topic: str, slots: int = 64, slot_size: int = 4096,
+                 policy: str = ChannelPolicy.DROP, max_subscribers: int = 16) -> None:
+
+        if shared_memory is None:
+            raise RuntimeError("Broadcast channels require multiprocessing.shared_memory (Python 3.8+).")
+        if policy not in ChannelPolicy.ALL:
+            raise ValueError("Channel policy must be one of {}.".format(ChannelPolicy.ALL))
+
+        self.topic = topic
+        self.slots = slots
+        self.slot_size = slot_size
+        self.policy = policy
+        self.max_subscribers = max_subscribers
+
+        self.__cursors_offset = _U64.size
+        self.__slots_offset = self.__cursors_offset + _U64.size * max_subscribers
+        self.__slot_stride = _SLOT_HEADER.size + slot_size
+
+        self.__shm = shared_memory.SharedMemory(create=True,
+                                                size=self.__slots_offset + self.__slot_stride * slots)
+        for index in range(max_subscribers):
+            self._set_cursor(index, _INACTIVE)
+
+        self.__subscribers: Dict[str, int] = dict()
+        self.__write_lock = mp.Lock()
+        self.__condition = mp.Condition()
+
+    #
+    # Raw memory access
+
+    @property
+    def _buf(self) -> memoryview:
+        return self.__shm.buf
+
+    @property
+    def write_seq(self) -> int:
+        return _U64.unpack_from(self._buf, 0)[0]
+
+    def _cursor(self, index: int) -> int:
+        return _U64.unpack_from(self._buf, self.__cursors_offset + _U64.size * index)[0]
+
+    def _set_cursor(self, index: int, value: int) -> None:
+        _U64.pack_into(self._buf, self.__cursors_offset + _U64.size * index, value)
+
+    def __slot_offset(self, seq: int) -> int:
+        return self.__slots_offset + self.__slot_stride * (seq % self.slots)
+
+    #
+    # Subscribers
+
+    def subscribe(self, name: str) -> 'Subscription':
+        """
+        Registers a subscriber. Its cursor starts at the current write position,
+        so it only receives messages published after subscribing.
+        """
+        if name in self.__subscribers:
+            raise KeyError("'{0}' is already subscribed to channel '{1}'.".format(name, self.topic))
+        if len(self.__subscribers) >= self.max_subscribers:
+            raise OverflowError("Channel '{}' cannot admit more subscribers.".format(self.topic))
+
+        index = len(self.__subscribers)
+        self.__subscribers[name] = index
+        self._set_cursor(index, self.write_seq)
+        return Subscription(self, index)
+
+    def subscription(self, name: str) -> 'Subscription':
+        """
+        Returns the handle of an already registered subscriber. Meant to be called inside the process.
+        """
+        try:
+            return Subscription(self, self.__subscribers[name])
+        except KeyError:
+            raise KeyError("'{0}' is not subscribed to channel '{1}'.".format(name, self.topic))
+
+    @property
+    def subscribers(self) -> Dict[str, int]:
+        return self.__subscribers
+
+    def __min_cursor(self) -> int:
+        cursors = [self._cursor(index) for index in self.__subscribers.values()]
+        cursors = [c for c in cursors if c != _INACTIVE]
+        return min(cursors) if cursors else self.write_seq
+
+    #
+    # Communication
+
+    def publish(self, obj, block: bool = True, timeout: float = None) -> int:
+        """
+        Serializes `obj` once and writes it into the next slot.
+        Returns the sequence number of the message.
+        With a 'block' policy, raises queue.Full if the slowest subscriber
+        does not free the slot in time (or immediately if block is False).
+        """
+        payload = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(payload) > self.slot_size:
+            raise ValueError("Message of {0} bytes does not fit in a {1} bytes slot."
+                             .format(len(payload), self.slot_size))
+
+        with self.__write_lock:
+            seq = self.write_seq
+
+            if self.policy == ChannelPolicy.BLOCK:
+                deadline = None if timeout is None else time.monotonic() + timeout
+                delay = 0.0001
+                while seq - self.__min_cursor() >= self.slots:
+                    if not block or (deadline is not None and time.monotonic() >= deadline):
+                        raise queue.Full
+                    time.sleep(delay)
+                    delay = min(delay * 2, 0.01)
+
+            offset = self.__slot_offset(seq)
+            buf = self._buf
+            # Invalidate the slot before writing so readers cannot take a half-written message.
+            _SLOT_HEADER.pack_into(buf, offset, 0, len(payload))
+            buf[offset + _SLOT_HEADER.size:offset + _SLOT_HEADER.size + len(payload)] = payload
+            _SLOT_HEADER.pack_into(buf, offset, seq + 1, len(payload))
+            _U64.pack_into(buf, 0, seq + 1)
+
+        with self.__condition:
+            self.__condition.notify_all()
+        return seq
+
+    def _read(self, seq: int):
+        """
+        Returns the payload of message `seq`, or None if it has been overwritten.
+        """
+        offset = self.__slot_offset(seq)
+        buf = self._buf
+        slot_seq, length = _SLOT_HEADER.unpack_from(buf, offset)
+        if slot_seq != seq + 1:
+            return None
+        payload = bytes(buf[offset + _SLOT_HEADER.size:offset + _SLOT_HEADER.size + length])
+        if _U64.unpack_from(buf, offset)[0] != slot_seq:
+            return None
+        return payload
+
+    def _wait(self, seq: int, timeout: float = None) -> bool:
+        with self.__condition:
+            return self.__condition.wait_for(lambda: self.write_seq > seq, timeout)
+
+    def close(self) -> None:
+        self.__shm.close()
+
+    def unlink(self) -> None:
+        """Releases the shared memory. Must be called once, by the creator, after all processes finish."""
+        self.__shm.close()
+        self.__shm.unlink()
+
+
+class Subscription:
+    """
+    Read handle of a subscriber. It is cheap to create and can be built inside
+    the subscriber process from the channel and the subscriber name.
+    """
+
+    def __init__(self, channel: BroadcastChannel, index: int) -> None:
+        self.channel = channel
+        self.index = index
+        self.dropped = 0
+
+    def receive(self, block: bool = True, timeout: float = None):
+        """
+        Returns the next message. Raises queue.Empty if there is none
+        (immediately if block is False, or after the timeout).
+        """
+        channel = self.channel
+        while True:
+            cursor = channel._cursor(self.index)
+            seq = channel.write_seq
+
+            if cursor >= seq:
+                if not block or not channel._wait(cursor, timeout):
+                    raise queue.Empty
+                continue
+
+            if seq - cursor > channel.slots:
+                # The producer has lapped this subscriber (drop policy).
+                self.dropped += seq - channel.slots - cursor
+                cursor = seq - channel.slots
+
+            payload = channel._read(cursor)
+            if payload is None:
+                # Overwritten while reading; the next iteration skips ahead.
+                self.dropped += 1
+                channel._set_cursor(self.index, cursor + 1)
+                continue
+
+            channel._set_cursor(self.index, cursor + 1)
+            return pickle.loads(payload)
+
+    @property
+    def pending(self) -> int:
+        return max(self.channel.write_seq - self.channel._cursor(self.index), 0)
+
+    def close(self) -> None:
+        """Detaches the subscriber so that blocking producers stop waiting for it."""
+        self.channel._set_cursor(self.index, _INACTIVE)
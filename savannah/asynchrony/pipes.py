@@ -8,17 +8,23 @@
 #
 
 
-from typing import Tuple
+from typing import Tuple, Dict, List
+from collections import deque
 import multiprocessing as mp
 import multiprocessing.connection
-import networkx as nx
 
+from savannah.core import metrics
 
 __all__ = [
-    "UniquePipeError", "PipeNameError", "PipeNetwork", "PipeWrapper"
+    "UniquePipeError", "PipeNameError", "PipeNetwork", "PipeWrapper", "PipeMap", "RoutedMessage"
 ]
 
 
+# Pipes are used by the unit processes: these count in the registry of each process.
+_SENT = metrics.counter('pipe_messages_sent_total', 'Messages sent through pipes.')
+_RECEIVED = metrics.counter('pipe_messages_received_total', 'Messages received through pipes.')
+
+
 #
 # Exceptions
 #
@@ -60,27 +66,48 @@ class PipeNetwork:
 
     # TODO: end pipes, remove connections
 
+    #
+    # Why there is no graph library here
+    #
+    # The network used to be a networkx.DiGraph that was queried on every
+    # Process.start. Importing networkx is slow on embedded boxes and
+    # none of its algorithms are needed at runtime: the network is built once
+    # and read many times. Edges are kept in plain dicts and, once the network
+    # is read, compiled into per-node adjacency and routing tables. The tables
+    # are only recompiled if the network changes afterwards.
+    # networkx is still available (optionally) for analysis through .as_graph.
+    #
+
     def __init__(self, is_unique: bool = True) -> None:
         """
-        Initializes PipeNetwork creating a graph
+        Initializes PipeNetwork creating an empty adjacency map
         """
 
-        self.G = nx.DiGraph()
+        # node -> {neighbour: {'pipe': PipeWrapper, 'duplex': bool}}
+        self.__edges: Dict[str, Dict[str, dict]] = dict()
         self.__is_unique: bool = is_unique
 
+        # Compiled tables. None means that they have to be (re)compiled.
+        self.__adjacency: Dict[str, 'PipeMap'] = None
+
         # TODO: implement if necessary multiple pipes for same edges
         if not is_unique:
             raise NotImplementedError
 
+    def add_node(self, name) -> None:
+        if name not in self.__edges:
+            self.__edges[name] = dict()
+            self.__adjacency = None
+
     def populate_network(self, nodes) -> None:
         """
         Populates the network of the included nodes and of the 'MANAGER' node.
         Node addition does not raise any error if already exists.
         """
         for name in nodes:
-            self.G.add_node(name)
+            self.add_node(name)
 
-        self.G.add_node('MANAGER')
+        self.add_node('MANAGER')
 
     @staticmethod
     def _create_pipe(duplex=True):
@@ -105,38 +132,185 @@ class PipeNetwork:
 
         # This is not necessary unless something happens while we add one edge and the other.
         if (
-                self.G.has_edge(*endpoints) or self.G.has_edge(*endpoints[::-1])
+                self.has_pipe(endpoints) or self.has_pipe(endpoints[::-1])
         ) and self.is_unique:
             raise UniquePipeError
 
         conns = self._create_pipe(duplex=duplex)
-        for _conns, _endpoints in \
+        for _conns, (origin, destiny) in \
                 zip((conns, conns[::-1]), (endpoints, endpoints[::-1])):
 
-            self.G.add_edge(*_endpoints, **{'pipe': PipeWrapper(_conns), 'duplex': duplex})
+            self.add_node(origin)
+            self.add_node(destiny)
+            self.__edges[origin][destiny] = {'pipe': PipeWrapper(_conns), 'duplex': duplex}
+
+        self.__adjacency = None
 
     @property
     def is_unique(self):
         return self.__is_unique
 
+    @property
+    def nodes(self) -> List[str]:
+        return list(self.__edges)
+
     def has_pipe(self, edge: Tuple[str]):
-        return self.G.has_edge(*edge)
+        return edge[1] in self.__edges.get(edge[0], ())
+
+    def compile(self) -> Dict[str, 'PipeMap']:
+        """
+        Freezes the current network into one PipeMap per node,
+        holding its direct pipes and its routing table.
+        """
+        routes = self.__compile_routes()
+        self.__adjacency = {node: PipeMap(node, edges, routes[node])
+                            for node, edges in self.__edges.items()}
+        return self.__adjacency
+
+    def __compile_routes(self) -> Dict[str, Dict[str, str]]:
+        """
+        Breadth-first search from every node over the writable edges.
+        Returns {origin: {destiny: next_hop}} following shortest paths.
+        """
+        routes = dict()
+        for origin in self.__edges:
+            table = dict()
+            visited = {origin}
+            pending = deque()
+            for neighbour, data in self.__edges[origin].items():
+                if data['pipe'].writable and neighbour not in visited:
+                    visited.add(neighbour)
+                    table[neighbour] = neighbour
+                    pending.append(neighbour)
+
+            while pending:
+                node = pending.popleft()
+                for neighbour, data in self.__edges[node].items():
+                    if data['pipe'].writable and neighbour not in visited:
+                        visited.add(neighbour)
+                        # The next hop is inherited from the node we came from
+                        table[neighbour] = table[node]
+                        pending.append(neighbour)
+
+            routes[origin] = table
+        return routes
+
+    @property
+    def adjacency(self) -> Dict[str, 'PipeMap']:
+        return self.__adjacency if self.__adjacency is not None else self.compile()
+
+    def get_pipes(self, node) -> 'PipeMap':
+        # Dict indices categorise by destiny (the origin is the node itself)
+        try:
+            return self.adjacency[node]
+        except KeyError:
+            # Nodes without pipes are given an empty map, as the graph query did.
+            return PipeMap(node, dict(), dict())
 
-    def get_pipes(self, node):
-        # edge[1] because edge[0] is the origin (node) and edge[1] is the destiny
-        # and we want dict indices to categorise by destiny
-        return {edge[1]: self.G.get_edge_data(*edge) for edge in self.G.out_edges(node) if edge}
+    def get_routes(self, node) -> Dict[str, str]:
+        return self.get_pipes(node).routes
+
+    def route(self, origin, destiny) -> List[str]:
+        """
+        Returns the shortest path of nodes from origin to destiny (both included).
+        """
+        path = [origin]
+        while path[-1] != destiny:
+            path.append(self.get_pipes(path[-1]).next_hop(destiny))
+        return path
 
     def is_duplex(self, edge: Tuple[str]):
         try:
-            return self.G.get_edge_data(*edge).get('duplex', False)
-        except TypeError:
+            return self.__edges[edge[0]][edge[1]].get('duplex', False)
+        except KeyError:
             raise PipeNameError
 
     @property
     def manager_pipes(self):
         return self.get_pipes('MANAGER')
 
+    def as_graph(self):
+        """
+        Returns the network as a networkx.DiGraph for analysis purposes.
+        networkx is an optional dependency and is only imported here.
+        """
+        try:
+            import networkx as nx
+        except ImportError as exc:
+            raise ImportError("networkx is required for PipeNetwork graph analysis. "
+                              "Install it with `pip install networkx`.") from exc
+
+        G = nx.DiGraph()
+        G.add_nodes_from(self.__edges)
+        for origin, edges in self.__edges.items():
+            for destiny, data in edges.items():
+                G.add_edge(origin, destiny, **data)
+        return G
+
+    @property
+    def G(self):
+        # Kept for backwards compatibility. Changes made to the graph have no effect on the network.
+        return self.as_graph()
+
+
+class RoutedMessage:
+    """
+    Envelope for messages that travel through more than one pipe.
+    """
+    __slots__ = ('origin', 'destiny', 'content')
+
+    def __init__(self, origin: str, destiny: str, content):
+        self.origin = origin
+        self.destiny = destiny
+        self.content = content
+
+    def __getstate__(self):
+        return self.origin, self.destiny, self.content
+
+    def __setstate__(self, state):
+        self.origin, self.destiny, self.content = state
+
+
+class PipeMap(dict):
+    """
+    Compiled view of the network from a node's standpoint.
+    As a dict, it maps each neighbour to its edge data ({'pipe': PipeWrapper, 'duplex': bool}),
+    and it is what processes receive as `pipe_map`. It also carries the routing table
+    to reach nodes that have no direct pipe with this one.
+    """
+
+    def __init__(self, node: str, edges: Dict[str, dict], routes: Dict[str, str]):
+        super().__init__(edges)
+        self.node = node
+        self.routes = routes
+
+    def next_hop(self, destiny) -> str:
+        try:
+            return self.routes[destiny]
+        except KeyError:
+            raise PipeNameError("There is no route from {0} to {1}.".format(self.node, destiny))
+
+    def send(self, destiny, msg):
+        """
+        Sends a message to any reachable node.
+        Messages to non-adjacent nodes are wrapped and forwarded by the nodes in between.
+        """
+        hop = self.next_hop(destiny)
+        self[hop]['pipe'].send(msg if hop == destiny else RoutedMessage(self.node, destiny, msg))
+
+    def receive(self, neighbour):
+        """
+        Receives a message from an adjacent node.
+        Routed messages addressed to other nodes are forwarded and None is returned.
+        """
+        msg = self[neighbour]['pipe'].receive()
+        if isinstance(msg, RoutedMessage):
+            if msg.destiny != self.node:
+                self[self.next_hop(msg.destiny)]['pipe'].send(msg)
+                return None
+            return msg.content
+        return msg
+
 
 CLOSING_FLAG = 'CLOSE_CONN_'
 class CloseCall(Exception): pass  # This is not really an error
@@ -162,6 +336,7 @@ class PipeWrapper:
 
         if msg != CLOSING_FLAG:
             self.__conns[0].send(obj=msg)
+            _SENT.inc()
         else:
             raise ContentError(cfw)
 
@@ -173,6 +348,7 @@ class PipeWrapper:
         if msg == CLOSING_FLAG:
             raise CloseCall
         else:
+            _RECEIVED.inc()
             return msg
 
     @property
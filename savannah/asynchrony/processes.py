@@ -1,12 +1,19 @@
 import multiprocessing as mp
 from multiprocessing import managers as _iomanagers
 from abc import abstractmethod
+from typing import Dict, Union, Iterable
+import functools
+import importlib
+import inspect
 # from multiprocessing import managers as _iomanagers
 # import multiprocessing.connection
 # import multiprocessing.connection
 
+from savannah.core.logging import logger, queue_connection
 from .base import *
 from .pipes import *
+from .channels import *
+from .state import *
 
 
 __all__ = [
@@ -47,13 +54,28 @@ class Process(AsyncWrapper):
         if self.manager:
             # The namespace is where all proxy references to mp.managers.SyncManager objects are stored
             if self.manager.ioserver_enabled: kwargs['namespace'] = self.manager.namespace
+            # The shared state is the shared-memory alternative to the namespace for hot loops.
+            # As channels, it is only passed to the tasks that accept it.
+            if self.manager.shared_state is not None and _accepts(self.task, 'state'):
+                kwargs['state'] = self.manager.shared_state
             # Pipes are connective pathways created independently of the manager
             # and let read and dump raw bytes on either end.
             kwargs['pipe_map'] = self.manager.pipe_network.get_pipes(self.name)
-
-        self.__process = mp.Process(target=self.fetch_target(),
-                                    kwargs=kwargs,
-                                    name=self.name)
+            # Broadcast channels are only passed to the tasks that accept them,
+            # so that creating a channel does not break the tasks that do not use them.
+            if self.manager.channels and _accepts(self.task, 'channels'): kwargs['channels'] = self.manager.channels
+
+        # The manager's context determines the start method (fork, spawn or forkserver).
+        context = self.manager.context if self.manager else mp
+        target = self.fetch_target()
+        # With queued logging, the process sends its records to the writer of this process
+        log_queue = queue_connection()
+        if log_queue:
+            from savannah.core.logging.logging import queued_target
+            target = functools.partial(queued_target, target, log_queue)
+        self.__process = context.Process(target=target,
+                                         kwargs=kwargs,
+                                         name=self.name)
 
         self.__process.daemon = self.is_daemon  # Daemonize thread
         try:
@@ -67,11 +89,19 @@ class Process(AsyncWrapper):
         self.process.join(timeout)
         if self.process.exitcode is None:
             return False
-        elif self.process.exitcode is 0:
+        elif self.process.exitcode == 0:
             return True
         else:
             return self.process.exitcode
 
+    def terminate(self) -> None:
+        """Sends SIGTERM to the process."""
+        if self.process: self.process.terminate()
+
+    def kill(self) -> None:
+        """Sends SIGKILL to the process. Use only if it does not respond to .terminate."""
+        if self.process: self.process.kill()
+
     @property
     def is_running(self) -> bool:
         return self.process.is_alive() if self.process else False
@@ -134,6 +164,17 @@ class Process(AsyncWrapper):
     """
 
 
+def _accepts(task, name: str) -> bool:
+    """
+    Whether `task` takes the keyword argument `name` (or **kwargs).
+    """
+    try:
+        parameters = inspect.signature(task).parameters.values()
+    except (TypeError, ValueError):
+        return True
+    return any(parameter.name == name or parameter.kind == parameter.VAR_KEYWORD for parameter in parameters)
+
+
 """
 ProcessManager
 """
@@ -147,14 +188,22 @@ class ProcessManager(Manager):
 
     def __init__(self,
                  enable_ioserver: bool = True,
+                 start_method: str = None,
+                 preload: Iterable[str] = None,
                  ) -> None:
 
         super().__init__()
 
+        # Start method. None stands for the platform default.
+        self.__context = mp.get_context(start_method)
+        if preload: self.preload(preload)
+
         # Features
         self._iomanager: _IOManager = None
         self.__namespace: _iomanagers.Namespace = None
         self.__pipe_network = PipeNetwork()
+        self.__channels: Dict[str, BroadcastChannel] = dict()
+        self.__shared_state: SharedState = None
 
         # Flags
         self.__ioserver_enabled = False
@@ -162,6 +211,42 @@ class ProcessManager(Manager):
         # Features init
         if enable_ioserver: self.enable_ioserver()
 
+    """
+    Start method
+    """
+
+    @property
+    def context(self):
+        """
+        multiprocessing context used to create the processes of this manager.
+        """
+        return self.__context
+
+    @property
+    def start_method(self) -> str:
+        return self.__context.get_start_method()
+
+    def preload(self, modules: Iterable[str]) -> 'ProcessManager':
+        """
+        Imports `modules` once so that processes do not have to import them on start.
+          - forkserver: modules are imported by the server, which is started right away;
+            every process is forked from it with the modules already loaded.
+          - fork: modules are imported in this process and inherited by the children.
+          - spawn: there is no parent to inherit from, so preloading has no effect.
+        """
+        modules = list(modules)
+        method = self.start_method
+        if method == 'forkserver':
+            self.__context.set_forkserver_preload(modules)
+            from multiprocessing import forkserver
+            forkserver.ensure_running()
+        elif method == 'fork':
+            for module in modules:
+                importlib.import_module(module)
+        else:
+            logger.warning("Modules cannot be preloaded with the '{}' start method.".format(method))
+        return self
+
     # Replacement to get dynamic suggestions
     def find_by_name(self, name: str) -> Process: return super().find_by_name(name=name)
 
@@ -179,7 +264,7 @@ class ProcessManager(Manager):
     # Enabler methods are thought to be chained. Hence them returning self.
 
     def enable_ioserver(self) -> 'ProcessManager':
-        self._iomanager = _IOManager()
+        self._iomanager = _IOManager(ctx=self.__context)
         self._iomanager.start()
         self.__namespace = self._iomanager.Namespace()
         self.__ioserver_enabled = True
@@ -207,6 +292,28 @@ class ProcessManager(Manager):
     @property
     def ioserver_enabled(self): return self.__ioserver_enabled
 
+    def enable_shared_state(self, schema: Dict[str, Union[type, str]], **initial) -> 'ProcessManager':
+        """
+        Creates a SharedState with the given schema and initial values.
+        Processes receive it as the `state` kwarg. Reading its attributes costs a
+        memory access instead of an IPC round-trip, so it should be preferred over
+        the namespace for flags and counters checked in loops.
+        """
+        if self.__shared_state is not None:
+            raise RuntimeError("Shared state is already enabled. Its schema cannot be changed.")
+        self.__shared_state = SharedState(schema, **initial)
+        return self
+
+    @property
+    def shared_state(self) -> SharedState:
+        return self.__shared_state
+
+    def close_shared_state(self) -> None:
+        """Releases the shared memory of the state. Call it once processes have finished."""
+        if self.__shared_state is not None:
+            self.__shared_state.unlink()
+            self.__shared_state = None
+
     """
     Pipes
     """
@@ -215,6 +322,37 @@ class ProcessManager(Manager):
     def pipe_network(self) -> PipeNetwork:
         return self.__pipe_network
 
+    """
+    Broadcast channels
+    """
+
+    def create_channel(self, topic: str, **kwargs) -> BroadcastChannel:
+        """
+        Creates a pub/sub channel. See BroadcastChannel for the available options.
+        Channels (and their subscribers) must be set up before starting the processes.
+        """
+        if topic in self.__channels:
+            raise KeyError("Channel '{}' already exists.".format(topic))
+        self.__channels[topic] = BroadcastChannel(topic, **kwargs)
+        return self.__channels[topic]
+
+    def subscribe(self, topic: str, name: str) -> Subscription:
+        """
+        Subscribes the process called `name` to a channel.
+        Inside the process, the handle is retrieved with `channels[topic].subscription(name)`.
+        """
+        return self.__channels[topic].subscribe(name)
+
+    @property
+    def channels(self) -> Dict[str, BroadcastChannel]:
+        return self.__channels
+
+    def close_channels(self) -> None:
+        """Releases the shared memory of all channels. Call it once processes have finished."""
+        for channel in self.__channels.values():
+            channel.unlink()
+        self.__channels.clear()
+
 """
 Utils
 """
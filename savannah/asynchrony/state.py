@@ -0,0 +1,169 @@
+#
+# shared state functionality
+#
+# SharedState is a fixed-schema set of flags, counters and small records
+# stored in shared memory. Unlike the SyncManager Namespace proxy, reading an
+# attribute does not involve a round-trip to the manager process: it is a
+# struct unpack from memory that every process has mapped.
+#
+# Each field is protected by a sequence lock:
+#
+#   [seq (uint64)][value]
+#
+# Writers (serialized among themselves by a lock) make seq odd while writing
+# and even again when done. Readers take no lock: they read seq, the value and
+# seq again, and retry if seq was odd or has changed.
+#
+
+import struct
+import time
+from typing import Dict, Union
+import multiprocessing as mp
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # Python < 3.8
+    shared_memory = None
+
+
+__all__ = [
+    "SharedState"
+]
+
+
+_U64 = struct.Struct('Q')
+
+# Python types accepted in a schema and their struct format.
+_FORMATS = {
+    bool: '?',
+    int: 'q',
+    float: 'd',
+}
+
+
+class _Field:
+    """
+    Data descriptor for a schema field. Fields are resolved as class attributes,
+    which is much faster than falling back to __getattr__ on every read.
+    """
+    __slots__ = ('name', 'offset', 'fmt', 'is_record')
+
+    def __init__(self, name: str, offset: int, fmt: struct.Struct, is_record: bool) -> None:
+        self.name = name
+        self.offset = offset
+        self.fmt = fmt
+        self.is_record = is_record
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        buf = instance._buf
+        offset = self.offset
+        while True:
+            seq = _U64.unpack_from(buf, offset)[0]
+            if seq & 1:
+                # A writer is in the middle of an update.
+                time.sleep(0)
+                continue
+            value = self.fmt.unpack_from(buf, offset + 8)
+            if _U64.unpack_from(buf, offset)[0] == seq:
+                return value if self.is_record else value[0]
+
+    def __set__(self, instance, value):
+        buf = instance._buf
+        offset = self.offset
+        with instance._lock:
+            seq = _U64.unpack_from(buf, offset)[0]
+            _U64.pack_into(buf, offset, seq + 1)
+            if self.is_record:
+                self.fmt.pack_into(buf, offset + 8, *value)
+            else:
+                self.fmt.pack_into(buf, offset + 8, value)
+            _U64.pack_into(buf, offset, seq + 2)
+
+
+class SharedState:
+    """
+    **Usage:**
+
+    >>> state = SharedState({'cont': bool, 'samples': int, 'position': '3d'}, cont=True)
+    >>> state.cont  # --> True
+    >>> state.position = (1., 2., 3.)
+    >>> state.increment('samples')
+
+    Field types are bool, int (64 bits), float (double) or any struct format
+    string. Formats with more than one item are read and written as tuples.
+    """
+
+    def __init__(self, schema: Dict[str, Union[type, str]], _shm=None, _lock=None, **initial) -> None:
+        if shared_memory is None:
+            raise RuntimeError("SharedState requires multiprocessing.shared_memory (Python 3.8+).")
+
+        fields = dict()
+        offset = 0
+        for name, field_type in schema.items():
+            if name.startswith('_'):
+                raise AttributeError("Field names cannot start with '_': {}".format(name))
+            try:
+                fmt = struct.Struct(_FORMATS[field_type] if isinstance(field_type, type) else field_type)
+            except (KeyError, struct.error) as exc:
+                raise TypeError("Unsupported type for field '{0}': {1}".format(name, field_type)) from exc
+            fields[name] = _Field(name, offset, fmt, len(fmt.unpack_from(bytes(fmt.size))) > 1)
+            # Sequence counters are kept 8-byte aligned.
+            offset += _U64.size + -(-fmt.size // 8) * 8
+
+        # Each instance gets its own subclass holding the field descriptors.
+        object.__setattr__(self, '__class__', type(self.__class__.__name__, (self.__class__,), fields))
+        object.__setattr__(self, '_schema', dict(schema))
+        object.__setattr__(self, '_fields', fields)
+        object.__setattr__(self, '_shm', _shm or shared_memory.SharedMemory(create=True, size=max(offset, 8)))
+        object.__setattr__(self, '_buf', self._shm.buf)
+        object.__setattr__(self, '_lock', _lock or mp.Lock())
+
+        for name, value in initial.items():
+            setattr(self, name, value)
+
+    def __reduce__(self):
+        # The per-instance subclass cannot be pickled by reference,
+        # so the state is rebuilt in the other process attaching to the same memory.
+        return _attach, (self._schema, self._shm, self._lock)
+
+    def increment(self, name: str, amount=1):
+        """
+        Atomically adds `amount` to a numeric field and returns the new value.
+        """
+        field = self._fields[name]
+        buf = self._buf
+        with self._lock:
+            seq = _U64.unpack_from(buf, field.offset)[0]
+            value = field.fmt.unpack_from(buf, field.offset + 8)[0] + amount
+            _U64.pack_into(buf, field.offset, seq + 1)
+            field.fmt.pack_into(buf, field.offset + 8, value)
+            _U64.pack_into(buf, field.offset, seq + 2)
+        return value
+
+    def __setattr__(self, key, value):
+        if key not in self._fields:
+            raise AttributeError("SharedState has no field '{}'. The schema is fixed.".format(key))
+        # Delegates to the field descriptor.
+        object.__setattr__(self, key, value)
+
+    @property
+    def fields(self) -> tuple:
+        return tuple(self._fields)
+
+    def as_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self._fields}
+
+    def close(self) -> None:
+        object.__setattr__(self, '_buf', None)
+        self._shm.close()
+
+    def unlink(self) -> None:
+        """Releases the shared memory. Must be called once, by the creator, after all processes finish."""
+        self.close()
+        self._shm.unlink()
+
+
+def _attach(schema, shm, lock) -> SharedState:
+    return SharedState(schema, _shm=shm, _lock=lock)
@@ -0,0 +1,271 @@
+#
+# Process supervision
+#
+# The Supervisor is a ProcessManager that starts its processes itself and
+# watches them from a background thread:
+#   - Processes that exit are restarted according to their restart type and
+#     the supervisor's RestartPolicy (strategy, exponential backoff and a
+#     maximum number of restarts per time window).
+#   - Processes supervised with a heartbeat timeout receive a `heartbeat`
+#     kwarg and must call `heartbeat.beat()` periodically. Heartbeats are kept
+#     in a SharedState, so beating does not involve the ioserver.
+#     A process that stops beating is considered hung and is restarted.
+#   - Shutdown goes through three tiers: a graceful stop request
+#     (`heartbeat.stopping`), SIGTERM, and SIGKILL, each with its own timeout.
+#
+
+import time
+from collections import deque
+from typing import Dict, Deque
+import multiprocessing as mp
+
+from savannah.core.logging import logger
+from . import threads
+from .processes import Process, ProcessManager
+from .state import SharedState
+
+
+__all__ = [
+    "Supervisor", "RestartPolicy", "RestartType", "Heartbeat"
+]
+
+
+class RestartType:
+    PERMANENT = 'permanent'     # Always restarted
+    TRANSIENT = 'transient'     # Restarted only if it exits abnormally (nonzero exit code)
+    TEMPORARY = 'temporary'     # Never restarted
+
+    ALL = (PERMANENT, TRANSIENT, TEMPORARY)
+
+
+class RestartPolicy:
+    ONE_FOR_ONE = 'one_for_one'     # Only the failed process is restarted
+    ONE_FOR_ALL = 'one_for_all'     # All processes are stopped and restarted
+
+    def __init__(self, strategy: str = ONE_FOR_ONE, max_restarts: int = 5, window: float = 60.,
+                 backoff: float = 0.5, backoff_factor: float = 2., max_backoff: float = 30.) -> None:
+        if strategy not in (self.ONE_FOR_ONE, self.ONE_FOR_ALL):
+            raise ValueError("Unknown restart strategy: {}".format(strategy))
+        self.strategy = strategy
+        self.max_restarts = max_restarts
+        self.window = window
+        self.backoff = backoff
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+
+    def delay(self, attempt: int) -> float:
+        """Seconds to wait before the `attempt`-th restart within the window (0-indexed)."""
+        return min(self.backoff * self.backoff_factor ** attempt, self.max_backoff)
+
+
+class Heartbeat:
+    """
+    Handle given to supervised processes. Call .beat() periodically
+    and check .stopping to finish cleanly on a graceful shutdown.
+    """
+
+    def __init__(self, name: str, state: SharedState, stop_event) -> None:
+        self.name = name
+        self.__state = state
+        self.__stop_event = stop_event
+
+    def beat(self) -> None:
+        setattr(self.__state, self.name, time.monotonic())
+
+    @property
+    def last(self) -> float:
+        return getattr(self.__state, self.name)
+
+    @property
+    def stopping(self) -> bool:
+        return self.__stop_event.is_set()
+
+
+class _Child:
+    def __init__(self, process: Process, restart: str, heartbeat_timeout: float, kwargs: dict) -> None:
+        self.process = process
+        self.restart = restart
+        self.heartbeat_timeout = heartbeat_timeout
+        self.kwargs = kwargs
+        self.restarts: Deque[float] = deque()
+        self.next_start: float = None
+        self.failed = False
+        self.done = False
+
+
+class Supervisor(ProcessManager):
+
+    def __init__(self, policy: RestartPolicy = None, interval: float = 0.2, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.policy = policy or RestartPolicy()
+        self.interval = interval
+        self.__children: Dict[str, _Child] = dict()
+        self.__heartbeats: SharedState = None
+        self.__stop_event = mp.Event()
+        self.__loop: _SupervisorLoop = None
+        self.__shutting_down = False
+
+    def supervise(self, process: Process, restart: str = RestartType.PERMANENT,
+                  heartbeat_timeout: float = None, **kwargs) -> 'Supervisor':
+        """
+        Puts a process under supervision. kwargs are passed to every Process.start.
+        """
+        if restart not in RestartType.ALL:
+            raise ValueError("Unknown restart type: {}".format(restart))
+        if self.__heartbeats is not None:
+            raise RuntimeError("Processes must be supervised before the supervisor is started.")
+        if process.manager is not self:
+            process.implement_manager(self)
+        self.__children[process.name] = _Child(process, restart, heartbeat_timeout, kwargs)
+        return self
+
+    @property
+    def children(self) -> Dict[str, _Child]:
+        return self.__children
+
+    @property
+    def failed(self) -> list:
+        return [name for name, child in self.__children.items() if child.failed]
+
+    #
+    # Lifecycle
+
+    def start(self) -> 'Supervisor':
+        self.__heartbeats = SharedState({name: float for name, child in self.__children.items()
+                                         if child.heartbeat_timeout is not None})
+        for child in self.__children.values():
+            self.__start_child(child)
+
+        self.__loop = _SupervisorLoop(self)
+        self.__loop.start()
+        return self
+
+    def __start_child(self, child: _Child) -> None:
+        kwargs = dict(child.kwargs)
+        if child.heartbeat_timeout is not None:
+            heartbeat = Heartbeat(child.process.name, self.__heartbeats, self.__stop_event)
+            # The grace period starts counting from the process start.
+            heartbeat.beat()
+            kwargs['heartbeat'] = heartbeat
+        child.next_start = None
+        child.process.start(**kwargs)
+
+    def check(self) -> None:
+        """
+        Performs one supervision round. It is called periodically by the background loop.
+        """
+        if self.__shutting_down:
+            return
+
+        now = time.monotonic()
+        for child in self.__children.values():
+            if child.failed or child.done:
+                continue
+
+            if child.next_start is not None:
+                if now >= child.next_start:
+                    logger.info("[Supervisor]: restarting {}".format(child.process.name))
+                    self.__start_child(child)
+                continue
+
+            process = child.process
+            if process.is_running:
+                if child.heartbeat_timeout is not None and \
+                        now - getattr(self.__heartbeats, process.name) > child.heartbeat_timeout:
+                    logger.warning("[Supervisor]: {} missed its heartbeat. Terminating it."
+                                   .format(process.name))
+                    self._stop_process(process, terminate_timeout=1.)
+                    self.__handle_exit(child, now, hung=True)
+                continue
+
+            if process.process is not None:
+                self.__handle_exit(child, now)
+
+    def __handle_exit(self, child: _Child, now: float, hung: bool = False) -> None:
+        exitcode = child.process.process.exitcode
+        if not hung:
+            if exitcode == 0:
+                logger.info("[Supervisor]: {} finished.".format(child.process.name))
+            else:
+                logger.error("[Supervisor]: {0} exited with code {1}.".format(child.process.name, exitcode))
+
+        if child.restart == RestartType.TEMPORARY or \
+                (child.restart == RestartType.TRANSIENT and exitcode == 0 and not hung):
+            # Not to be restarted: it is removed from the round.
+            child.failed = exitcode != 0 or hung
+            child.done = True
+            return
+
+        # Restarts older than the window are forgotten
+        while child.restarts and now - child.restarts[0] > self.policy.window:
+            child.restarts.popleft()
+
+        if len(child.restarts) >= self.policy.max_restarts:
+            logger.critical("[Supervisor]: {0} restarted {1} times in {2}s. Giving up."
+                            .format(child.process.name, len(child.restarts), self.policy.window))
+            child.failed = True
+            return
+
+        delay = self.policy.delay(len(child.restarts))
+        child.restarts.append(now)
+
+        siblings = [child]
+        if self.policy.strategy == RestartPolicy.ONE_FOR_ALL:
+            siblings = [c for c in self.__children.values() if not (c.failed or c.done)]
+            for sibling in siblings:
+                if sibling is not child:
+                    self._stop_process(sibling.process, terminate_timeout=1.)
+
+        for sibling in siblings:
+            sibling.next_start = now + delay
+
+    @staticmethod
+    def _stop_process(process: Process, graceful_timeout: float = 0., terminate_timeout: float = None) -> None:
+        """
+        Stops a process through increasingly forceful tiers:
+        waits for it to finish on its own, sends SIGTERM, and finally SIGKILL.
+        """
+        if not process.is_running:
+            return
+        if graceful_timeout and process.wait(graceful_timeout) is not False:
+            return
+        process.terminate()
+        if process.wait(terminate_timeout) is False:
+            logger.warning("[Supervisor]: {} did not terminate. Killing it.".format(process.name))
+            process.kill()
+            process.wait()
+
+    def shutdown(self, graceful: bool = True, timeout: float = 5., terminate_timeout: float = 2.) -> None:
+        """
+        Stops supervision and all processes.
+        In graceful mode, processes are asked to stop (heartbeat.stopping) and given `timeout`
+        seconds to finish before being terminated. Otherwise they are terminated right away.
+        Processes that ignore SIGTERM for `terminate_timeout` seconds are killed.
+        """
+        self.__shutting_down = True
+        if self.__loop is not None:
+            self.__loop.stop()
+
+        self.__stop_event.set()
+        deadline = time.monotonic() + (timeout if graceful else 0.)
+        for child in self.__children.values():
+            self._stop_process(child.process,
+                               graceful_timeout=max(deadline - time.monotonic(), 0.),
+                               terminate_timeout=terminate_timeout)
+
+        if self.__heartbeats is not None:
+            self.__heartbeats.unlink()
+            self.__heartbeats = None
+
+
+class _SupervisorLoop(threads.ThreadedLoop):
+    def __init__(self, supervisor: Supervisor) -> None:
+        self._supervisor = supervisor
+        super().__init__(interval=supervisor.interval, name='SupervisorLoop', is_daemon=True)
+
+    def task(self):
+        try:
+            self._supervisor.check()
+        except Exception as exc:
+            # The loop must survive any error, or nothing would be supervised anymore.
+            logger.error("[Supervisor]: supervision round failed: {}".format(exc))
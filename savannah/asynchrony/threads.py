@@ -48,7 +48,7 @@ class Thread(AsyncWrapper):
 
     @property
     def is_running(self) -> bool:
-        return self.__thread.isAlive() if self.__thread else False
+        return self.__thread.is_alive() if self.__thread else False
 
 
 class ThreadedLoop(LoopMixin, Thread):
@@ -1 +1,11 @@
-from . import run, create_settings, test
+import importlib
+
+# Command modules are imported on first access (e.g. `actions.run`),
+# so that running a command does not load the dependencies of the rest.
+__all__ = ["run", "create_settings", "test", "coldstart", "profile", "bench"]
+
+
+def __getattr__(name):
+    if name in __all__:
+        return importlib.import_module('.' + name, __name__)
+    raise AttributeError("module {0!r} has no attribute {1!r}".format(__name__, name))
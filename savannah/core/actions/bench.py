@@ -0,0 +1,334 @@
+import datetime
+import json
+import math
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from os import environ
+from os.path import join, dirname
+from typing import Dict, List
+
+from savannah.core.interpreter import AbstractBaseCommand as Command
+
+#
+# End-to-end benchmark
+#
+# A server with synthetic sensors (built-in drivers) runs in its own interpreter (a temporary project:
+# drivers.py, interpreter.py and settings.json), while CPUClients poll 'updates' from threads
+# of this process. Server figures (samples taken, sampler jitter, CPU time, resident memory)
+# are read through the 'metrics' command, so they are those of the server process.
+#
+# Results are written as JSON; with --baseline they are compared with a previous run
+# and the command fails if any figure got worse than the tolerance.
+#
+
+_DRIVERS = """
+# Sensors of the benchmark are built-in synthetic drivers (see savannah.sampling.drivers).
+"""
+
+_INTERPRETER = """
+from savannah.iounit.interpreter import CPUInterpreter
+from savannah.iounit.interpreter.blueprints import JSONUpdatesMixin
+
+
+class Interpreter(JSONUpdatesMixin, CPUInterpreter):
+    pass
+"""
+
+_SERVER = """
+import sys
+from savannah.core.app import App
+app = App()
+app.start()
+sys.stdin.read()
+app.stop(timeout=5.)
+"""
+
+# Figures compared with the baseline, and whether higher values are better.
+_COMPARED = (
+    ('sample_rate', True),
+    ('delivered_rate', True),
+    ('jitter_p99', False),
+    ('latency_p50', False),
+    ('latency_p99', False),
+    ('cpu_per_sample', False),
+    ('memory_growth_per_hour', False),
+)
+
+
+class Bench(Command):
+    verbose_name = 'bench'
+    help = "Benchmark the sampling-to-client pipeline with synthetic sensors and write the results as JSON."
+
+    def __configure__(self):
+        self.parser.add_argument('-s', '--sensors', nargs='?', type=int, default=4,
+                                 help='Number of synthetic sensors. Default is 4.')
+        self.parser.add_argument('--driver', nargs='?', default='SyntheticVector',
+                                 choices=['SyntheticScalar', 'SyntheticVector', 'SyntheticWaveform'],
+                                 help='Synthetic driver of the sensors. Default is SyntheticVector.')
+        self.parser.add_argument('--channels', nargs='?', type=int,
+                                 help='Channels of each sensor (vectors and waveforms).')
+        self.parser.add_argument('--block', nargs='?', type=int,
+                                 help='Samples per channel of each read (waveforms).')
+        self.parser.add_argument('-f', '--frequency', nargs='?', type=float, default=50.,
+                                 help='Sampling frequency of each sensor (Hz). Default is 50.')
+        self.parser.add_argument('-c', '--clients', nargs='?', type=int, default=4,
+                                 help='Number of concurrent clients polling \'updates\'. Default is 4.')
+        self.parser.add_argument('-p', '--poll', nargs='?', type=float, default=.1,
+                                 help='Seconds between the requests of each client. Default is 0.1.')
+        self.parser.add_argument('-d', '--duration', nargs='?', type=float, default=60.,
+                                 help='Seconds measured (after the warm-up). Default is 60.')
+        self.parser.add_argument('-w', '--warmup', nargs='?', type=float, default=5.,
+                                 help='Seconds run before measuring. Default is 5.')
+        self.parser.add_argument('-o', '--output', nargs='?',
+                                 help='Path of the JSON results. '
+                                      'Default is bench_<timestamp>.json in the project directory.')
+        self.parser.add_argument('-b', '--baseline', nargs='?',
+                                 help='JSON results of a previous run to compare with.')
+        self.parser.add_argument('-t', '--tolerance', nargs='?', type=float, default=.1,
+                                 help='Relative change allowed against the baseline. Default is 0.1.')
+
+    @staticmethod
+    def action(sensors: int = 4, driver: str = 'SyntheticVector', channels: int = None, block: int = None,
+               frequency: float = 50., clients: int = 4, poll: float = .1,
+               duration: float = 60., warmup: float = 5., output: str = None,
+               baseline: str = None, tolerance: float = .1):
+        output = output or join(environ.get('SAVANNAH_BASEDIR', ''),
+                                'bench_{:%Y%m%d_%H%M%S}.json'.format(datetime.datetime.now()))
+        config = dict(sensors=sensors, driver=driver, channels=channels, block=block, frequency=frequency, clients=clients, poll=poll,
+                      duration=duration, warmup=warmup)
+        results = run(**config)
+        report = {
+            'version': _version(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'config': config,
+            'results': results,
+        }
+        with open(output, 'w') as file:
+            json.dump(report, file, indent=2)
+
+        for name, value in results.items():
+            if not isinstance(value, dict): print('{:<24} {:>14.6g}'.format(name, value))
+        print("Written: {}".format(output))
+
+        if baseline:
+            with open(baseline) as file:
+                regressions = compare(json.load(file)['results'], results, tolerance)
+            if regressions:
+                raise SystemExit(1)
+        return report
+
+
+def run(sensors: int, driver: str, channels: int, block: int, frequency: float,
+        clients: int, poll: float, duration: float, warmup: float) -> dict:
+    from savannah.iounit import CPUClient
+
+    with tempfile.TemporaryDirectory(prefix='savannah_bench_') as basedir:
+        names = ['Bench{}'.format(i) for i in range(sensors)]
+        port = _free_port()
+        sensor_settings = {'DRIVER': driver, 'FREQUENCY': frequency, 'CHANNELS': channels, 'BLOCK': block}
+        _write_project(basedir, {name: {k: v for k, v in sensor_settings.items() if v is not None} for name in names},
+                       port)
+
+        import savannah
+        env = dict(environ, SAVANNAH_BASEDIR=basedir, PYTHONPATH=os.pathsep.join(
+            [dirname(dirname(savannah.__file__))] + ([environ['PYTHONPATH']] if environ.get('PYTHONPATH') else [])))
+        server = subprocess.Popen([sys.executable, '-c', _SERVER], cwd=basedir, env=env, stdin=subprocess.PIPE,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            monitor = CPUClient('127.0.0.1', port)
+            _wait_server(monitor, server)
+
+            start = time.monotonic()
+            measuring, until = start + warmup, start + warmup + duration
+            pollers = [_Poller('127.0.0.1', port, poll, measuring, until) for _ in range(clients)]
+            for poller in pollers: poller.start()
+
+            time.sleep(max(0., measuring - time.monotonic()))
+            first = _server_stats(monitor)
+            memory, stats = [(first['time'], first['memory'])], first
+            while time.monotonic() < until:
+                time.sleep(min(1., max(0., until - time.monotonic())))
+                stats = _server_stats(monitor)
+                memory.append((stats['time'], stats['memory']))
+            last = stats
+            for poller in pollers: poller.join()
+        finally:
+            server.communicate(timeout=30)
+
+    elapsed = last['time'] - first['time']
+    samples = last['samples'] - first['samples']
+    latencies = sorted(latency for poller in pollers for latency in poller.latencies)
+    return {
+        'target_rate': sensors * frequency,
+        'sample_rate': samples / elapsed,
+        'rate_error': samples / elapsed / (sensors * frequency) - 1 if sensors else 0.,
+        'delivered_rate': sum(poller.delivered for poller in pollers) / (clients * duration) if clients else 0.,
+        'jitter_p50': last['jitter_p50'],
+        'jitter_p99': last['jitter_p99'],
+        'requests': len(latencies),
+        'request_errors': sum(poller.errors for poller in pollers),
+        'latency_mean': sum(latencies) / len(latencies) if latencies else float('nan'),
+        'latency_p50': percentile(latencies, .5),
+        'latency_p99': percentile(latencies, .99),
+        'latency_max': latencies[-1] if latencies else float('nan'),
+        'cpu_per_sample': (last['cpu'] - first['cpu']) / samples if samples else float('nan'),
+        'memory_start': first['memory'],
+        'memory_end': last['memory'],
+        'memory_growth_per_hour': slope(memory) * 3600,
+        'per_sensor': {name: (last['per_sensor'][name] - first['per_sensor'][name]) / elapsed for name in names},
+    }
+
+
+def compare(baseline: dict, results: dict, tolerance: float) -> List[str]:
+    """
+    Prints the figures of both runs and returns the names of those that got worse than the tolerance.
+    """
+    regressions = []
+    print('{:<24} {:>14} {:>14} {:>9}'.format('', 'baseline', 'current', 'change'))
+    for name, higher_is_better in _COMPARED:
+        before, after = baseline.get(name), results.get(name)
+        if before is None or after is None:
+            continue
+        change = (after - before) / abs(before) if before else 0.
+        worse = change < -tolerance if higher_is_better else change > tolerance
+        # Memory that does not grow cannot regress relative to its baseline
+        if name == 'memory_growth_per_hour' and after <= 0:
+            worse = False
+        if worse: regressions.append(name)
+        print('{:<24} {:>14.6g} {:>14.6g} {:>+8.1%}{}'.format(name, before, after, change,
+                                                             '  REGRESSION' if worse else ''))
+    return regressions
+
+
+#
+# Utils
+#
+
+def percentile(values: List[float], q: float) -> float:
+    """
+    Nearest-rank percentile of sorted values.
+    """
+    if not values: return float('nan')
+    return values[min(len(values) - 1, max(0, math.ceil(q * len(values)) - 1))]
+
+
+def slope(points: List[tuple]) -> float:
+    """
+    Least squares slope of (x, y) points.
+    """
+    if len(points) < 2: return 0.
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    variance = sum((x - mean_x) ** 2 for x, _ in points)
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / variance if variance else 0.
+
+
+class _Poller(threading.Thread):
+    """
+    Client that polls 'updates' through a persistent connection, as a dashboard would.
+    Requests sent before `measuring` are not recorded.
+    """
+
+    def __init__(self, host: str, port: int, interval: float, measuring: float, until: float):
+        super().__init__(daemon=True)
+        self.address = (host, port)
+        self.interval = interval
+        self.measuring = measuring
+        self.until = until
+        self.latencies: List[float] = []
+        self.delivered = 0
+        self.errors = 0
+
+    def run(self):
+        from savannah.iounit import CPUClient, ConnStatus
+        from savannah.iounit.interpreter import Utils
+
+        last_key: Dict[str, int] = {}
+        with CPUClient(*self.address) as client:
+            while time.monotonic() < self.until:
+                sent = time.monotonic()
+                start = time.perf_counter()
+                status, data = client.message(Utils.build_command('updates', last_key=dict(last_key) or None))
+                latency = time.perf_counter() - start
+                if status != ConnStatus.CONN_OK:
+                    self.errors += sent >= self.measuring
+                else:
+                    received = {name: updates['last_key'] for name, updates in json.loads(data).items()}
+                    if sent >= self.measuring:
+                        self.latencies.append(latency)
+                        self.delivered += sum(key - last_key.get(name, key) for name, key in received.items())
+                    last_key = received
+                time.sleep(max(0., sent + self.interval - time.monotonic()))
+
+
+def _server_stats(client) -> dict:
+    from savannah.iounit import ConnStatus
+    from savannah.iounit.interpreter import Utils
+
+    status, snapshot = client.message(Utils.build_command('metrics'))
+    if status != ConnStatus.CONN_OK:
+        raise RuntimeError("The server metrics could not be read: {}".format(snapshot))
+    per_sensor = {labels.split('=', 1)[1]: value for labels, value in snapshot.get('samples_total', {}).items()}
+    jitter = snapshot.get('sampler_jitter_seconds', {}).values()
+    return {
+        'time': time.monotonic(),
+        'samples': sum(per_sensor.values()),
+        'per_sensor': per_sensor,
+        'jitter_p50': max((_['p50'] for _ in jitter), default=float('nan')),
+        'jitter_p99': max((_['p99'] for _ in jitter), default=float('nan')),
+        'cpu': snapshot['process_cpu_seconds'],
+        'memory': snapshot['process_resident_memory_bytes'],
+    }
+
+
+def _wait_server(client, server: subprocess.Popen, timeout: float = 30.) -> None:
+    from savannah.iounit import ConnStatus
+    from savannah.iounit.interpreter import Utils
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError("The benchmark server exited with code {}.".format(server.returncode))
+        if client.message(Utils.build_command('metrics'))[0] == ConnStatus.CONN_OK:
+            return
+        time.sleep(.1)
+    raise RuntimeError("The benchmark server did not start in {}s.".format(timeout))
+
+
+def _write_project(basedir: str, sensors: Dict[str, dict], port: int) -> None:
+    with open(join(basedir, 'drivers.py'), 'w') as file:
+        file.write(_DRIVERS)
+    with open(join(basedir, 'interpreter.py'), 'w') as file:
+        file.write(_INTERPRETER)
+    settings = {
+        'workflow': {
+            'live_upload': True,
+            'temp_data': {'enable': False, 'path': 'temp/'},
+            'server': {'address': {'host': 'local', 'port': port}},
+            'localui': {'enabled': False, 'address': {'host': 'local', 'port': 8000}},
+            'hot_reload': {'enabled': False},
+        },
+        'sensors': {'enabled_sensors': list(sensors), 'custom_settings': sensors},
+        'log': {'brief': {'path': ''}, 'detailed': {'path': ''}},
+    }
+    with open(join(basedir, 'settings.json'), 'w') as file:
+        json.dump(settings, file)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _version() -> str:
+    from savannah import __version__
+    return __version__
@@ -0,0 +1,86 @@
+import statistics
+import subprocess
+import sys
+import time
+from os import environ
+
+from savannah.core.interpreter import AbstractBaseCommand as Command
+
+#
+# Cold start phases
+#
+# Each phase is run in a fresh interpreter, so that nothing is cached in sys.modules.
+# The App phase prints the (wall clock) time at which the first sample is taken,
+# so that the interpreter startup is included but stopping the App is not.
+#
+
+_FIRST_SAMPLE = """
+import socket, time
+from savannah.core.app import App
+with socket.socket() as s:
+    s.bind(('127.0.0.1', 0))
+    port = s.getsockname()[1]
+app = App(serverhost=('127.0.0.1', port))
+app.start()
+samplers = app.units['iounit'].sampling_unit.manager.wrappers_list
+deadline = time.monotonic() + {timeout}
+# The data of the readers starts with the header row
+while not any(sampler.reader.sequence > 0 for sampler in samplers):
+    if time.monotonic() > deadline: break
+    time.sleep(.001)
+else:
+    print('FIRST_SAMPLE', time.time(), flush=True)
+app.stop(graceful=False, timeout=1.)
+"""
+
+_PHASES = (
+    ('interpreter', [sys.executable, '-c', 'pass']),
+    ('import', [sys.executable, '-c', 'import savannah.core.management']),
+    ('cli', [sys.executable, '-c', 'from savannah.core.management import execute_from_command_line;'
+                                   'execute_from_command_line(["manage.py", "run", "--help"])']),
+)
+
+
+class ColdStart(Command):
+    verbose_name = 'coldstart'
+    help = "Measure the cold start time of the CLI and of the App until the first sample."
+
+    def __configure__(self):
+        self.parser.add_argument('-r', '--repeat', nargs='?', type=int, default=5,
+                                 help='Number of runs of each phase. Default is 5.')
+        self.parser.add_argument('--nosampling', action='store_true',
+                                 help='Do not start the App (no settings.json nor drivers.py required).')
+        self.parser.add_argument('--timeout', nargs='?', type=float, default=30.,
+                                 help='Maximum seconds to wait for the first sample.')
+
+    @staticmethod
+    def action(repeat: int = 5, nosampling: bool = False, timeout: float = 30.):
+        results = {}
+        for name, cmd in _PHASES:
+            results[name] = [_run(cmd) for _ in range(repeat)]
+
+        if not nosampling:
+            cmd = [sys.executable, '-c', _FIRST_SAMPLE.format(timeout=timeout)]
+            results['first sample'] = [_first_sample(cmd) for _ in range(repeat)]
+
+        print('{:<14} {:>10} {:>10}'.format('phase', 'min (ms)', 'median (ms)'))
+        for name, times in results.items():
+            print('{:<14} {:>10.1f} {:>10.1f}'.format(name, min(times) * 1e3, statistics.median(times) * 1e3))
+        return results
+
+
+def _run(cmd) -> float:
+    start = time.perf_counter()
+    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, env=environ.copy())
+    return time.perf_counter() - start
+
+
+def _first_sample(cmd) -> float:
+    start = time.time()
+    out = subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                         cwd=environ.get('SAVANNAH_BASEDIR') or None, env=environ.copy(),
+                         universal_newlines=True).stdout
+    for line in out.splitlines():
+        if line.startswith('FIRST_SAMPLE'):
+            return float(line.split()[1]) - start
+    raise RuntimeError("The App did not take any sample.")
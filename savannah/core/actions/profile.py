@@ -0,0 +1,45 @@
+import datetime
+import time
+from os import environ
+from os.path import join
+
+from savannah.core.interpreter import AbstractBaseCommand as Command
+from savannah.core.app import App
+
+
+class Profile(Command):
+    verbose_name = 'profile'
+    help = "Run Savannah for some seconds with profiling enabled and write the report."
+
+    def __configure__(self):
+        self.parser.add_argument('-d', '--duration', nargs='?', type=float, default=30.,
+                                 help='Seconds to run the app for. Default is 30.')
+        self.parser.add_argument('-i', '--interval', nargs='?', type=float, default=.01,
+                                 help='Seconds between stack samples. Default is 0.01.')
+        self.parser.add_argument('-o', '--output', nargs='?',
+                                 help='Path of the collapsed stacks file (flamegraph.pl, speedscope...). '
+                                      'The report with the spans is written to <output>.json. '
+                                      'Default is profile_<timestamp>.folded in the project directory.')
+
+    @staticmethod
+    def action(duration: float = 30., interval: float = .01, output: str = None):
+        from savannah.core.profiling import profiler
+
+        output = output or join(environ.get('SAVANNAH_BASEDIR', ''),
+                                'profile_{:%Y%m%d_%H%M%S}.folded'.format(datetime.datetime.now()))
+        app = App()
+        app.start()
+        profiler.start(interval)
+        try:
+            time.sleep(duration)
+        finally:
+            profiler.stop()
+            app.stop()
+
+        report = profiler.report(top=5)
+        print("{samples} stack samples in {duration:.1f}s".format(**report))
+        for span, stats in sorted(report['spans'].items()):
+            print("  {:<24} n={:<8} p50={:.6f}s p99={:.6f}s".format(span, stats['count'], stats['p50'], stats['p99']))
+        for path in profiler.write(output):
+            print("Written: {}".format(path))
+        return report
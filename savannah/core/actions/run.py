@@ -1,7 +1,5 @@
 from savannah.core.interpreter import AbstractBaseCommand as Command
-
-
-from savannah.core.app import App
+from savannah.core.app import App, _types_host, _types_port
 
 #
 # TODO: add types to the argument parsing to facilitate data processing and separate it from the logic
@@ -31,5 +29,5 @@ class Run(Command):
 
     @staticmethod
     def action(serverhost: tuple = None, serverport: int = None, uihost: tuple = None, uiport: int= None, logmode=None):
-        app = App()
+        app = App(serverhost=serverhost, serverport=serverport, uihost=uihost, uiport=uiport, logmode=logmode)
         app.start()
\ No newline at end of file
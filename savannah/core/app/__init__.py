@@ -2,7 +2,6 @@ from os import environ
 import ipaddress
 from savannah.core.exceptions import MisconfiguredSettings
 from savannah.core.logging.logging import logger as _logger
-from savannah.core.app.units import IOUnit
 
 __all__ = ["App", ]
 
@@ -31,6 +30,18 @@ class App:
                 'LOG_DO_DETAILED': '1',
             })
 
+        if getattr(getattr(settings.log, 'structured', None), 'enabled', False):
+            environ.update({
+                'LOG_DO_STRUCTURED': '1',
+            })
+
+        log_queue = getattr(settings.log, 'queue', None)
+        if getattr(log_queue, 'enabled', False):
+            environ.update({
+                'LOG_DO_QUEUE': '1',
+                'LOG_QUEUE_SIZE': str(getattr(log_queue, 'size', 10000)),
+            })
+
         # After this we need to reload the logger,
         # since we have changed environment variables that are used
         # when it is first imported.
@@ -62,6 +73,9 @@ class App:
             raise MisconfiguredSettings(MisconfiguredSettings.missing)
 
     def start(self):
+        # Units (processes, sockets, samplers...) are only imported when the app is started.
+        from savannah.core.app.units import IOUnit
+
         # Initialize IOUnit
         self.units['iounit'] = IOUnit(*self.validated_addr['iounit'])
         self.units['iounit'].init()
@@ -81,10 +95,13 @@ class App:
         #    uploader_unit = UploaderUnit()
         #    uploader_unit.init() # TODO: this does not resolve, make init a valid method
 
-    def stop(self):
+    def stop(self, graceful: bool = True, timeout: float = None):
+        """
+        Stops all units. If graceful is False, unit processes are terminated on the spot.
+        See units.py for the closing modes.
+        """
         for unit in self.units.values():
-            # TODO: in the future this requires a more thorough clean-up
-            unit.stop()
+            unit.stop(graceful=graceful, timeout=timeout)
 
 
 #
@@ -124,7 +141,7 @@ def _get_pair(host: tuple, port: int, fallback_host: tuple = None, fallback_port
 
     # If there is no available custom, fallback to default
     if len(fallback_host) == 2: return fallback_host
-    return (*host, port)
+    return (*fallback_host, fallback_port)
 
 
 # IP validation
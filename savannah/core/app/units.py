@@ -1,11 +1,15 @@
+import multiprocessing
 from abc import ABC, abstractmethod
 
-from savannah.asynchrony.processes import Process, ProcessManager
-from savannah.core import environ
+from savannah.asynchrony.processes import Process
+from savannah.asynchrony.supervisor import Supervisor
+from savannah.core import environ, metrics, profiling
 from savannah.core.exceptions import *
 from savannah.core.extensions.tupperware import unbox
 from savannah.core.logging import logger
 from savannah.iounit import CPUServer, Utils as IOUtils
+from savannah.sampling import drivers
+from savannah.sampling.groups import SensorGroup
 from savannah.sampling.sampler import SamplingManager, Utils as SamplingUtils
 
 # _BaseUnit is the base class for each Unit that must be run.
@@ -17,12 +21,12 @@ from savannah.sampling.sampler import SamplingManager, Utils as SamplingUtils
 # Abstract Base Classes Definition
 #
 
-# TODO: fix closing. It takes more than that to stop the app appropriately.
-# TODO... there should be two closing modes: a clean mode
-# TODO... that uploads remaining data, and executes remaining tasks
-# TODO... and another that kills the app on the spot.
-# TODO... timeout feature is also interesting but be careful because
-# TODO... many times after timeout there is no force kill.
+# Closing modes:
+#   - graceful (the default): units finish their current work (the ongoing request,
+#     the current sample) and unit processes are asked to stop, with a timeout
+#     after which they are terminated.
+#   - forced: unit processes are terminated on the spot.
+# In both modes, processes that ignore termination are killed (see Supervisor.shutdown).
 
 class _BaseUnit(ABC):
     @abstractmethod
@@ -30,13 +34,17 @@ class _BaseUnit(ABC):
         pass
 
     @abstractmethod
-    def stop(self):
+    def stop(self, graceful: bool = True, timeout: float = None):
         pass
 
 class _BaseUnitProcess(Process):
     pass
 
-class UnitManager(ProcessManager):
+class UnitManager(Supervisor):
+    """
+    Manager of the unit processes. Processes added with supervise() are restarted
+    if they crash, and all of them are stopped by shutdown() (see Supervisor).
+    """
     pass
 
 #
@@ -54,6 +62,7 @@ class IOUnit(_BaseUnit):
         self.server: CPUServer = None
         self.sampling_unit: SamplingUnit = None
         self.unit_manager: UnitManager = None
+        self.metrics_server: metrics.MetricsServer = None
 
     def init(self):
         if not IOUtils.socket_available(self.host, self.port):
@@ -65,44 +74,225 @@ class IOUnit(_BaseUnit):
         self.server = CPUServer(self.host, self.port, command_interpreter)
 
         # We initialize the UnitManager
-        self.unit_manager = UnitManager()
+        from savannah.core import settings
+        processes_settings = getattr(settings.workflow, 'processes', None)
+        start_method = getattr(processes_settings, 'start_method', None)
+        # User modules are loaded once for all the unit processes (see environ)
+        preload = list(getattr(processes_settings, 'preload', None) or ()) + \
+            environ.preload_modules(multiprocessing.get_context(start_method).get_start_method())
+        self.unit_manager = UnitManager(start_method=start_method, preload=preload)
         # We create a space to store the queue proxies to the sensors
         self.unit_manager.sampling_proxies = \
             {k: self.unit_manager.ioserver.Queue() for k in self.sampling_unit.sensor_dict.keys()}
 
         # Now we start the threads
-        self.sampling_unit.init(self.unit_manager.sampling_proxies)
+        self.sampling_unit.init(self.unit_manager.sampling_proxies, queue_factory=self.unit_manager.ioserver.Queue)
         self.server.run()
         logger.info("IOUnit has been initialized. CPUServer now running at //{0}:{1}".format(self.host, self.port))
 
-    def stop(self):
-        self.server.close()
-        self.sampling_unit.stop()
+        self.init_metrics()
+        # Profiling can be toggled with SIGUSR2 (or the 'profile' command)
+        profiling.install_signal()
+
+        # Changes in settings.json are applied live (from the watcher thread)
+        hot_reload = getattr(settings.workflow, 'hot_reload', None)
+        if getattr(hot_reload, 'enabled', True):
+            settings.subscribe(self.sampling_unit.apply_settings)
+            settings.watch(interval=getattr(hot_reload, 'interval', 1.))
+
+    def init_metrics(self):
+        from savannah.core import settings
+        metrics.gauge('process_cpu_seconds', 'CPU time of the server process.', func=metrics.cpu_seconds)
+        metrics.gauge('process_resident_memory_bytes', 'Resident memory of the server process.',
+                      func=metrics.resident_memory)
+        metrics.gauge('server_connection_handlers', 'Persistent connections and streams being served.',
+                      func=lambda: len(self.server.handlers))
+        # The queue depth gauges follow the sensors (see SamplingUnit)
+
+        # Optional Prometheus endpoint
+        prometheus = getattr(getattr(settings.workflow, 'metrics', None), 'prometheus', None)
+        if getattr(prometheus, 'enabled', False):
+            host = '127.0.0.1' if prometheus.address.host == 'local' else prometheus.address.host
+            self.metrics_server = metrics.MetricsServer(host, prometheus.address.port)
+            self.metrics_server.run()
+            logger.info("Metrics are served at http://{0}:{1}/metrics".format(*self.metrics_server.address))
+
+    def stop(self, graceful: bool = True, timeout: float = None):
+        from savannah.core import settings
+        if self.metrics_server: self.metrics_server.close(timeout)
+        settings.unwatch()
+        settings.unsubscribe(self.sampling_unit.apply_settings)
+        self.server.close(timeout=timeout if graceful else 0.)
+        self.sampling_unit.stop(graceful, timeout)
+        self.unit_manager.shutdown(graceful=graceful, timeout=timeout or 5.)
 
 class SamplingUnit(_BaseUnit):
     def __init__(self):
         from savannah.core import settings
         self.manager = SamplingManager()
         self.sensor_dict = {}
-        drivers_module = environ.load_drivers()
+        self.sampling_proxies: dict = None
+        self.queue_factory = None
+        self.drivers_module = environ.load_drivers()
+        # Synchronized groups, as they were when their sensors were created
+        self.groups: dict = self.groups_settings()
+        # Sensors get their own (mutable) dict of settings
+        custom_settings = unbox(settings.sensors.custom_settings)
         for sensor_name in settings.sensors.enabled_sensors:
-            try:
-                _sensor_obj = getattr(drivers_module, sensor_name)
-                self.sensor_dict[sensor_name] = (_sensor_obj(unbox(settings.sensors.custom_settings).get(sensor_name)))
-            except AttributeError:
-                raise MisconfiguredSettings("Some enabled sensors do not match any object in sensors.py")
+            self.sensor_dict[sensor_name] = self.make_sensor(sensor_name, custom_settings.get(sensor_name))
+        for group_name, group_settings in self.groups.items():
+            self.sensor_dict[group_name] = self.make_group(group_name, group_settings, custom_settings)
 
         if len(self.sensor_dict.keys()) == 0: logger.warning("No sensors have been enabled.")
 
-    def init(self, sampling_proxies):
+    def make_sensor(self, sensor_name: str, sensor_settings: dict = None):
+        # Sensors are found in drivers.py, or else among the built-in drivers (see sampling.drivers).
+        # DRIVER selects the driver of a sensor named otherwise.
+        sensor_settings = sensor_settings or dict()
+        driver_name = sensor_settings.get('DRIVER', sensor_settings.get('driver')) or sensor_name
+        _sensor_obj = drivers.find_driver(driver_name, self.drivers_module)
+        if _sensor_obj is None:
+            raise MisconfiguredSettings("Some enabled sensors do not match any object in drivers.py "
+                                        "nor any built-in driver")
+        if driver_name != sensor_name:
+            # Sensors are named after their class
+            _sensor_obj = type(sensor_name, (_sensor_obj, ), {})
+        return _sensor_obj(sensor_settings)
+
+    def make_group(self, group_name: str, group_settings: dict, custom_settings: dict) -> SensorGroup:
+        members = [self.make_sensor(sensor_name, custom_settings.get(sensor_name))
+                   for sensor_name in group_settings.get('sensors', ())]
+        # The rest of settings (e.g. the frequency) are those of the group
+        return type(group_name, (SensorGroup, ), {})(
+            members, {key: value for key, value in group_settings.items() if key != 'sensors'})
+
+    @staticmethod
+    def groups_settings() -> dict:
+        """
+        Synchronized groups in settings: {group_name: {'sensors': [...], ...}}.
+        Sensors can only be sampled once, either alone or in a single group.
+        """
+        from savannah.core import settings
+        groups = unbox(getattr(settings.sensors, 'groups', None) or {})
+        sampled = list(settings.sensors.enabled_sensors) + list(groups)
+        for group_settings in groups.values():
+            sampled += group_settings.get('sensors', ())
+        if len(sampled) != len(set(sampled)):
+            raise MisconfiguredSettings("Sensors and groups can only be sampled once: "
+                                        "they cannot be both enabled and in a group, nor be in several groups.")
+        return groups
+
+    def init(self, sampling_proxies, queue_factory=None):
+        """
+        queue_factory: callable that creates the queue proxy of sensors enabled later on (see apply_settings).
+        """
+        self.sampling_proxies = sampling_proxies
+        self.queue_factory = queue_factory
         sampler_list = SamplingUtils.make_samplers(self.sensor_dict.values())
         self.manager.propagate(sampler_list)
         self.manager.start_all(sampling_proxies)
+        for sensor_name in self.sensor_dict:
+            self.register_metrics(sensor_name)
         logger.info("SamplingUnit has been initialized")
 
-
-    def stop(self):
-        self.manager.stop_all()
+    def register_metrics(self, sensor_name: str):
+        metrics.gauge('sampling_queue_depth', 'Samples waiting in the queue of a sensor.',
+                      func=self.sampling_proxies[sensor_name].qsize, sensor=sensor_name)
+
+    @staticmethod
+    def unregister_metrics(sensor_name: str):
+        metrics.unregister('sampling_queue_depth', sensor=sensor_name)
+
+    #
+    # Live changes
+    #
+    # Each sensor is changed on its own: adding, removing or retuning a sampler
+    # does not stop the rest of samplers, nor the CPUServer.
+
+    def apply_settings(self, changes: list):
+        """
+        Settings listener: enables, disables and retunes samplers according to the changes.
+        """
+        if not any(change.startswith('sensors') for change in changes):
+            return
+        from savannah.core import settings
+        try:
+            groups = self.groups_settings()
+        except MisconfiguredSettings as exc:
+            logger.error("Sensor changes could not be applied: {0}".format(exc))
+            return
+        enabled = list(settings.sensors.enabled_sensors) + list(groups)
+        custom_settings = unbox(settings.sensors.custom_settings)
+
+        retuned = {change.path[2] for change in changes
+                   if change.startswith('sensors', 'custom_settings') and len(change.path) > 2}
+        if any(change.path == ('sensors', 'custom_settings') for change in changes):
+            retuned = set(self.sensor_dict) | {name for group in groups.values() for name in group.get('sensors', ())}
+
+        # Groups are created again when they change, or when the settings of their sensors change
+        regrouped = [name for name, group in groups.items() if name in self.groups and name in self.sensor_dict and
+                     (group != self.groups[name] or retuned.intersection(group.get('sensors', ())))]
+
+        for sensor_name in [name for name in self.sensor_dict if name not in enabled or name in regrouped]:
+            self.__apply(self.remove_sensor, sensor_name)
+            self.groups.pop(sensor_name, None)
+
+        added = [name for name in enabled if name not in self.sensor_dict]
+        for sensor_name in added:
+            if sensor_name in groups:
+                self.__apply(self.add_group, sensor_name, groups[sensor_name], custom_settings)
+            else:
+                self.__apply(self.add_sensor, sensor_name, custom_settings.get(sensor_name))
+
+        for sensor_name in retuned:
+            if sensor_name in self.sensor_dict and sensor_name not in added and sensor_name not in groups:
+                self.__apply(self.reconfigure_sensor, sensor_name, custom_settings.get(sensor_name))
+
+    @staticmethod
+    def __apply(method, sensor_name, *args):
+        # A sensor that cannot be changed must not prevent the rest of changes.
+        try:
+            method(sensor_name, *args)
+        except Exception as exc:
+            logger.error("Sensor {0} could not be changed: {1}".format(sensor_name, exc))
+
+    def add_group(self, group_name: str, group_settings: dict, custom_settings: dict):
+        self.add_sensor(group_name, sensor=self.make_group(group_name, group_settings, custom_settings))
+        self.groups[group_name] = group_settings
+
+    def add_sensor(self, sensor_name: str, sensor_settings: dict = None, sensor: drivers.Sensor = None):
+        """
+        sensor: the sensor to add, if it is already made (e.g. a group).
+        """
+        sensor = sensor or self.make_sensor(sensor_name, sensor_settings)
+        if sensor_name not in self.sampling_proxies:
+            self.sampling_proxies[sensor_name] = self.queue_factory()
+        self.manager.add_sampler(SamplingUtils.make_sampler(sensor), self.sampling_proxies[sensor_name])
+        self.sensor_dict[sensor_name] = sensor
+        self.register_metrics(sensor_name)
+        logger.info("Sensor {} has been enabled".format(sensor_name))
+
+    def remove_sensor(self, sensor_name: str, timeout: float = None):
+        self.manager.remove_sampler(sensor_name, timeout=timeout)
+        del self.sensor_dict[sensor_name]
+        self.unregister_metrics(sensor_name)
+        logger.info("Sensor {} has been disabled".format(sensor_name))
+
+    def reconfigure_sensor(self, sensor_name: str, sensor_settings: dict = None):
+        sensor = self.sensor_dict[sensor_name]
+        pipeline = (sensor.settings.get('PIPELINE'), sensor.settings.get('pipeline'))
+        sensor.settings = sensor_settings or dict()
+        sampler = self.manager.find_by_name(sensor_name)
+        if (sensor.settings.get('PIPELINE'), sensor.settings.get('pipeline')) != pipeline:
+            sampler.reader.configure_pipeline()
+        frequency = sampler.settings_frequency(sensor)
+        if frequency != sampler.sampling_frequency:
+            sampler.retune(frequency)
+
+
+    def stop(self, graceful: bool = True, timeout: float = None):
+        # Sampler threads cannot be killed: a forced stop does not wait for them.
+        self.manager.stop_all(timeout=timeout if graceful else 0.)
 
 #
 # Asynchronous Units:
@@ -17,10 +17,17 @@
 #         pass
 #
 #     def read(self):
+#         # Return a tuple with a value per magnitude, or None if there is no new data.
 #         pass
 #
+#     # Optional: processing stages applied before samples are stored (see savannah.sampling.processing)
+#     PIPELINE = [{"stage": "calibrate", "gain": 1.02}, {"stage": "moving_average", "window": 5}]
+#
 #
 # Sensor must be enabled in settings.json with the same name as
 # the class defined here for it to work at the runtime.
 #
+# Synthetic sensors (SyntheticScalar, SyntheticVector, SyntheticWaveform) are built in
+# and can be enabled without defining them here. See savannah.sampling.drivers.
+#
 
@@ -23,6 +23,15 @@
 #         return "Hello World!"
 #
 #
+# Commands whose response only changes when new samples arrive can be cached
+# (the response is stored serialized, and recomputed on new samples or after the TTL):
+#
+# from savannah.iounit.interpreter import cached, ALL_SENSORS
+#
+#     @cached(ttl=5, sensors=ALL_SENSORS)
+#     def summary(self) -> dict: ...
+#
+#
 # You can use class mix-ins to implement method blueprints easily.
 # Many blueprints are readily available. You can import them by doing:
 #
@@ -1,19 +1,104 @@
 import importlib.util
 import os
-from savannah.core.defaults import drivers, interpreter
+import sys
+import threading
+from typing import TYPE_CHECKING, Dict, Iterable, List, Tuple
 
+if TYPE_CHECKING:  # The defaults import the iounit and sampling packages, only needed for annotations
+    from savannah.core.defaults import drivers, interpreter
 
-def load_module(module_name, file_name=None, file_path=None):
-    from savannah.core import settings
+__all__ = [
+    "load_module", "load_interpreter", "load_drivers", "preload", "preload_modules", "clear_cache", "USER_MODULES",
+    "USER_PACKAGE",
+]
+
+#
+# User modules
+#
+# The user modules of the project (interpreter.py, drivers.py...) are loaded from their files,
+# registered in sys.modules under the savannah.user package and cached by path and modification
+# time: loading a module again returns the same module object (and so the same classes) unless
+# its file has changed. Their bytecode is read from and written to __pycache__ by the source
+# loader, as for any import.
+#
+# Forked workers inherit the modules loaded by the parent. With the forkserver start method,
+# preload_modules() tells the server to import savannah.user, which loads them once for all
+# workers (see IOUnit).
+#
+
+# module name: file name (relative to BASEDIR)
+USER_MODULES = {
+    'interpreter': 'interpreter.py',
+    'drivers': 'drivers.py',
+}
+
+# Package of the user modules in sys.modules (savannah.user.drivers...)
+USER_PACKAGE = 'savannah.user'
+
+# (module name, path): (mtime, size, module)
+_cache: Dict[Tuple[str, str], tuple] = dict()
+_lock = threading.RLock()
+
+
+def load_module(module_name, file_name=None, file_path=None, reload: bool = False):
+    """
+    Loads the module at file_path (or file_name in BASEDIR) as USER_PACKAGE.<module_name>.
+    """
     if not (file_name or file_path): raise TypeError("File name or path are required.")
-    file_path = file_path or os.path.join(settings.BASEDIR, file_name)
-    spec = importlib.util.spec_from_file_location(module_name, file_path)
-    module = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(module)
-    return module
+    if not file_path:
+        from savannah.core import settings
+        file_path = os.path.join(settings.BASEDIR, file_name)
+    file_path = os.path.abspath(file_path)
+    stat = os.stat(file_path)
+    key = (module_name, file_path)
+
+    with _lock:
+        cached = _cache.get(key)
+        if not reload and cached and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+            return cached[2]
+
+        qualified_name = '{}.{}'.format(USER_PACKAGE, module_name)
+        spec = importlib.util.spec_from_file_location(qualified_name, file_path)
+        module = importlib.util.module_from_spec(spec)
+        # Registered before execution, as the import system does, so that the module
+        # can be found (e.g. by pickle) while and after it is executed.
+        previous = sys.modules.get(qualified_name)
+        sys.modules[qualified_name] = module
+        try:
+            spec.loader.exec_module(module)
+        except BaseException:
+            if previous is None: sys.modules.pop(qualified_name, None)
+            else: sys.modules[qualified_name] = previous
+            raise
+        _cache[key] = (stat.st_mtime_ns, stat.st_size, module)
+        return module
+
+
+def clear_cache() -> None:
+    with _lock:
+        _cache.clear()
+
+
+def load_interpreter() -> 'interpreter':
+    return load_module("interpreter", USER_MODULES["interpreter"])
+
+
+def load_drivers() -> 'drivers':
+    return load_module("drivers", USER_MODULES["drivers"])
+
+
+def preload(module_names: Iterable[str] = None) -> List:
+    """
+    Loads the user modules in this process, so that processes forked from it inherit them.
+    """
+    return [load_module(name, USER_MODULES[name]) for name in (module_names or USER_MODULES)]
 
-def load_interpreter() -> interpreter:
-    return load_module("interpreter", "interpreter.py")
 
-def load_drivers() -> drivers:
-    return load_module("drivers", "drivers.py")
+def preload_modules(start_method: str) -> List[str]:
+    """
+    Modules to preload in the workers so that the user modules are loaded once for all of them.
+      - fork: workers inherit the modules already loaded by this process.
+      - forkserver: the server imports the user package, which loads the user modules.
+      - spawn: every worker loads them on its own.
+    """
+    return [USER_PACKAGE] if start_method == 'forkserver' else []
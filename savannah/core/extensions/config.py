@@ -2,12 +2,76 @@
 import json
 import os
 import sys
-from typing import Dict
+from typing import Dict, List, Callable, Any
 
+from savannah.asynchrony import threads
 from savannah.core.logging import logger
 from savannah.core.extensions.tupperware import box, Box
 from savannah.core.exceptions import MisconfiguredSettings
 
+__all__ = [
+    "Configuration", "ConfigWatcher",
+    "SettingsChange", "SettingAdded", "SettingRemoved", "SettingModified", "diff",
+]
+
+
+#
+# Change events
+#
+
+class SettingsChange:
+    """
+    A change in a single setting. `path` is the tuple of keys that leads to it,
+    e.g. ('sensors', 'custom_settings', 'Thermometer', 'FREQUENCY').
+    """
+    def __init__(self, path: tuple, old: Any = None, new: Any = None) -> None:
+        self.path = path
+        self.old = old
+        self.new = new
+
+    def startswith(self, *prefix) -> bool:
+        return self.path[:len(prefix)] == prefix
+
+    def __eq__(self, other) -> bool:
+        return type(self) is type(other) and (self.path, self.old, self.new) == (other.path, other.old, other.new)
+
+    def __repr__(self) -> str:
+        return '{0}({1}: {2!r} -> {3!r})'.format(self.__class__.__name__, '.'.join(self.path), self.old, self.new)
+
+
+class SettingAdded(SettingsChange):
+    pass
+
+
+class SettingRemoved(SettingsChange):
+    pass
+
+
+class SettingModified(SettingsChange):
+    pass
+
+
+def diff(old: dict, new: dict, path: tuple = ()) -> List[SettingsChange]:
+    """
+    Changes between two settings trees. Nested dicts are compared key by key; any other value as a whole.
+    """
+    changes = []
+    for key in old.keys() - new.keys():
+        changes.append(SettingRemoved(path + (key,), old=old[key]))
+    for key, value in new.items():
+        if key not in old:
+            changes.append(SettingAdded(path + (key,), new=value))
+        elif isinstance(value, dict) and isinstance(old[key], dict):
+            changes += diff(old[key], value, path + (key,))
+        elif value != old[key]:
+            changes.append(SettingModified(path + (key,), old=old[key], new=value))
+    return changes
+
+
+#
+# Classes
+#
+
 
 class Configuration:
     """
@@ -34,6 +98,12 @@ class Configuration:
     >>> c.save()
     # 7. Or simply:
     >>> saved_config_instance = Configuration.new(<config_path:str>, <my_object:dict>)
+    # 8. To reload the file if it has been changed by another process:
+    >>> c.refresh() # --> list of SettingsChange
+    # 9. To be notified of the changes (see also ConfigWatcher):
+    >>> c.subscribe(lambda changes: ...)
+
+    The Box is built once and cached until the data is replaced, saved or reloaded.
     """
 
     def __init__(self, config_path: str = None):
@@ -45,10 +115,16 @@ class Configuration:
 
         self.config_path = config_path
 
+        self.__box: Box = None
+        self.__mtime: float = None
+        # .load runs __init__ again: listeners are kept.
+        self.__listeners: tuple = getattr(self, '_Configuration__listeners', ())
         self.__data: dict = self.__load() if config_path else dict()
 
     def __load(self, path: str = None):
-        with open((path or self.config_path), "rb") as file:
+        path = path or self.config_path
+        self.__mtime = os.path.getmtime(path)
+        with open(path, "rb") as file:
             try:
                 out = json.load(file)
             except json.decoder.JSONDecodeError as exc:
@@ -64,11 +140,58 @@ class Configuration:
 
     def save(self):
         if self.__data and self.config_path:
-            with open(self.config_path, 'wb') as file:
+            with open(self.config_path, 'w') as file:
                 json.dump(self.__data, file)
+            self.__mtime = os.path.getmtime(self.config_path)
+            self.__box = None
             return True
         return False
 
+    @property
+    def is_stale(self) -> bool:
+        """
+        True if the file has been modified since it was loaded or saved.
+        """
+        return bool(self.config_path) and self.__path_exists(self.config_path) and \
+            os.path.getmtime(self.config_path) != self.__mtime
+
+    def refresh(self) -> List[SettingsChange]:
+        """
+        Reloads the file if it has been modified, and notifies the listeners of the changes.
+        Returns the changes (an empty list if nothing has changed).
+        An invalid file (e.g. halfway written) is ignored until it is modified again.
+        """
+        if not self.is_stale:
+            return []
+        try:
+            # The modification time is recorded before reading, so that a file that fails is not read again
+            data = self.__load()
+        except (MisconfiguredSettings, OSError) as exc:
+            logger.warning("Settings could not be reloaded: {}".format(exc))
+            return []
+
+        changes = diff(self.__data, data)
+        self.__data = data
+        self.__box = None
+        if changes:
+            for listener in self.__listeners:
+                try:
+                    listener(changes)
+                except Exception as exc:
+                    # A failing listener must not prevent the rest from being notified.
+                    logger.error("Settings change listener {0} failed: {1}".format(listener, exc))
+        return changes
+
+    def subscribe(self, listener: Callable[[List[SettingsChange]], None]) -> None:
+        """
+        Registers a callable that receives the list of changes after every reload that changes something.
+        Listeners are called in order of subscription, from the thread that reloads.
+        """
+        self.__listeners = self.__listeners + (listener,)
+
+    def unsubscribe(self, listener: Callable[[List[SettingsChange]], None]) -> None:
+        self.__listeners = tuple(_ for _ in self.__listeners if _ != listener)
+
     @property
     def data(self) -> Box:
         """
@@ -77,7 +200,9 @@ class Configuration:
         (except when changing the entire dataset).
         To change a value use .set.
         """
-        return box(self.__data)
+        if self.__box is None:
+            self.__box = box(self.__data)
+        return self.__box
 
     @property
     def as_dict(self) -> Dict:
@@ -86,6 +211,7 @@ class Configuration:
     @data.setter
     def data(self, value: Dict):
         self.__data = value
+        self.__box = None
 
     @staticmethod
     def new(path, obj) -> 'Configuration':
@@ -94,3 +220,23 @@ class Configuration:
         c.data = obj
         c.save()
         return c
+
+
+class ConfigWatcher(threads.ThreadedLoop):
+    """
+    Polls the modification time of a configuration file and reloads it when it changes.
+    A stat call per interval is cheap and works on every platform and filesystem.
+    """
+    def __init__(self, config: Configuration, interval: float = 1.) -> None:
+        self.config = config
+        super().__init__(interval=interval, name='ConfigWatcher', is_daemon=True)
+
+    def task(self):
+        try:
+            changes = self.config.refresh()
+        except Exception as exc:
+            # The watcher must survive any error, or later changes would not be picked up.
+            logger.error("Settings watcher failed: {}".format(exc))
+            return
+        if changes:
+            logger.info("Settings reloaded: {}".format(', '.join('.'.join(c.path) for c in changes)))
@@ -1,5 +1,6 @@
 from abc import ABCMeta, abstractmethod
-from collections import Mapping, UserDict
+from collections import UserDict
+from collections.abc import Mapping
 import json
 
 class ProtectedDict(dict):
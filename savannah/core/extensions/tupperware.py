@@ -1,26 +1,30 @@
 from collections import UserDict
+from collections.abc import Mapping
 import collections
+import functools
 from typing import NamedTuple, TypeVar
-import copy
 
 __author__ = 'github.com/hangtwenty, github.com/Rocamonde'
 
 
 def box(mapping):
+    # The original object is never modified: mappings are rebuilt as Boxes and
+    # lists as tuples, so no (deep) copy is needed and the result is immutable.
+    if isinstance(mapping, Mapping) and not isinstance(mapping, ProtectedDict):
+        return namedtuple_from_mapping({key: box(value) for key, value in mapping.items()})
+    if isinstance(mapping, list):
+        return tuple(box(item) for item in mapping)
+    return mapping
 
-    # This prevents in-place change of original object
-    _mapping = copy.deepcopy(mapping)
 
-    if (isinstance(_mapping, collections.Mapping) and
-            not isinstance(_mapping, ProtectedDict)):
-        for key, value in _mapping.items():
-            _mapping[key] = box(value)
-        return namedtuple_from_mapping(_mapping)
-    return _mapping
+@functools.lru_cache(maxsize=None)
+def _box_type(fields: tuple, name: str):
+    # Creating a namedtuple class is expensive: boxes with the same fields share it.
+    return collections.namedtuple(name, fields)
 
 
 def namedtuple_from_mapping(mapping, name="Box"):
-    this_namedtuple_maker = collections.namedtuple(name, mapping.keys())
+    this_namedtuple_maker = _box_type(tuple(mapping.keys()), name)
     return this_namedtuple_maker(**mapping)
 
 Box = TypeVar('Box', bound=NamedTuple)
@@ -45,11 +49,7 @@ def is_nt_instance(x):
     return all(type(n)==str for n in f)
 
 def unbox(nt: NamedTuple):
-    if not is_nt_instance(nt): return nt
-    d = nt._asdict()
-    unboxed = dict()
-    for key, val in d.items():
-        if is_nt_instance(val):
-            val = unbox(val)
-        unboxed[key] = val
-    return unboxed
+    if not is_nt_instance(nt):
+        # Lists are boxed as tuples
+        return [unbox(item) for item in nt] if type(nt) is tuple else nt
+    return {key: unbox(val) for key, val in nt._asdict().items()}
@@ -1,7 +1,15 @@
 from savannah.core.exceptions import UndefinedEnvironment
 logger = None
+_manager = None
 try:
-    from .logging import logger
-    logger = logger.logger
+    from .logging import logger as _manager
+    logger = _manager.logger
 except UndefinedEnvironment:
     from .logging import empty_logger as logger
+
+
+def queue_connection():
+    """
+    Arguments to log to the queue of this process from a child process, or None if logging is not queued.
+    """
+    return _manager.queue_connection if _manager else None
@@ -0,0 +1,181 @@
+import logging
+import logging.handlers
+import multiprocessing
+import os
+import queue
+import threading
+from typing import Iterable, List
+
+from .traces import capture_stack
+
+__all__ = [
+    "BatchFlushMixin", "BatchFileHandler", "BatchStreamHandler", "BoundedQueueHandler", "QueueWriter",
+]
+
+#
+# Queued logging
+#
+# Producers (any thread of any unit process) only enqueue records with a BoundedQueueHandler,
+# which never blocks: if the queue is full, the record is dropped and counted.
+# A single QueueWriter thread in the main process takes the records from the queue
+# and writes them in batches with the actual handlers, flushing once per batch.
+#
+# The queue is a multiprocessing queue, so that unit processes send their records
+# to the same writer instead of contending on the log files (see attach_queue in logging.py).
+#
+
+
+class BatchFlushMixin:
+    """
+    Handlers flush after every record. While `batching` is set (by the QueueWriter),
+    flushing is deferred until flush_batch is called.
+    """
+    batching = False
+
+    def flush(self):
+        if not self.batching: super().flush()
+
+    def flush_batch(self):
+        super().flush()
+
+
+class BatchFileHandler(BatchFlushMixin, logging.FileHandler):
+    pass
+
+
+class BatchStreamHandler(BatchFlushMixin, logging.StreamHandler):
+    pass
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+
+    def __init__(self, record_queue, dropped, trace_level: int = None) -> None:
+        """
+        record_queue: queue shared with the QueueWriter.
+        dropped: shared counter (multiprocessing.Value) of records dropped because the queue was full.
+        trace_level: records of this level or higher carry the stack of their log call.
+        """
+        super().__init__(record_queue)
+        self.dropped = dropped
+        self.trace_level = trace_level
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The stack is captured here since the record is formatted by the writer thread (see traces.py)
+        if self.trace_level is not None and record.levelno >= self.trace_level:
+            record.trace_stack = capture_stack(record)
+        # Merges the arguments and exception into the message, so that the record can be pickled.
+        return super().prepare(record)
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self.dropped.get_lock():
+                self.dropped.value += 1
+
+    @property
+    def connection(self) -> tuple:
+        """
+        Arguments to create a handler of the same queue in another process.
+        """
+        return self.queue, self.dropped, self.trace_level
+
+
+class QueueWriter:
+
+    def __init__(self, handlers: Iterable[logging.Handler], maxsize: int = 10000, batch_size: int = 256) -> None:
+        self.handlers: List[logging.Handler] = list(handlers)
+        self.batch_size = batch_size
+        self.maxsize = maxsize
+        # Objects of the spawn context can be passed to processes of any start method
+        context = multiprocessing.get_context('spawn')
+        self.queue = context.Queue(maxsize)
+        self.dropped = context.Value('Q', 0)
+
+        self.written = 0
+        self.batches = 0
+        self.__reported_drops = 0
+        self.__thread: threading.Thread = None
+        self.__pid = os.getpid()
+
+    def handler(self, trace_level: int = None) -> BoundedQueueHandler:
+        return BoundedQueueHandler(self.queue, self.dropped, trace_level)
+
+    def start(self) -> 'QueueWriter':
+        for handler in self.handlers:
+            if isinstance(handler, BatchFlushMixin): handler.batching = True
+        from savannah.core import metrics
+        metrics.gauge('log_queue_depth', 'Log records waiting to be written.', func=self.queue.qsize)
+        metrics.gauge('log_records_dropped', 'Log records dropped because the queue was full.',
+                      func=lambda: self.dropped.value)
+        self.__thread = threading.Thread(target=self.__run, name='QueueWriter', daemon=True)
+        self.__thread.start()
+        return self
+
+    def stop(self, timeout: float = None) -> None:
+        """
+        Writes the records in the queue and stops the writer.
+        Only the process that started the writer can stop it (forked children inherit the object).
+        """
+        if os.getpid() != self.__pid or self.__thread is None or not self.__thread.is_alive():
+            return
+        self.queue.put(None)
+        self.__thread.join(timeout)
+        for handler in self.handlers:
+            if isinstance(handler, BatchFlushMixin): handler.batching = False
+            handler.close()
+
+    @property
+    def is_running(self) -> bool:
+        return self.__thread is not None and self.__thread.is_alive()
+
+    def stats(self) -> dict:
+        return {
+            'written': self.written,
+            'batches': self.batches,
+            'dropped': self.dropped.value,
+            'maxsize': self.maxsize,
+        }
+
+    def __run(self) -> None:
+        stop = False
+        while not stop:
+            batch = [self.queue.get()]
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                pass
+            if None in batch:
+                stop = True
+                # Records may still arrive from other processes after the stop
+                batch = [record for record in batch if record is not None] + self.__drain()
+            self.__write(batch)
+
+    def __drain(self) -> list:
+        records = []
+        try:
+            while True:
+                record = self.queue.get_nowait()
+                if record is not None: records.append(record)
+        except queue.Empty:
+            return records
+
+    def __write(self, batch: list) -> None:
+        dropped = self.dropped.value
+        if dropped > self.__reported_drops:
+            batch.append(logging.makeLogRecord({
+                'name': __name__, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                'pathname': __file__, 'filename': os.path.basename(__file__), 'funcName': 'QueueWriter',
+                'msg': "{} log records dropped: the log queue is full.".format(dropped - self.__reported_drops),
+            }))
+            self.__reported_drops = dropped
+
+        for record in batch:
+            for handler in self.handlers:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+        for handler in self.handlers:
+            if isinstance(handler, BatchFlushMixin): handler.flush_batch()
+        self.written += len(batch)
+        self.batches += 1
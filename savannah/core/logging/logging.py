@@ -1,23 +1,26 @@
+import atexit
 import logging
-import traceback
 import os
+import sys
 
 from .colours import *
+from .handlers import *
+from .structured import StructuredFileHandler, relative_path
+from .throttling import RateLimitFilter
+from .traces import capture_stack, format_stack, traces
 
 __all__ = [
-    "produce_trace", "Logger", "logger", "empty_logger"
+    "produce_trace", "Logger", "logger", "empty_logger", "attach_queue", "queued_target",
 ]
 
 
 def produce_trace():
-    n = 12
-    # TODO: improve this implementation
-    # This limiter strips the nth last elements to remove the part of generating the log
-    # 12 has been set experimentally but depends on how the code is called
-    # A better way to stop the traceback could be extending the log class, adding an extra argument
-    # to pass with the message (or maybe with a Filter) and producing the trace just before generating the log,
-    # So always only the last element would need being removed
-    return ['*Traceback* (most recent call last):\n', *traceback.format_stack()][:-n]
+    """
+    Lines of the stack trace of the caller.
+    """
+    frame = sys._getframe(1)
+    return format_stack(capture_stack(logging.makeLogRecord({
+        'pathname': frame.f_code.co_filename, 'lineno': frame.f_lineno}))).splitlines(keepends=True)
 
 
 #
@@ -35,7 +38,7 @@ class BaseFormatter(logging.Formatter):
 class BriefStyler(logging.StrFormatStyle):
     def format(self, record):
         _record = dict(record.__dict__)
-        _record['pathname'] = os.path.relpath(os.path.abspath(_record['pathname']), os.environ.get('BASEDIR', ''))
+        _record['pathname'] = relative_path(_record['pathname'])
         return self._fmt.format(**_record)
 
 class ConsoleStyler(BriefStyler):
@@ -52,9 +55,11 @@ class ConsoleStyler(BriefStyler):
 class DetailedStyler(logging.StrFormatStyle):
     def format(self, record):
         _record = dict(record.__dict__)
-        _record['pathname'] = os.path.relpath(os.path.abspath(_record['pathname']),
-                                              os.environ.get('BASEDIR', ''))
-        _record['traceback'] = ''.join(produce_trace())
+        _record['pathname'] = relative_path(_record['pathname'])
+        # The stack is only captured for the records that reach the detailed handler.
+        # Queued records carry the stack of their log call (see handlers.py)
+        stack = _record.get('trace_stack') or capture_stack(record)
+        _record['traceback'] = traces.format(stack)
         return self._fmt.format(**_record)
 
 
@@ -87,23 +92,44 @@ DetailedFormatter = BaseFormatter(
 
 class Logger:
     def __init__(self, name, reload: bool = False, brief_log_file: str = None, detailed_log_file: str = None,
-                 do_console: bool = None, do_brief: bool = None, do_detailed: bool = None):
+                 structured_log_file: str = None, do_console: bool = None, do_brief: bool = None,
+                 do_detailed: bool = None, do_structured: bool = None, do_queue: bool = None, queue_size: int = None,
+                 do_throttle: bool = None):
         self.name = name
         do_console = do_console or os.environ.get('LOG_DO_CONSOLE', True)
         do_brief = do_brief or os.environ.get('LOG_DO_BRIEF', False)
         do_detailed = do_detailed or os.environ.get('LOG_DO_DETAILED', False)
+        do_structured = do_structured or os.environ.get('LOG_DO_STRUCTURED', False)
+        do_queue = do_queue or bool(int(os.environ.get('LOG_DO_QUEUE', '0')))
+        queue_size = queue_size or int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+        if do_throttle is None:
+            do_throttle = bool(int(os.environ.get('LOG_DO_THROTTLE', '0'))) or \
+                getattr(self.log_settings('throttle'), 'enabled', False)
 
         self.logger = logging.getLogger(name)
         self.logger.setLevel(logging.DEBUG)
 
-        self.logger.handlers = []  # This is needed for a re-load
+        # This is needed for a re-load. Pending summaries are logged while the handlers are still there.
+        if getattr(self, 'throttle', None): self.throttle.flush()
+        if getattr(self, 'writer', None): self.writer.stop()
+        self.writer: QueueWriter = None
+        self.throttle: RateLimitFilter = None
+        self.logger.handlers = []
+        self.logger.filters = []
 
         if do_brief:
             self.brief_path = self.check_path('brief', brief_log_file)
             self.add_brief_handler(self.brief_path)
 
         if do_detailed: self.add_detailed_handler(self.check_path('detailed', detailed_log_file))
+        if do_structured: self.add_structured_handler(self.check_path('structured', structured_log_file))
         if do_console: self.add_console_handler()
+        if do_throttle: self.add_throttle()
+        # Handlers are moved to a background writer, log calls only enqueue the records
+        if do_queue: self.enable_queue(queue_size)
+        # A single exit handler per logger, whatever the number of reloads (see close)
+        atexit.unregister(self.close)
+        atexit.register(self.close)
 
         if reload or not bool(int(os.environ.get('LOG_SESSION_STARTED', '0'))):
             os.environ['LOG_SESSION_STARTED'] = '1'
@@ -118,27 +144,92 @@ class Logger:
 
     def add_brief_handler(self, file):
         # create file handler which logs even debug messages
-        fh = logging.FileHandler(file)
+        fh = BatchFileHandler(file)
         fh.setLevel(logging.DEBUG)
         fh.setFormatter(BriefFormatter)
         self.logger.addHandler(fh)
 
     def add_detailed_handler(self, file):
         # file handler that includes detailed traceback
-        dfh = logging.FileHandler(file)
+        dfh = BatchFileHandler(file)
         dfh.setLevel(logging.WARNING)
         dfh.setFormatter(DetailedFormatter)
         self.logger.addHandler(dfh)
 
+    def add_structured_handler(self, file):
+        # JSON lines or binary records, rotated and compressed (see structured.py)
+        sfh = StructuredFileHandler(file, **self.structured_options())
+        sfh.setLevel(logging.DEBUG)
+        self.logger.addHandler(sfh)
+
+    @staticmethod
+    def log_settings(name: str):
+        """
+        settings.log.<name>, or None if the settings are not loaded (options fall back to their defaults).
+        The settings are not imported from here, since they import modules that use the logger:
+        the App reloads the logger once they are loaded.
+        """
+        settings = sys.modules.get('savannah.core.settings')
+        return getattr(getattr(settings, 'log', None), name, None)
+
+    def structured_options(self) -> dict:
+        options = self.log_settings('structured')
+        return {
+            'fmt': getattr(options, 'format', 'jsonl'),
+            'max_bytes': getattr(options, 'max_bytes', 10 * 2 ** 20),
+            'interval': getattr(options, 'interval', 86400),
+            'compress': getattr(options, 'compress', True),
+            'retention_bytes': getattr(options, 'retention_bytes', 100 * 2 ** 20),
+        }
+
     def add_console_handler(self):
         # create console handler with a higher log level
-        ch = logging.StreamHandler()
+        ch = BatchStreamHandler()
         ch.setLevel(logging.INFO)
         ch.setFormatter(ConsoleFormatter)
         self.logger.addHandler(ch)
 
+    def add_throttle(self):
+        # Records of a call site beyond its rate are dropped before being formatted or queued
+        from savannah.core.extensions.tupperware import unbox
+        options = self.log_settings('throttle')
+        modules = getattr(options, 'modules', None)
+        exempt_level = getattr(options, 'exempt_level', 'ERROR')
+        self.throttle = RateLimitFilter(rate=getattr(options, 'rate', 5.), burst=getattr(options, 'burst', 20.),
+                                        summary_interval=getattr(options, 'summary_interval', 60.),
+                                        modules=unbox(modules) if modules else None,
+                                        exempt_level=logging.getLevelName(exempt_level)
+                                        if isinstance(exempt_level, str) else exempt_level)
+        self.logger.addFilter(self.throttle)
+
+    def enable_queue(self, queue_size: int = 10000) -> QueueWriter:
+        handlers, self.logger.handlers = self.logger.handlers, []
+        self.writer = QueueWriter(handlers, maxsize=queue_size).start()
+        # Only the detailed handler uses the stack of the log call
+        trace_level = min((h.level for h in handlers if h.formatter is DetailedFormatter), default=None)
+        self.logger.addHandler(self.writer.handler(trace_level))
+        return self.writer
+
+    @property
+    def queue_connection(self):
+        """
+        Arguments of attach_queue to log to this queue from another process (None if not queued).
+        """
+        handlers = self.logger.handlers
+        return handlers[0].connection if handlers and isinstance(handlers[0], BoundedQueueHandler) else None
+
     def reload(self): self.__init__(self.name, reload=True)
 
+    def close(self, timeout: float = 5.) -> None:
+        """
+        Logs the pending throttling summaries, writes the pending records and stops the writer. Called at exit.
+        """
+        # At exit, streams such as the ones of pytest's capture may already be closed
+        for handlers in (self.logger.handlers, self.writer.handlers if self.writer else []):
+            handlers[:] = [h for h in handlers if not getattr(getattr(h, 'stream', None), 'closed', False)]
+        if self.throttle: self.throttle.flush()
+        if self.writer: self.writer.stop(timeout)
+
     #
     # Path validity checker
     @staticmethod
@@ -148,7 +239,7 @@ class Logger:
 
         try:
             from savannah.core import settings
-            _path = os.path.join(settings.BASEDIR, settings.log._asdict().get(_type)._asdict().get("path"), '{}.log'.format(_type))
+            _path = os.path.join(settings.BASEDIR, getattr(settings.log, _type).path, '{}.log'.format(_type))
             _is = True
         except UndefinedEnvironment:
                 if not fallback_path:
@@ -165,3 +256,24 @@ class Logger:
 
 logger = Logger(__name__)
 empty_logger = logging.getLogger(__name__)
+
+
+#
+# Queued logging across processes
+#
+
+def attach_queue(record_queue, dropped, trace_level=None) -> None:
+    """
+    Replaces the handlers of the logger of this process with a handler to the queue of another process.
+    """
+    # A spawned process may have started its own writer when importing this module
+    if logger.writer: logger.writer.stop()
+    logger.logger.handlers = [BoundedQueueHandler(record_queue, dropped, trace_level)]
+
+
+def queued_target(target, queue_connection, *args, **kwargs):
+    """
+    Process target that logs to the queue of the parent process before running `target`.
+    """
+    attach_queue(*queue_connection)
+    return target(*args, **kwargs)
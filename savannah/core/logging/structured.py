@@ -0,0 +1,255 @@
+import datetime
+import functools
+import glob
+import gzip
+import json
+import logging
+import os
+import queue
+import shutil
+import struct
+import threading
+import time
+from typing import Iterator, List
+
+from .handlers import BatchFlushMixin
+
+__all__ = [
+    "relative_path", "StructuredFileHandler", "read_records", "FORMATS",
+]
+
+#
+# Structured log
+#
+# Records are written as JSON lines ('jsonl') or in a compact binary format ('binary'):
+#
+#   <length: u32> <created: f64> <levelno: u8> <lineno: u32> <process: u32>
+#   <path> <function> <thread> (u16 length + utf-8) <message> (u32 length + utf-8)
+#
+# The file is rotated by size and/or age. Closed segments are gzip-compressed by
+# a background thread, and the oldest ones are deleted when the segments take more
+# than the retention budget. read_records() reads any of them back.
+#
+
+FORMATS = ('jsonl', 'binary')
+
+_HEADER = struct.Struct('<dBII')
+_LENGTH = struct.Struct('<I')
+_SHORT = struct.Struct('<H')
+
+
+@functools.lru_cache(maxsize=1024)
+def _relative_path(pathname: str, basedir: str) -> str:
+    return os.path.relpath(os.path.abspath(pathname), basedir)
+
+
+def relative_path(pathname: str) -> str:
+    """
+    Path of a source file relative to BASEDIR, cached since there are only so many files.
+    """
+    return _relative_path(pathname, os.environ.get('BASEDIR', ''))
+
+
+def _message(record: logging.LogRecord) -> str:
+    message = record.getMessage()
+    if record.exc_info and not record.exc_text:
+        record.exc_text = logging.Formatter().formatException(record.exc_info)
+    if record.exc_text:
+        message = '{}\n{}'.format(message, record.exc_text)
+    return message
+
+
+def _encode_jsonl(record: logging.LogRecord) -> bytes:
+    return (json.dumps({
+        'time': record.created,
+        'level': record.levelname,
+        'path': relative_path(record.pathname),
+        'line': record.lineno,
+        'function': record.funcName,
+        'process': record.process,
+        'thread': record.threadName,
+        'message': _message(record),
+    }, separators=(',', ':')) + '\n').encode()
+
+
+def _encode_binary(record: logging.LogRecord) -> bytes:
+    out = bytearray(_LENGTH.size)
+    out += _HEADER.pack(record.created, record.levelno, record.lineno, record.process or 0)
+    for string in (relative_path(record.pathname), record.funcName or '', record.threadName or ''):
+        data = string.encode()[:0xffff]
+        out += _SHORT.pack(len(data)) + data
+    data = _message(record).encode()
+    out += _LENGTH.pack(len(data)) + data
+    _LENGTH.pack_into(out, 0, len(out) - _LENGTH.size)
+    return bytes(out)
+
+
+_ENCODERS = {'jsonl': _encode_jsonl, 'binary': _encode_binary}
+
+
+def _decode_binary(data: bytes) -> Iterator[dict]:
+    position = 0
+    while position + _LENGTH.size <= len(data):
+        length, = _LENGTH.unpack_from(data, position)
+        position += _LENGTH.size
+        end = position + length
+        if end > len(data): break  # Truncated record (e.g. power loss)
+
+        created, levelno, lineno, process = _HEADER.unpack_from(data, position)
+        position += _HEADER.size
+        strings = []
+        for size_struct in (_SHORT, _SHORT, _SHORT, _LENGTH):
+            size, = size_struct.unpack_from(data, position)
+            position += size_struct.size
+            strings.append(data[position:position + size].decode())
+            position += size
+        path, function, thread, message = strings
+        yield {'time': created, 'level': logging.getLevelName(levelno), 'path': path, 'line': lineno,
+               'function': function, 'process': process, 'thread': thread, 'message': message}
+        position = end
+
+
+def read_records(path: str, fmt: str = 'jsonl') -> Iterator[dict]:
+    """
+    Records of a log file or segment (compressed or not) as dicts.
+    """
+    with (gzip.open if path.endswith('.gz') else open)(path, 'rb') as file:
+        if fmt == 'binary':
+            yield from _decode_binary(file.read())
+        else:
+            for line in file:
+                if line.strip(): yield json.loads(line)
+
+
+class _Compressor:
+    """
+    Background thread that compresses closed segments, so that rotating does not block logging.
+    """
+
+    def __init__(self) -> None:
+        self.__jobs = queue.Queue()
+        self.__thread: threading.Thread = None
+        self.__lock = threading.Lock()
+
+    def submit(self, path: str, done=None) -> None:
+        with self.__lock:
+            if self.__thread is None or not self.__thread.is_alive():
+                self.__thread = threading.Thread(target=self.__run, name='LogCompressor', daemon=True)
+                self.__thread.start()
+        self.__jobs.put((path, done))
+
+    def join(self) -> None:
+        self.__jobs.join()
+
+    def __run(self) -> None:
+        while True:
+            path, done = self.__jobs.get()
+            try:
+                with open(path, 'rb') as source, gzip.open(path + '.gz.tmp', 'wb') as target:
+                    shutil.copyfileobj(source, target)
+                os.replace(path + '.gz.tmp', path + '.gz')
+                os.remove(path)
+                if done: done()
+            except OSError as exc:
+                logging.getLogger(__name__).warning("Log segment {} could not be compressed: {}".format(path, exc))
+            finally:
+                self.__jobs.task_done()
+
+
+_compressor = _Compressor()
+
+
+class StructuredFileHandler(BatchFlushMixin, logging.FileHandler):
+
+    def __init__(self, filename: str, fmt: str = 'jsonl', max_bytes: int = 0, interval: float = 0,
+                 compress: bool = True, retention_bytes: int = 0) -> None:
+        """
+        fmt: 'jsonl' or 'binary'.
+        max_bytes: size at which the file is rotated (0 for no limit).
+        interval: seconds after which the file is rotated (0 for no limit).
+        compress: gzip closed segments in the background.
+        retention_bytes: maximum size of the closed segments; the oldest are deleted (0 for no limit).
+        """
+        if fmt not in FORMATS:
+            raise ValueError("Unknown log format '{}'. Available: {}".format(fmt, ', '.join(FORMATS)))
+        super().__init__(filename, mode='ab', encoding=None)
+        self.fmt = fmt
+        self.encode = _ENCODERS[fmt]
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.compress = compress
+        self.retention_bytes = retention_bytes
+        self.__opened_at = time.time()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            data = self.encode(record)
+            if self.should_rotate(len(data)): self.rotate()
+            if self.stream is None: self.stream = self._open()
+            self.stream.write(data)
+            self.flush()
+        except Exception:
+            self.handleError(record)
+
+    #
+    # Rotation
+
+    def should_rotate(self, size: int = 0) -> bool:
+        if self.interval and time.time() - self.__opened_at >= self.interval:
+            return True
+        if self.max_bytes and self.stream is not None:
+            position = self.stream.tell()
+            return position > 0 and position + size > self.max_bytes
+        return False
+
+    def rotate(self) -> str:
+        """
+        Closes the current file as a segment and opens a new one. Returns the path of the segment.
+        """
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+        # Segment names sort chronologically
+        stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+        segment = '{}.{}'.format(self.baseFilename, stamp)
+        n = 0
+        while glob.glob(glob.escape(segment) + '*'):
+            n += 1
+            segment = '{}.{}-{}'.format(self.baseFilename, stamp, n)
+        if os.path.exists(self.baseFilename):
+            os.replace(self.baseFilename, segment)
+
+        self.stream = self._open()
+        self.__opened_at = time.time()
+        if self.compress: _compressor.submit(segment, done=self.enforce_retention)
+        else: self.enforce_retention()
+        return segment
+
+    def segments(self) -> List[str]:
+        """
+        Closed segments, from the oldest.
+        """
+        prefix = glob.escape(self.baseFilename) + '.'
+        return sorted(path for path in glob.glob(prefix + '*') if not path.endswith('.tmp'))
+
+    def enforce_retention(self) -> None:
+        if not self.retention_bytes: return
+        # Segments waiting for compression are left alone: they are counted once compressed
+        segments = [(path, os.path.getsize(path)) for path in self.segments()
+                    if os.path.exists(path) and (path.endswith('.gz') or not self.compress)]
+        total = sum(size for _, size in segments)
+        for path, size in segments:
+            if total <= self.retention_bytes: break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+    @staticmethod
+    def wait_compression() -> None:
+        """
+        Blocks until the segments rotated so far have been compressed.
+        """
+        _compressor.join()
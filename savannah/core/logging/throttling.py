@@ -0,0 +1,144 @@
+import logging
+import threading
+import time
+from typing import Dict, Mapping, Tuple, Union
+
+__all__ = [
+    "TokenBucket", "RateLimitFilter",
+]
+
+#
+# Log throttling
+#
+# A faulty driver sampling at 100+ Hz can log a warning per sample. The RateLimitFilter
+# keeps a token bucket per (logger, call site, message template): records beyond
+# the rate of their call site are dropped before they are formatted or enqueued,
+# and replaced by a summary record ("N records suppressed in the last 60s") every
+# summary interval, and when the filter is flushed (on logger reload and at exit).
+# Records of the exempt level (ERROR by default) and above are never throttled.
+#
+# Throttling is opt-in (settings.log.throttle.enabled or LOG_DO_THROTTLE=1).
+#
+# Limits can be set per module (the file name of the call site, e.g. 'drivers').
+#
+
+
+class TokenBucket:
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate: float, burst: float) -> None:
+        """
+        rate: tokens added per second.
+        burst: maximum number of tokens.
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, now: float = None) -> bool:
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class _CallSite:
+    __slots__ = ('bucket', 'suppressed', 'since', 'record')
+
+    def __init__(self, bucket: Union[TokenBucket, None]) -> None:
+        self.bucket = bucket
+        self.suppressed = 0
+        self.since: float = None
+        # Last suppressed record, used as template of the summary
+        self.record: logging.LogRecord = None
+
+
+class RateLimitFilter(logging.Filter):
+
+    def __init__(self, rate: float = 5., burst: float = 20., summary_interval: float = 60.,
+                 modules: Mapping[str, Mapping] = None, max_sites: int = 4096,
+                 exempt_level: Union[int, None] = logging.ERROR) -> None:
+        """
+        rate: records per second allowed for each call site (None for no limit).
+        burst: records allowed at once before the rate applies.
+        summary_interval: seconds between summaries of the suppressed records.
+        modules: {module: {'rate': ..., 'burst': ...}} limits that replace the defaults.
+        max_sites: maximum number of call sites tracked.
+        exempt_level: records of this level and above are never dropped (None to throttle all levels).
+        """
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.summary_interval = summary_interval
+        self.modules = {module: dict(limits) for module, limits in (modules or {}).items()}
+        self.max_sites = max_sites
+        self.exempt_level = exempt_level
+
+        self.__sites: Dict[tuple, _CallSite] = dict()
+        self.__lock = threading.Lock()
+        self.__next_summary = time.monotonic() + summary_interval
+
+    def limits(self, module: str) -> Tuple[Union[float, None], float]:
+        limits = self.modules.get(module, {})
+        return limits.get('rate', self.rate), limits.get('burst', self.burst)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, 'throttle_summary', False): return True
+        if self.exempt_level is not None and record.levelno >= self.exempt_level: return True
+
+        key = (record.name, record.pathname, record.lineno,
+               record.msg if isinstance(record.msg, str) else type(record.msg))
+        now = time.monotonic()
+        with self.__lock:
+            site = self.__sites.get(key)
+            if site is None:
+                if len(self.__sites) >= self.max_sites: self.__forget()
+                rate, burst = self.limits(record.module)
+                site = self.__sites[key] = _CallSite(TokenBucket(rate, burst) if rate is not None else None)
+
+            allowed = site.bucket is None or site.bucket.take(now)
+            if not allowed:
+                if not site.suppressed: site.since = now
+                site.suppressed += 1
+                site.record = record
+            summaries = self.__summaries(now) if now >= self.__next_summary else None
+
+        if summaries:
+            for summary in summaries: logging.getLogger(summary.name).handle(summary)
+        return allowed
+
+    def flush(self) -> None:
+        """
+        Logs the summaries of the records suppressed so far.
+        """
+        with self.__lock:
+            summaries = self.__summaries(time.monotonic())
+        for summary in summaries: logging.getLogger(summary.name).handle(summary)
+
+    def __summaries(self, now: float) -> list:
+        self.__next_summary = now + self.summary_interval
+        summaries = []
+        for site in self.__sites.values():
+            if site.suppressed:
+                summaries.append(self.__summary(site, now))
+                site.suppressed, site.record = 0, None
+        return summaries
+
+    @staticmethod
+    def __summary(site: _CallSite, now: float) -> logging.LogRecord:
+        record = site.record
+        created = time.time()
+        return logging.makeLogRecord(dict(
+            record.__dict__, args=None, exc_info=None, exc_text=None, stack_info=None, throttle_summary=True,
+            created=created, msecs=(created - int(created)) * 1000,
+            msg="{} records suppressed in the last {:.0f}s (rate limit): {}".format(
+                site.suppressed, now - site.since, record.msg),
+        ))
+
+    def __forget(self) -> None:
+        # Call sites with pending summaries are kept
+        self.__sites = {key: site for key, site in self.__sites.items() if site.suppressed}
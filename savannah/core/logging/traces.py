@@ -0,0 +1,85 @@
+import linecache
+import sys
+import threading
+import time
+from typing import Tuple, Dict
+
+__all__ = [
+    "capture_stack", "format_stack", "TraceDeduplicator", "traces",
+]
+
+#
+# Stack traces of the detailed log
+#
+# The stack of a log call is captured (only for the records that reach the detailed handler)
+# as a tuple of (filename, lineno, function) by walking the frames from the log call,
+# which is much cheaper than traceback.format_stack and can be pickled (queued logging).
+# Source lines are only read when the trace is written, and traces seen shortly before
+# are written as a one-line summary.
+#
+
+# (filename, lineno, function name), from the outermost frame
+Stack = Tuple[Tuple[str, int, str], ...]
+
+MAX_DEPTH = 64
+
+
+def capture_stack(record, depth: int = MAX_DEPTH) -> Stack:
+    """
+    Stack of the log call of `record`. Must be called from within the log call (handler or filter).
+    """
+    frame = sys._getframe(1)
+    while frame is not None and (frame.f_lineno != record.lineno or frame.f_code.co_filename != record.pathname):
+        frame = frame.f_back
+
+    stack = []
+    while frame is not None and len(stack) < depth:
+        stack.append((frame.f_code.co_filename, frame.f_lineno, frame.f_code.co_name))
+        frame = frame.f_back
+    stack.reverse()
+    return tuple(stack)
+
+
+def format_stack(stack: Stack) -> str:
+    lines = ['*Traceback* (most recent call last):\n']
+    for filename, lineno, name in stack:
+        lines.append('  File "{}", line {}, in {}\n'.format(filename, lineno, name))
+        line = linecache.getline(filename, lineno).strip()
+        if line: lines.append('    {}\n'.format(line))
+    return ''.join(lines)
+
+
+class TraceDeduplicator:
+
+    def __init__(self, window: float = 60., max_traces: int = 1024) -> None:
+        """
+        window: seconds during which a trace already written is only summarized.
+        max_traces: maximum number of different traces remembered.
+        """
+        self.window = window
+        self.max_traces = max_traces
+        # stack: [time written, times seen since]
+        self.__seen: Dict[Stack, list] = dict()
+        self.__lock = threading.Lock()
+
+    def format(self, stack: Stack) -> str:
+        if not stack: return ''
+        now = time.monotonic()
+        with self.__lock:
+            seen = self.__seen.get(stack)
+            if seen is not None and now - seen[0] < self.window:
+                seen[1] += 1
+                return '*Traceback*: same trace seen {} times in the last {:.0f}s\n'.format(seen[1] + 1, now - seen[0])
+            if len(self.__seen) >= self.max_traces:
+                self.__seen = {k: v for k, v in self.__seen.items() if now - v[0] < self.window}
+                if len(self.__seen) >= self.max_traces: del self.__seen[next(iter(self.__seen))]
+            self.__seen[stack] = [now, 0]
+        return format_stack(stack)
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__seen.clear()
+
+
+# Used by the DetailedStyler
+traces = TraceDeduplicator()
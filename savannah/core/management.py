@@ -1,4 +1,5 @@
 import argparse
+import importlib
 import sys
 from os import environ
 from os.path import dirname
@@ -6,7 +7,6 @@ import traceback
 from typing import Mapping, Iterable
 
 from savannah.core.interpreter import AbstractBaseInterpreter
-from savannah.core import actions
 
 #
 # Recognise commands
@@ -20,7 +20,7 @@ def execute_from_command_line(argv):
 
     environ['SAVANNAH_BASEDIR'] = dirname(argv[0])
 
-    interpreter = CLInterpreter()
+    interpreter = CLInterpreter(command=argv[1] if len(argv) > 1 else None)
     try:
         interpreter.run(argv[1:])
     except Exception as exc:
@@ -29,18 +29,34 @@ def execute_from_command_line(argv):
 
 
 class CLInterpreter(AbstractBaseInterpreter):
+    """
+    Commands are mapped as 'module:Class' paths, relative to savannah.core.actions.
+    Only the module of the command being run is imported (all of them to show the help).
+    """
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, command: str = None, **kwargs):
+        self.command = command
         if args or kwargs: super().__init__(*args, **kwargs)
         else: super().__init__(prog='manage.py')
 
     def __map__(self):
         self.mapped_commands.update({
-            'run': actions.run.Run,
-            'create-settings': actions.create_settings.CreateSettings,
-            'test': actions.test.Test
+            'run': 'run:Run',
+            'create-settings': 'create_settings:CreateSettings',
+            'test': 'test:Test',
+            'coldstart': 'coldstart:ColdStart',
+            'profile': 'profile:Profile',
+            'bench': 'bench:Bench',
         })
 
+    def command_class(self, command_name: str):
+        command_class = self.mapped_commands[command_name]
+        if isinstance(command_class, str):
+            module_name, class_name = command_class.split(':')
+            module = importlib.import_module('savannah.core.actions.' + module_name)
+            command_class = self.mapped_commands[command_name] = getattr(module, class_name)
+        return command_class
+
     def __configure__(self):
         from savannah import __version__, __name__
 
@@ -49,8 +65,9 @@ class CLInterpreter(AbstractBaseInterpreter):
                                     help="Show program's version number and exit.")
 
         subparsers = self.parser.add_subparsers(help='Command to be executed by the manager.')
-        # The following line binds all the command classes as subparsers
-        for command_class in self.mapped_commands.values(): command_class(subparsers)
+        # The following line binds the command classes as subparsers
+        names = [self.command] if self.command in self.mapped_commands else list(self.mapped_commands)
+        for name in names: self.command_class(name)(subparsers)
 
     def __parse__(self, content: Iterable, *args, **kwargs) -> argparse.Namespace:
         # content[0] contains the command name, content[1:] contains the command arguments
@@ -68,5 +85,5 @@ class CLInterpreter(AbstractBaseInterpreter):
         return command_name, command_arguments
 
     def __execute__(self, method_name: str, kwargs: Mapping):
-        return self.mapped_commands[method_name].action(**kwargs)
+        return self.command_class(method_name).action(**kwargs)
 
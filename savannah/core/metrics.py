@@ -0,0 +1,401 @@
+#
+# Metrics
+#
+# Counters, gauges and latency histograms of the running units (sample rates,
+# loop jitter, request latency, bytes served...), kept in a process-wide registry:
+#
+#   SAMPLES = metrics.counter('samples_total', 'Samples taken.', sensor='temperature')
+#   SAMPLES.inc()
+#
+# Counters and histograms are updated on hot paths (every sample, every request),
+# so each thread writes to its own shard without locking and shards are merged on read.
+# Histograms use log-linear buckets (as HDR histograms do): quantiles have a
+# relative error below 1/SUB_BUCKETS whatever the magnitude of the values.
+#
+# The registry is read with snapshot(), the 'metrics' interpreter command,
+# or in the Prometheus text format (prometheus(), MetricsServer).
+#
+
+import math
+import os
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Tuple, Union
+
+__all__ = [
+    "Counter", "Gauge", "Histogram", "MetricsRegistry", "MetricsServer",
+    "registry", "counter", "gauge", "histogram", "unregister", "snapshot", "prometheus",
+    "cpu_seconds", "resident_memory",
+]
+
+
+class _Sharded:
+    """
+    Per-thread shards, created on the first update of each thread and merged on read.
+    The shards of finished threads are folded into a retired shard when read.
+    """
+
+    def __init__(self) -> None:
+        self.__local = threading.local()
+        self.__shards: List[tuple] = []
+        self.__retired = self._new_shard()
+        self.__lock = threading.Lock()
+
+    def _new_shard(self):
+        raise NotImplementedError
+
+    @staticmethod
+    def _fold(into, shard) -> None:
+        raise NotImplementedError
+
+    def _shard(self):
+        try:
+            return self.__local.shard
+        except AttributeError:
+            shard = self.__local.shard = self._new_shard()
+            with self.__lock:
+                self.__shards.append((threading.current_thread(), shard))
+            return shard
+
+    @property
+    def _shards(self) -> tuple:
+        with self.__lock:
+            alive = []
+            for thread, shard in self.__shards:
+                if thread.is_alive(): alive.append((thread, shard))
+                else: self._fold(self.__retired, shard)
+            self.__shards = alive
+            return (self.__retired, *(shard for _, shard in alive))
+
+
+class Counter(_Sharded):
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str = '', labels: Dict[str, str] = None) -> None:
+        super().__init__()
+        self.name = name
+        self.help = help
+        self.labels = labels or {}
+
+    def _new_shard(self):
+        return [0]
+
+    @staticmethod
+    def _fold(into, shard) -> None:
+        into[0] += shard[0]
+
+    def inc(self, amount: Union[int, float] = 1) -> None:
+        self._shard()[0] += amount
+
+    @property
+    def value(self) -> Union[int, float]:
+        return sum(shard[0] for shard in self._shards)
+
+    def snapshot(self):
+        return self.value
+
+
+class Gauge:
+    kind = 'gauge'
+
+    def __init__(self, name: str, help: str = '', labels: Dict[str, str] = None, func: Callable = None) -> None:
+        """
+        func: callable that returns the value when read (e.g. the size of a queue).
+        """
+        self.name = name
+        self.help = help
+        self.labels = labels or {}
+        self.func = func
+        self.__value = 0
+
+    def set(self, value: Union[int, float]) -> None:
+        self.__value = value
+
+    @property
+    def value(self) -> Union[int, float]:
+        if self.func is None: return self.__value
+        try:
+            return self.func()
+        except Exception:
+            return float('nan')
+
+    def snapshot(self):
+        return self.value
+
+
+# Each power of two is split in SUB_BUCKETS buckets.
+SUB_BUCKETS = 16
+
+
+def _bucket(value: float) -> int:
+    if value <= 0: return -2 ** 31
+    mantissa, exponent = math.frexp(value)  # value = mantissa * 2**exponent, mantissa in [0.5, 1)
+    return exponent * SUB_BUCKETS + int((mantissa - .5) * 2 * SUB_BUCKETS)
+
+
+def _bucket_value(index: int) -> float:
+    """
+    Middle value of a bucket.
+    """
+    if index == -2 ** 31: return 0.
+    exponent, sub = divmod(index, SUB_BUCKETS)
+    return math.ldexp(.5 + (sub + .5) / (2 * SUB_BUCKETS), exponent)
+
+
+class Histogram(_Sharded):
+    kind = 'histogram'
+    quantiles = (.5, .9, .99)
+
+    def __init__(self, name: str, help: str = '', labels: Dict[str, str] = None) -> None:
+        super().__init__()
+        self.name = name
+        self.help = help
+        self.labels = labels or {}
+
+    def _new_shard(self):
+        # [count, sum, min, max, {bucket: count}]
+        return [0, 0., math.inf, -math.inf, {}]
+
+    @staticmethod
+    def _fold(into, shard) -> None:
+        into[0] += shard[0]
+        into[1] += shard[1]
+        into[2], into[3] = min(into[2], shard[2]), max(into[3], shard[3])
+        for index, n in shard[4].items():
+            into[4][index] = into[4].get(index, 0) + n
+
+    def observe(self, value: float) -> None:
+        shard = self._shard()
+        shard[0] += 1
+        shard[1] += value
+        if value < shard[2]: shard[2] = value
+        if value > shard[3]: shard[3] = value
+        buckets = shard[4]
+        index = _bucket(value)
+        buckets[index] = buckets.get(index, 0) + 1
+
+    def time(self) -> '_Timer':
+        """
+        Context manager that observes the seconds spent in its block.
+        """
+        return _Timer(self)
+
+    def merged(self) -> Tuple[int, float, float, float, Dict[int, int]]:
+        merged = self._new_shard()
+        for shard in self._shards:
+            # The buckets of a running thread may change while they are read
+            self._fold(merged, shard[:4] + [dict(shard[4])])
+        return tuple(merged)
+
+    @staticmethod
+    def quantile(buckets: Dict[int, int], count: int, q: float) -> float:
+        if not count: return float('nan')
+        rank, seen = q * count, 0
+        for index in sorted(buckets):
+            seen += buckets[index]
+            if seen >= rank: return _bucket_value(index)
+        return _bucket_value(max(buckets))
+
+    def snapshot(self) -> dict:
+        count, total, low, high, buckets = self.merged()
+        result = {'count': count, 'sum': total,
+                  'min': low if count else float('nan'), 'max': high if count else float('nan')}
+        for q in self.quantiles:
+            result['p{:g}'.format(q * 100)] = self.quantile(buckets, count, q)
+        return result
+
+
+class _Timer:
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram: Histogram) -> None:
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+#
+# Registry
+#
+
+class MetricsRegistry:
+
+    def __init__(self) -> None:
+        self.__metrics: Dict[tuple, Union[Counter, Gauge, Histogram]] = dict()
+        self.__lock = threading.Lock()
+
+    def __get(self, cls, name: str, help: str, labels: dict, **kwargs):
+        key = (name, tuple(sorted(labels.items())))
+        metric = self.__metrics.get(key)
+        if metric is None:
+            with self.__lock:
+                metric = self.__metrics.get(key)
+                if metric is None:
+                    metric = self.__metrics[key] = cls(name, help, labels, **kwargs)
+        if not isinstance(metric, cls):
+            raise TypeError("Metric {} is a {}, not a {}.".format(name, metric.kind, cls.kind))
+        return metric
+
+    def counter(self, name: str, help: str = '', **labels) -> Counter:
+        return self.__get(Counter, name, help, labels)
+
+    def gauge(self, name: str, help: str = '', func: Callable = None, **labels) -> Gauge:
+        gauge = self.__get(Gauge, name, help, labels)
+        if func is not None: gauge.func = func
+        return gauge
+
+    def histogram(self, name: str, help: str = '', **labels) -> Histogram:
+        return self.__get(Histogram, name, help, labels)
+
+    def unregister(self, name: str, **labels) -> None:
+        with self.__lock:
+            self.__metrics.pop((name, tuple(sorted(labels.items()))), None)
+
+    @property
+    def metrics(self) -> tuple:
+        with self.__lock:
+            return tuple(self.__metrics.values())
+
+    def snapshot(self) -> dict:
+        """
+        {name: value} or {name: {labels: value}} for labelled metrics, where labels is 'key=value,...'.
+        """
+        result = {}
+        for metric in self.metrics:
+            value = metric.snapshot()
+            if metric.labels:
+                labels = ','.join('{}={}'.format(k, v) for k, v in sorted(metric.labels.items()))
+                result.setdefault(metric.name, {})[labels] = value
+            else:
+                result[metric.name] = value
+        return result
+
+    def prometheus(self) -> str:
+        """
+        Metrics in the Prometheus text exposition format. Histograms are exposed as summaries.
+        """
+        lines, described = [], set()
+        for metric in sorted(self.metrics, key=lambda m: m.name):
+            name = 'savannah_' + metric.name
+            if name not in described:
+                described.add(name)
+                if metric.help: lines.append('# HELP {} {}'.format(name, metric.help))
+                lines.append('# TYPE {} {}'.format(name, 'summary' if metric.kind == 'histogram' else metric.kind))
+            if metric.kind == 'histogram':
+                count, total, _, _, buckets = metric.merged()
+                for q in metric.quantiles:
+                    labels = _labels(dict(metric.labels, quantile='{:g}'.format(q)))
+                    lines.append('{}{} {}'.format(name, labels, _number(metric.quantile(buckets, count, q))))
+                lines.append('{}_sum{} {}'.format(name, _labels(metric.labels), _number(total)))
+                lines.append('{}_count{} {}'.format(name, _labels(metric.labels), count))
+            else:
+                lines.append('{}{} {}'.format(name, _labels(metric.labels), _number(metric.value)))
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels: dict) -> str:
+    if not labels: return ''
+    return '{' + ','.join('{}="{}"'.format(k, str(v).replace('\\', r'\\').replace('"', r'\"'))
+                          for k, v in sorted(labels.items())) + '}'
+
+
+def _number(value) -> str:
+    if isinstance(value, float):
+        if math.isnan(value): return 'NaN'
+        if math.isinf(value): return '+Inf' if value > 0 else '-Inf'
+    return repr(value)
+
+
+registry = MetricsRegistry()
+counter = registry.counter
+gauge = registry.gauge
+histogram = registry.histogram
+unregister = registry.unregister
+snapshot = registry.snapshot
+prometheus = registry.prometheus
+
+
+#
+# Process
+#
+
+def cpu_seconds() -> float:
+    """
+    CPU time (user + system) of the process, all threads included.
+    """
+    return time.process_time()
+
+
+def resident_memory() -> int:
+    """
+    Resident set size of the process in bytes (peak resident size where it cannot be read, NaN on Windows).
+    """
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return float('nan')
+    # ru_maxrss is in kilobytes, except on macOS (bytes)
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+try:
+    _PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError, OSError):
+    _PAGE_SIZE = 4096
+
+
+#
+# Prometheus endpoint
+#
+
+class MetricsServer:
+    """
+    HTTP server that serves the registry in the Prometheus text format at /metrics.
+    """
+
+    def __init__(self, host: str, port: int, metrics_registry: MetricsRegistry = registry) -> None:
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/metrics', '/'):
+                    self.send_error(404)
+                    return
+                body = metrics_registry.prometheus().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.__thread: threading.Thread = None
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        return self.server.server_address[:2]
+
+    def run(self) -> None:
+        self.__thread = threading.Thread(target=self.server.serve_forever, name='MetricsServer', daemon=True)
+        self.__thread.start()
+
+    def close(self, timeout: float = None) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        if self.__thread: self.__thread.join(timeout)
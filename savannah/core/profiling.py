@@ -0,0 +1,191 @@
+#
+# Profiling
+#
+# A profiling mode that can be switched on and off while the app runs
+# (the 'profile' interpreter command, SIGUSR2, or `manage.py profile`):
+#
+#   - Spans: hot-path functions decorated with @profiled(name) are timed into
+#     the 'profile_span_seconds' histograms of the metrics registry.
+#     While profiling is off the decorator costs one attribute check.
+#   - Stack sampling: a thread samples the stacks of all the other threads
+#     (sys._current_frames) at a fixed interval and counts them.
+#
+# The report is written as collapsed stacks ('thread;outer;...;inner count' lines),
+# which flamegraph.pl, speedscope and inferno read, plus a JSON file with the spans.
+#
+
+import collections
+import functools
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from typing import Callable, Dict
+
+from savannah.core import metrics
+
+__all__ = [
+    "Profiler", "profiler", "profiled", "install_signal", "MIN_INTERVAL",
+]
+
+# Shortest interval between stack samples: shorter ones would keep a core busy sampling
+MIN_INTERVAL = .001
+
+
+class Profiler:
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.interval = .01
+        self.started: float = None
+        self.stopped: float = None
+        self.samples = 0
+        self.stacks: Dict[str, int] = collections.Counter()
+        self.__spans: Dict[str, metrics.Histogram] = dict()
+        self.__thread: threading.Thread = None
+        self.__stop = threading.Event()
+        # Reentrant: the signal handler may run while the main thread holds it
+        self.__lock = threading.RLock()
+        # Held by the sampler thread while it counts stacks, and by readers while they copy them
+        self.__stacks_lock = threading.Lock()
+
+    #
+    # Spans
+
+    def span(self, name: str) -> metrics.Histogram:
+        histogram = self.__spans.get(name)
+        if histogram is None:
+            histogram = self.__spans[name] = metrics.histogram(
+                'profile_span_seconds', 'Time spent in profiled functions (while profiling).', span=name)
+        return histogram
+
+    #
+    # Control
+
+    def start(self, interval: float = .01) -> bool:
+        """
+        Starts profiling, with a stack sample every `interval` seconds. Returns False if it was already started.
+        """
+        if not interval >= MIN_INTERVAL:
+            raise ValueError("The profiling interval must be at least {} seconds.".format(MIN_INTERVAL))
+        with self.__lock:
+            if self.enabled: return False
+            self.interval = interval
+            self.started = time.monotonic()
+            self.stopped = None
+            self.samples = 0
+            self.stacks = collections.Counter()
+            self.__stop.clear()
+            self.__thread = threading.Thread(target=self.__sample, name='StackSampler', daemon=True)
+            self.__thread.start()
+            self.enabled = True
+            return True
+
+    def stop(self, timeout: float = None) -> bool:
+        """
+        Stops profiling. The samples are kept until it is started again. Returns False if it was not started.
+        """
+        with self.__lock:
+            if not self.enabled: return False
+            self.enabled = False
+            self.stopped = time.monotonic()
+            self.__stop.set()
+            self.__thread.join(timeout)
+            return True
+
+    def toggle(self) -> bool:
+        if self.enabled: self.stop()
+        else: self.start(self.interval)
+        return self.enabled
+
+    #
+    # Stack sampling
+
+    def __sample(self) -> None:
+        own = threading.get_ident()
+        while not self.__stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            stacks = [self.collapse(names.get(ident, str(ident)), frame)
+                      for ident, frame in sys._current_frames().items() if ident != own]
+            with self.__stacks_lock:
+                for stack in stacks:
+                    self.stacks[stack] += 1
+                self.samples += 1
+
+    def snapshot(self) -> collections.Counter:
+        """
+        Copy of the stacks counted so far, safe to iterate while profiling.
+        """
+        with self.__stacks_lock:
+            return collections.Counter(self.stacks)
+
+    @staticmethod
+    def collapse(thread_name: str, frame) -> str:
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append('{} ({}:{})'.format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+            frame = frame.f_back
+        stack.append(thread_name.replace(';', ':'))
+        return ';'.join(reversed(stack))
+
+    #
+    # Report
+
+    def report(self, top: int = 20) -> dict:
+        spans = metrics.snapshot().get('profile_span_seconds', {})
+        return {
+            'enabled': self.enabled,
+            'interval': self.interval,
+            'duration': (self.stopped or time.monotonic()) - self.started if self.started is not None else 0.,
+            'samples': self.samples,
+            'spans': spans,
+            'top_stacks': [[stack, count] for stack, count in self.snapshot().most_common(top)],
+        }
+
+    def collapsed(self) -> str:
+        return ''.join('{} {}\n'.format(stack, count) for stack, count in sorted(self.snapshot().items()))
+
+    def write(self, path: str) -> tuple:
+        """
+        Writes the collapsed stacks to `path` and the report (with the spans) to `path`.json.
+        """
+        with open(path, 'w') as file:
+            file.write(self.collapsed())
+        with open(path + '.json', 'w') as file:
+            json.dump(self.report(top=50), file, indent=2, default=str)
+        return path, path + '.json'
+
+
+profiler = Profiler()
+
+
+def profiled(name: str) -> Callable:
+    """
+    Times the decorated function into the span `name` while profiling is enabled.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not profiler.enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profiler.span(name).observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def install_signal(signum: int = getattr(signal, 'SIGUSR2', None)) -> bool:
+    """
+    Toggles profiling when the process receives `signum` (SIGUSR2 by default, POSIX only).
+    Must be called from the main thread. Returns False if signals are not available.
+    """
+    if signum is None or threading.current_thread() is not threading.main_thread():
+        return False
+    signal.signal(signum, lambda *_: profiler.toggle())
+    return True
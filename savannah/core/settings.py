@@ -9,7 +9,7 @@
 #
 
 import os
-from savannah.core.extensions.config import Configuration
+from savannah.core.extensions.config import Configuration, ConfigWatcher
 from savannah.core.exceptions import UndefinedEnvironment
 from savannah.core import get_basedir
 
@@ -24,3 +24,41 @@ _config_obj = Configuration(config_path=CONFIG_PATH)
 workflow = None; enabled_sensors = None; info = None; log = None
 
 globals().update(_config_obj.data._asdict())
+
+
+def _update_globals(changes):
+    globals().update(_config_obj.data._asdict())
+
+# Registered first, so that the module is up to date when the rest of listeners are notified.
+_config_obj.subscribe(_update_globals)
+_watcher: ConfigWatcher = None
+
+
+def subscribe(listener):
+    """
+    Registers a callable that receives the list of changes (SettingsChange) when settings.json is reloaded.
+    """
+    _config_obj.subscribe(listener)
+
+
+def unsubscribe(listener):
+    _config_obj.unsubscribe(listener)
+
+
+def watch(interval: float = 1.) -> ConfigWatcher:
+    """
+    Starts watching settings.json (if not already watching): changes are applied to this
+    module and published to the subscribers without restarting.
+    """
+    global _watcher
+    if _watcher is None or not _watcher.is_running:
+        _watcher = ConfigWatcher(_config_obj, interval=interval)
+        _watcher.start()
+    return _watcher
+
+
+def unwatch(timeout: float = None):
+    global _watcher
+    if _watcher is not None:
+        _watcher.stop(timeout=timeout)
+        _watcher = None
@@ -63,16 +63,50 @@ class Workflow(NamedTuple):
 
     localui: LocalUI = LocalUI()
 
+
+    class HotReload(NamedTuple):                    # Applies changes of settings.json without restarting.
+        enabled: bool = True
+        interval: float = 1.                        # Seconds between checks of the file
+    hot_reload: HotReload = HotReload()
+
+
+    class Metrics(NamedTuple):                      # Metrics of the server (see the 'metrics' command).
+
+        class Prometheus(NamedTuple):               # Serves the metrics at http://<host>:<port>/metrics
+
+            class Address(NamedTuple):
+                host: str = 'local'
+                port: int = 9100
+            address: Address = Address()
+            enabled: bool = False
+
+        prometheus: Prometheus = Prometheus()
+    metrics: Metrics = Metrics()
+
+
+    class Processes(NamedTuple):                    # Unit processes configuration.
+        start_method: Union[None, str] = None       # 'fork', 'spawn', 'forkserver' or None for the default
+        preload: list = []                          # Modules imported once for all processes (fork/forkserver)
+    processes: Processes = Processes()
+
 workflow: Workflow = Workflow()
 
 class Sensors(NamedTuple):
-    # Drivers for enabled sensors must be defined in drivers.py
+    # Drivers for enabled sensors must be defined in drivers.py,
+    # or be built-in (synthetic sensors, see savannah.sampling.drivers)
     enabled_sensors: list = []
 
     class SensorSettings(NamedTuple):
         frequency: float = None
+        driver: str = None                          # Driver class, if the sensor is not named after it
+        pipeline: list = None                       # Processing stages (see sampling.processing)
 
     custom_settings: Dict[str, SensorSettings] = {}
+
+    class Group(NamedTuple):                        # Sensors sampled at the same instants (see sampling.groups)
+        sensors: list = []                          # Sensors of the group (not in enabled_sensors)
+        frequency: float = None
+    groups: Dict[str, Group] = {}
 sensors: Sensors = Sensors()
 
 class Log(NamedTuple):
@@ -82,6 +116,33 @@ class Log(NamedTuple):
 
     brief: LogType = LogType()
     detailed: LogType = LogType()
+
+
+    class Structured(NamedTuple):                   # JSON lines or binary records, for tools.
+        enabled: bool = False
+        path: str = 'logs/'
+        format: str = 'jsonl'                       # 'jsonl' or 'binary'
+        max_bytes: int = 10485760                   # Rotate when the file reaches this size (0 for no limit)
+        interval: float = 86400                     # Rotate after this many seconds (0 for no limit)
+        compress: bool = True                       # gzip rotated files
+        retention_bytes: int = 104857600            # Delete the oldest rotated files beyond this size
+    structured: Structured = Structured()
+
+
+    class Throttle(NamedTuple):                     # Rate limit of the records of each call site.
+        enabled: bool = False
+        rate: float = 5.                            # Records per second
+        burst: float = 20.                          # Records allowed at once before the rate applies
+        summary_interval: float = 60.               # Seconds between summaries of the suppressed records
+        modules: dict = {}                          # {"drivers": {"rate": 1, "burst": 5}} per module file name
+        exempt_level: str = 'ERROR'                 # Records of this level and above are never throttled
+    throttle: Throttle = Throttle()
+
+
+    class Queue(NamedTuple):                        # Log calls only enqueue, a background thread writes.
+        enabled: bool = False
+        size: int = 10000                           # Records held before new ones are dropped
+    queue: Queue = Queue()
 log: Log = Log()
 
 class Info(NamedTuple):
@@ -122,4 +183,8 @@ if __name__ == '__main__':
 # Here the rest of the variable definitions shall remain
 #
 
-get_basedir: function
\ No newline at end of file
+get_basedir: function
+subscribe: function
+unsubscribe: function
+watch: function
+unwatch: function
\ No newline at end of file
@@ -1 +1,3 @@
-from .interpreter import *
\ No newline at end of file
+from .interpreter import *
+from .streams import *
+from .cache import *
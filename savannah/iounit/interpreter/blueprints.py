@@ -7,7 +7,11 @@
 
 import json
 
+from savannah.core.interpreter import InvalidArgumentsError
+from savannah.sampling import clock
+
 from .interpreter import CPUInterpreter
+from .streams import Stream
 
 
 class JSONUpdatesMixin(CPUInterpreter):
@@ -15,17 +19,25 @@ class JSONUpdatesMixin(CPUInterpreter):
         super().__init__(*args, **kwargs)
         self.mapped_commands.update({'updates': self.updates })
 
-    def updates(self, last_key: dict = None):
+    def updates(self, last_key: dict = None, raw_timestamps: bool = False):
         """
         Data is searched through dynamic bounds to allow for
         something similar to API pagination.
         List slicing does not create memory duplicates; only when
         it is dumped to JSON.
 
+        Timestamps are sent as dates, or as int nanoseconds since the epoch if raw_timestamps is true.
         """
         last_key = last_key or dict()
+        # Sensors may be added or removed by a settings reload meanwhile
+        samplers = list(self.sampling_manager.wrappers_dict.items())
         response = {sensor_name: sampler.reader.retrieve_last(last_key.get(sensor_name, None))
-                    for sensor_name, sampler in self.sampling_manager.wrappers_dict.items()}
+                    for sensor_name, sampler in samplers}
+        if not raw_timestamps:
+            # The column titles tell the timestamp columns (groups have several)
+            for sensor_name, sampler in samplers:
+                response[sensor_name]['data'] = clock.with_datetimes(response[sensor_name]['data'],
+                                                                     sampler.reader.data[0])
 
         # Note: dates are dumped with a standard Python format.
         # This format is not automatically recognised when dates are parsed back
@@ -36,3 +48,26 @@ class JSONUpdatesMixin(CPUInterpreter):
 
         return json.dumps(response, default=str)
 
+
+class StreamingMixin(CPUInterpreter):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.mapped_commands.update({'subscribe': self.subscribe})
+
+    def subscribe(self, sensors: list = None, max_rate: float = None, buffer: int = 1024,
+                  raw_timestamps: bool = False) -> Stream:
+        """
+        Keeps the connection open and pushes new samples of the selected
+        sensors (all of them by default) as frames. See Stream.
+        """
+        wrappers = self.sampling_manager.wrappers_dict
+        if sensors is None:
+            sensors = list(wrappers)
+        unknown = [name for name in sensors if name not in wrappers]
+        if unknown:
+            raise InvalidArgumentsError
+        if (max_rate is not None and not max_rate > 0) or not buffer >= 1:
+            raise InvalidArgumentsError("max_rate must be positive and buffer at least 1.")
+
+        return Stream({name: wrappers[name].reader for name in sensors}, max_rate=max_rate, buffer=buffer,
+                      raw_timestamps=raw_timestamps)
@@ -0,0 +1,125 @@
+#
+# Response cache
+#
+# Commands that compute summaries which only change when new samples arrive
+# can opt in to caching with the @cached decorator. Responses are keyed by
+# command, canonicalized kwargs and serializer, and stored already serialized
+# (as sent by the CPUServer), so a hit skips both the computation and the encoding.
+#
+# An entry stops being valid when:
+#   - its TTL has elapsed, or
+#   - any of the sensors it depends on has taken new samples (the sample
+#     sequence numbers of the readers are compared with those at computation).
+#
+# The cache is bounded (LRU eviction) and keeps hit/miss counters.
+#
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Union, Iterable, Tuple, Callable
+
+__all__ = [
+    "cached", "CachePolicy", "ResponseCache", "ALL_SENSORS",
+]
+
+
+# Marks a command as dependent on every sensor of the sampling manager.
+ALL_SENSORS = '*'
+
+
+class CachePolicy:
+    __slots__ = ('ttl', 'sensors')
+
+    def __init__(self, ttl: float = None, sensors: Union[str, Iterable[str]] = None) -> None:
+        if ttl is not None and ttl <= 0:
+            raise ValueError("Cache TTL must be positive.")
+        self.ttl = ttl
+        self.sensors = sensors if sensors is None or sensors == ALL_SENSORS else tuple(sensors)
+
+
+def cached(ttl: float = None, sensors: Union[str, Iterable[str]] = None) -> Callable:
+    """
+    Opts a mapped command in to the response cache.
+
+    ttl: seconds a response is valid for (None for no expiration).
+    sensors: names of the sensors the response depends on, or ALL_SENSORS.
+             The response is recomputed once any of them takes a new sample.
+
+    Commands without ttl nor sensors are cached until evicted, so they must be pure.
+    """
+    policy = CachePolicy(ttl, sensors)
+
+    def decorator(func):
+        func.__cache_policy__ = policy
+        return func
+    return decorator
+
+
+class ResponseCache:
+
+    def __init__(self, max_entries: int = 256) -> None:
+        self.max_entries = max_entries
+        # key: (response, expires, versions)
+        self.__entries: OrderedDict = OrderedDict()
+        self.__lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(command: str, kwargs: Union[dict, None], serializer: str) -> Tuple[str, str, str]:
+        # kwargs come from JSON, so they can always be canonicalized back into it.
+        return command, json.dumps(kwargs, sort_keys=True, separators=(',', ':')) if kwargs else '', serializer
+
+    def get(self, key: tuple, versions: tuple = None):
+        """
+        Returns the stored response, or None if there is no valid entry.
+        """
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None:
+                response, expires, entry_versions = entry
+                if (expires is None or time.monotonic() < expires) and entry_versions == versions:
+                    self.__entries.move_to_end(key)
+                    self.hits += 1
+                    return response
+                del self.__entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: tuple, response, ttl: float = None, versions: tuple = None) -> None:
+        expires = time.monotonic() + ttl if ttl is not None else None
+        with self.__lock:
+            self.__entries[key] = (response, expires, versions)
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.max_entries:
+                self.__entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, command: str = None) -> None:
+        """
+        Drops the entries of a command, or all of them.
+        """
+        with self.__lock:
+            if command is None:
+                self.__entries.clear()
+            else:
+                for key in [key for key in self.__entries if key[0] == command]:
+                    del self.__entries[key]
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def stats(self) -> dict:
+        requests = self.hits + self.misses
+        return {
+            'size': len(self.__entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': self.hits / requests if requests else 0.,
+        }
@@ -1,24 +1,91 @@
 import argparse
-from typing import Union, List, Iterable, Mapping
+import inspect
+from typing import Union, List, Iterable, Mapping, Tuple, Dict, TYPE_CHECKING
 import json
 
-from savannah.sampling import SamplingManager
+from savannah.core import metrics as _metrics
+from savannah.core.profiling import MIN_INTERVAL, profiled, profiler
 from savannah.core.exceptions import *
 from savannah.core.interpreter import *
+from savannah.iounit.serializers import Serializer, get_serializer, encode_response
+from .cache import ResponseCache, CachePolicy, ALL_SENSORS
+from .streams import Stream
+
+if TYPE_CHECKING:
+    from savannah.sampling import SamplingManager
 
 __all__ = [
     "CPUInterpreter", "Utils",
 ]
 
 
+# Annotation placeholder for parameters without annotation: no value has this type.
+_UNTYPED = object()
+
+
+class CommandSignature:
+    """
+    Argument validator of a mapped command, compiled once from its signature.
+    Validating a request is then a dict lookup and an identity check per argument.
+    """
+    __slots__ = ('func', 'params', 'types', 'var_kwargs', 'cache')
+
+    def __init__(self, func):
+        self.func = func
+        parameters = inspect.signature(func).parameters.values()
+        self.params = frozenset(p.name for p in parameters
+                                if p.kind in (p.POSITIONAL_OR_KEYWORD, p.KEYWORD_ONLY))
+        self.var_kwargs = any(p.kind is p.VAR_KEYWORD for p in parameters)
+        self.types = {p.name: (_UNTYPED if p.annotation is p.empty else p.annotation) for p in parameters}
+        self.cache: CachePolicy = getattr(func, '__cache_policy__', None)
+
+    def validate(self, kwargs: dict, verify_data_types: bool) -> None:
+        if not self.var_kwargs and not self.params.issuperset(kwargs):
+            raise InvalidArgumentsError
+
+        if verify_data_types:
+            types = self.types
+            for key, value in kwargs.items():
+                if type(value) is not types.get(key, _UNTYPED):
+                    raise InvalidArgumentsError
+
+
 class CPUInterpreter(AbstractBaseInterpreter):
-    def __init__(self, sampling_manager: SamplingManager = None):
+    def __init__(self, sampling_manager: 'SamplingManager' = None):
         super().__init__()
         self.mapped_commands = {}
         self.verify_data_types = True
         self.sampling_manager = sampling_manager
+        self.__signatures: Dict[str, CommandSignature] = {}
+        # Responses of the commands decorated with @cached
+        self.cache = ResponseCache()
+
+        # Built-in commands
+        self.mapped_commands.update({
+            'batch': self.batch,
+            'cache_stats': self.cache_stats,
+            'metrics': self.metrics,
+            'profile': self.profile,
+        })
 
+    def __compile__(self) -> None:
+        """
+        Compiles the signature validators of all the mapped commands.
+        It is called after __map__; commands mapped later are compiled on first use.
+        """
+        self.__signatures = {name: CommandSignature(func) for name, func in self.mapped_commands.items()}
+
+    def signature(self, command: str) -> CommandSignature:
+        try:
+            func = self.mapped_commands[command]
+        except (KeyError, TypeError):
+            raise UnrecognizedCommandError
 
+        signature = self.__signatures.get(command)
+        if signature is None or signature.func is not func:
+            # Mapped (or re-mapped) after compilation
+            signature = self.__signatures[command] = CommandSignature(func)
+        return signature
 
     def __configure__(self):
         """
@@ -32,6 +99,7 @@ class CPUInterpreter(AbstractBaseInterpreter):
         """
         self.parser.add_argument('--kwargs', nargs='?')
         self.parser.add_argument('command', nargs='?')
+        self.__compile__()
 
     def __pre_parse__(self, content: str) -> List:
         return content.split(' ', 2)
@@ -39,28 +107,152 @@ class CPUInterpreter(AbstractBaseInterpreter):
     def __parse__(self, content: Iterable, *args, **kwargs) -> argparse.Namespace:
         return self.parser.parse_args(content)
 
-    def __interpret__(self, namespace: argparse.Namespace):
+    @staticmethod
+    def __tokenize__(content: str) -> Union[Tuple[str, Union[str, None]], None]:
+        """
+        Fast path for the canonical syntax `command [--kwargs {JSON}]`, as built by Utils.build_command.
+        Returns (command, argstr), or None if the content must go through the argparse parser.
+        """
+        command, _, rest = content.partition(' ')
+        if command.startswith('-'):
+            return None
+        if not rest:
+            return command, None
+        if rest.startswith('--kwargs '):
+            return command, rest[9:]
+        return None
+
+    def __bind__(self, command: str, arg_str: Union[str, None]) -> Tuple[str, Union[dict, None]]:
+        """
+        Parses the kwargs and validates them against the command's compiled signature.
+        """
+        signature = self.signature(command)
+        arg_str = arg_str.strip() if arg_str else None
         try:
-            arg_str = namespace.kwargs.strip() if namespace.kwargs else str()
-            parsed_args = Utils.parse_argstr(arg_str) if arg_str is not str() else None  # (empty str)
-            selected_func: function = self.mapped_commands[namespace.command]
+            parsed_args = Utils.parse_argstr(arg_str) if arg_str else None
+        except json.decoder.JSONDecodeError:
+            raise InvalidCommandError
 
-            if parsed_args:
-                if not set(parsed_args.keys()) < set(selected_func.__code__.co_varnames):
-                    raise InvalidArgumentsError
+        if parsed_args:
+            if not isinstance(parsed_args, dict):
+                raise InvalidCommandError("Kwargs must be a JSON object.")
+            signature.validate(parsed_args, self.verify_data_types)
 
-                if self.verify_data_types and \
-                        (not all(type(value) is selected_func.__annotations__.get(key)
-                                 for key, value in parsed_args.items())):
-                    raise InvalidArgumentsError
+        return command, parsed_args
 
-            return (namespace.command, parsed_args)
+    def batch(self, commands: list) -> list:
+        """
+        Executes an ordered list of `[command, {kwargs}]` items in a single request.
+        Returns a list with one `{'ok': bool, 'data' | 'error': ...}` entry per item,
+        in the same order. A failing item does not prevent the rest from executing.
+        Items are executed without the response cache, and commands that return a stream
+        (subscribe) are not supported.
+        """
+        results = []
+        for item in commands:
+            try:
+                if not isinstance(item, list) or not 1 <= len(item) <= 2:
+                    raise InvalidCommandError("Batch items must be [command, {kwargs}].")
+                command, kwargs = item[0], (item[1] if len(item) == 2 else None)
+                if command == 'batch':
+                    raise InvalidCommandError("Batches cannot be nested.")
+                if kwargs:
+                    if not isinstance(kwargs, dict):
+                        raise InvalidCommandError("Kwargs must be a JSON object.")
+                    self.signature(command).validate(kwargs, self.verify_data_types)
+                else:
+                    self.signature(command)
+                data = self.__execute__(command, kwargs)
+                # Streams hold the connection open: they only make sense as the whole response.
+                # They are not open yet, so there are no listeners to remove.
+                if isinstance(data, Stream):
+                    raise InvalidCommandError("{} cannot be run in a batch.".format(command))
+                results.append({'ok': True, 'data': data})
+            except Exception as e:
+                results.append({'ok': False, 'error': '{0}:{1}'.format(e.__class__.__name__, e)})
+        return results
 
-        except json.decoder.JSONDecodeError:
-            raise InvalidCommandError
+    def cache_stats(self) -> dict:
+        """
+        Returns the response cache counters.
+        """
+        return self.cache.stats()
+
+    @staticmethod
+    def metrics(prometheus: bool = False) -> Union[dict, str]:
+        """
+        Returns the metrics of the server process (see savannah.core.metrics),
+        or their Prometheus text exposition if `prometheus` is true.
+        """
+        return _metrics.prometheus() if prometheus else _metrics.snapshot()
+
+    @staticmethod
+    def profile(action: str = 'status', interval: float = .01) -> dict:
+        """
+        Controls the profiler of the server process (see savannah.core.profiling).
+        action: 'start' (sampling stacks every `interval` seconds), 'stop' or 'status'.
+        Returns the report: spans, number of stack samples and the most frequent stacks.
+        """
+        if action == 'start':
+            if not interval >= MIN_INTERVAL:
+                raise InvalidArgumentsError("Profile interval must be at least {} seconds.".format(MIN_INTERVAL))
+            profiler.start(interval)
+        elif action == 'stop': profiler.stop()
+        elif action != 'status': raise InvalidArgumentsError("Profile action must be 'start', 'stop' or 'status'.")
+        return profiler.report()
+
+    def __interpret__(self, namespace: argparse.Namespace):
+        return self.__bind__(namespace.command, namespace.kwargs)
 
+    @profiled('interpreter.run')
+    def raw_run(self, content: str):
+        tokens = self.__tokenize__(content)
+        if tokens is None:
+            # Non-canonical syntax: fall back to the argparse parser.
+            return super().raw_run(content)
+        return self.__execute__(*self.__bind__(*tokens))
+
+    @profiled('interpreter.run')
+    def serialized_run(self, content: str, serializer: Serializer = None) -> Union[Tuple[str, bytes], Stream]:
+        """
+        Like raw_run, but returns the response encoded with `serializer` (the default one if None):
+        (data_type name, payload).
+        Responses of cached commands are served from the response cache when valid.
+        Streams are returned as they are.
+        """
+        serializer = serializer or get_serializer()
+        tokens = self.__tokenize__(content)
+        if tokens is None:
+            command, kwargs = self.__interpret__(self.__parse__(self.__pre_parse__(content=content)))
+        else:
+            command, kwargs = self.__bind__(*tokens)
+
+        policy = self.signature(command).cache
+        if policy is None:
+            response = self.__execute__(command, kwargs)
+            return response if isinstance(response, Stream) else encode_response(response, serializer)
+
+        key = self.cache.key(command, kwargs, serializer.name)
+        versions = self.__sample_versions(policy.sensors)
+        response = self.cache.get(key, versions)
+        if response is None:
+            response = encode_response(self.__execute__(command, kwargs), serializer)
+            self.cache.put(key, response, policy.ttl, versions)
+        return response
+
+    def __sample_versions(self, sensors) -> Union[tuple, None]:
+        """
+        Sample sequence numbers of the sensors a cached response depends on.
+        """
+        if sensors is None:
+            return None
+        wrappers = self.sampling_manager.wrappers_dict
+        if sensors == ALL_SENSORS:
+            sensors = wrappers
+        try:
+            return tuple((name, wrappers[name].reader.sequence) for name in sensors)
         except KeyError:
-            raise UnrecognizedCommandError
+            raise InvalidArgumentsError
 
     def __execute__(self, method_name: str, kwargs: Mapping) -> Union[str, UnrecognizedCommandError]:
         return self.mapped_commands[method_name](**kwargs) if kwargs else self.mapped_commands[method_name]()
@@ -82,6 +274,17 @@ class Utils:
         return command_name + (' --kwargs {kwargs}'.format(kwargs=Utils.build_argstr(kwargs))
                                if kwargs else '')
 
+    @staticmethod
+    def build_batch(commands: Iterable) -> str:
+        """
+        commands: iterable of command names or (command_name, kwargs) pairs.
+        """
+        items = []
+        for command in commands:
+            name, kwargs = (command, None) if isinstance(command, str) else command
+            items.append([name, {k: v for k, v in (kwargs or {}).items() if v is not None}])
+        return Utils.build_command('batch', commands=items)
+
     @staticmethod
     def parse_argstr(argstr: str) -> Union[dict, None]:
         return json.loads(argstr)
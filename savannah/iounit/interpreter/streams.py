@@ -0,0 +1,91 @@
+#
+# Server-push streams
+#
+# A Stream is what an interpreter command returns when, instead of a single
+# response, the client wants to be pushed new samples as they are produced.
+# The CPUServer recognises it and hands the connection over to a thread that
+# sends frames until the client disconnects.
+#
+# Samples reach the stream through SensorReader listeners and are kept in a
+# bounded buffer. If the client (or the max rate it asked for) is slower than
+# the sensors, samples are coalesced into bigger frames and, once the buffer
+# is full, the oldest ones are dropped and counted.
+#
+
+import threading
+from collections import deque
+from typing import Dict, Union
+
+from savannah.sampling import clock
+
+__all__ = [
+    "Stream",
+]
+
+
+class Stream:
+
+    def __init__(self, readers: Dict[str, 'SensorReader'], max_rate: float = None, buffer: int = 1024,
+                 raw_timestamps: bool = False) -> None:
+        """
+        readers: {sensor_name: SensorReader} to subscribe to.
+        max_rate: maximum number of frames per second (None to send samples as they arrive).
+        buffer: maximum number of samples held between frames.
+        raw_timestamps: send timestamps as int nanoseconds since the epoch instead of datetimes.
+        """
+        if max_rate is not None and max_rate <= 0:
+            raise ValueError("Stream max_rate must be positive.")
+        if buffer < 1:
+            raise ValueError("Stream buffer must hold at least one sample.")
+
+        self.readers = readers
+        self.min_interval: float = 1 / max_rate if max_rate else 0.
+        self.buffer_size = buffer
+        self.raw_timestamps = raw_timestamps
+        self.dropped = 0
+
+        self.__buffer = deque()
+        self.__lock = threading.Lock()
+        self.__available = threading.Event()
+
+    def push(self, sensor_name: str, sample: tuple) -> None:
+        """
+        Listener called from the sampler threads for every new sample.
+        """
+        with self.__lock:
+            if len(self.__buffer) >= self.buffer_size:
+                self.__buffer.popleft()
+                self.dropped += 1
+            self.__buffer.append((sensor_name, sample))
+        self.__available.set()
+
+    def next_frame(self, timeout: float = None) -> Union[dict, None]:
+        """
+        Waits for samples and returns them as a frame:
+        {'data': {sensor_name: [samples...]}, 'dropped': <samples dropped since the last frame>}
+        Returns None if there are no samples after the timeout.
+        """
+        if not self.__available.wait(timeout):
+            return None
+
+        with self.__lock:
+            samples, self.__buffer = self.__buffer, deque()
+            dropped, self.dropped = self.dropped, 0
+            self.__available.clear()
+
+        data = {}
+        for sensor_name, sample in samples:
+            data.setdefault(sensor_name, []).append(sample)
+        if not self.raw_timestamps:
+            # The column titles of the readers tell the timestamp columns (groups have several)
+            data = {sensor_name: clock.with_datetimes(sensor_samples, self.readers[sensor_name].data[0])
+                    for sensor_name, sensor_samples in data.items()}
+        return {'data': data, 'dropped': dropped}
+
+    def open(self) -> None:
+        for reader in self.readers.values():
+            reader.add_listener(self.push)
+
+    def close(self) -> None:
+        for reader in self.readers.values():
+            reader.remove_listener(self.push)
@@ -0,0 +1,372 @@
+#
+# Response serializers
+#
+# Responses that are not str or bytes are encoded with a serializer chosen per
+# connection (see CPUClient). Serializers are registered by name:
+#
+#   - 'pack' (default): MessagePack wire format. Compact and safe to decode
+#     from untrusted peers: only plain data types can be built.
+#     Tuples are sent as lists; datetimes and NumPy arrays travel as extension
+#     types. Numpy scalars are sent as the equivalent Python number.
+#     The msgpack library is used if installed; otherwise an equivalent
+#     pure-Python codec is used (same wire format, slower).
+#   - 'pickle': any picklable object. Decoding pickle executes arbitrary code,
+#     so it must only be used with trusted servers.
+#
+# Custom serializers can be added with `register(MySerializer())`.
+#
+
+import datetime
+import pickle
+import struct
+from collections import namedtuple
+from typing import Dict, Tuple
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+__all__ = [
+    "Serializer", "PackSerializer", "PickleSerializer", "SerializationError",
+    "register", "get_serializer", "serializers", "encode_response", "decode_response",
+    "DEFAULT_SERIALIZER",
+]
+
+
+# Serializer used by connections that do not negotiate one.
+DEFAULT_SERIALIZER = 'pack'
+
+
+class SerializationError(ValueError):
+    def __init__(self, msg=None, *args, **kwargs):
+        super(SerializationError, self).__init__(msg or 'Response data could not be (de)serialized.',
+                                                 *args, **kwargs)
+
+
+class Serializer:
+    name: str = None
+
+    def dumps(self, obj) -> bytes:
+        raise NotImplementedError
+
+    def loads(self, data: bytes):
+        raise NotImplementedError
+
+
+class PickleSerializer(Serializer):
+    name = 'pickle'
+
+    def dumps(self, obj) -> bytes:
+        return pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def loads(self, data: bytes):
+        return pickle.loads(data)
+
+
+#
+# MessagePack
+#
+
+ExtType = msgpack.ExtType if msgpack is not None else namedtuple('ExtType', ('code', 'data'))
+
+_EXT_TUPLE = 1
+_EXT_DATETIME = 2
+_EXT_NDARRAY = 3
+
+_FLOAT = struct.Struct('>d')
+
+
+class PackSerializer(Serializer):
+    name = 'pack'
+
+    def __init__(self, use_msgpack: bool = True, preserve_tuples: bool = False) -> None:
+        """
+        preserve_tuples: decode tuples as tuples instead of lists. Each tuple is then an extension
+                         type, which makes tuple-heavy responses (like sample rows) several times slower.
+        """
+        self.backend = 'msgpack' if use_msgpack and msgpack is not None else 'python'
+        self.preserve_tuples = preserve_tuples
+
+    def dumps(self, obj) -> bytes:
+        if self.backend == 'msgpack':
+            # strict_types sends tuples (and subclasses of the builtins) through __default
+            return msgpack.packb(obj, default=self.__default, strict_types=self.preserve_tuples,
+                                 use_bin_type=True)
+        out = bytearray()
+        _pack(obj, out, self.__default, self.preserve_tuples)
+        return bytes(out)
+
+    def loads(self, data: bytes):
+        if self.backend == 'msgpack':
+            return msgpack.unpackb(data, ext_hook=self.__ext_hook, raw=False, strict_map_key=False)
+        obj, position = _unpack(data, 0, self.__ext_hook)
+        if position != len(data):
+            raise SerializationError("Extra data after the packed object.")
+        return obj
+
+    def __default(self, obj):
+        if type(obj) is tuple:
+            return ExtType(_EXT_TUPLE, self.dumps(list(obj))) if self.preserve_tuples else list(obj)
+        if isinstance(obj, datetime.datetime):
+            return ExtType(_EXT_DATETIME, obj.isoformat().encode())
+
+        if type(obj).__module__ == 'numpy':
+            import numpy as np
+            if isinstance(obj, np.ndarray):
+                if obj.dtype.hasobject:
+                    raise TypeError("NumPy arrays of objects cannot be packed.")
+                # [dtype length][dtype][ndim][shape...][data]
+                dtype = obj.dtype.str.encode()
+                header = struct.pack('>B{0}sB{1}Q'.format(len(dtype), obj.ndim),
+                                     len(dtype), dtype, obj.ndim, *obj.shape)
+                return ExtType(_EXT_NDARRAY, header + np.ascontiguousarray(obj).tobytes())
+            if isinstance(obj, np.generic):
+                return obj.item()
+
+        # Subclasses of the builtin types (e.g. OrderedDict, IntEnum) are sent as the builtin.
+        for base in (bool, int, float, str, bytes, dict, list, tuple):
+            if isinstance(obj, base):
+                return base(obj)
+        if isinstance(obj, (set, frozenset)):
+            return list(obj)
+        raise TypeError("Object of type {} cannot be packed.".format(type(obj).__name__))
+
+    def __ext_hook(self, code: int, data: bytes):
+        if code == _EXT_TUPLE:
+            return tuple(self.loads(data))
+        if code == _EXT_DATETIME:
+            return datetime.datetime.fromisoformat(data.decode())
+        if code == _EXT_NDARRAY:
+            import numpy as np
+            dtype = np.dtype(data[1:1 + data[0]].decode())
+            if dtype.hasobject:
+                raise SerializationError("NumPy arrays of objects cannot be unpacked.")
+            ndim = data[1 + data[0]]
+            offset = 2 + data[0]
+            shape = struct.unpack_from('>{}Q'.format(ndim), data, offset)
+            # The array is a read-only view of the received data (no copy).
+            return np.frombuffer(data, dtype=dtype, offset=offset + 8 * ndim).reshape(shape)
+        return ExtType(code, data)
+
+
+def _pack(obj, out: bytearray, default, strict_types: bool) -> None:
+    obj_type = type(obj)
+
+    if obj is None:
+        out.append(0xc0)
+    elif obj_type is bool:
+        out.append(0xc3 if obj else 0xc2)
+    elif obj_type is int:
+        if 0 <= obj < 0x80:
+            out.append(obj)
+        elif -0x20 <= obj < 0:
+            out.append(obj & 0xff)
+        elif obj >= 0:
+            for code, fmt, limit in ((0xcc, '>B', 0x100), (0xcd, '>H', 0x10000),
+                                     (0xce, '>I', 0x100000000), (0xcf, '>Q', 0x10000000000000000)):
+                if obj < limit:
+                    out.append(code)
+                    out += struct.pack(fmt, obj)
+                    break
+            else:
+                raise OverflowError("Integer too large to be packed.")
+        else:
+            for code, fmt, limit in ((0xd0, '>b', 0x80), (0xd1, '>h', 0x8000),
+                                     (0xd2, '>i', 0x80000000), (0xd3, '>q', 0x8000000000000000)):
+                if obj >= -limit:
+                    out.append(code)
+                    out += struct.pack(fmt, obj)
+                    break
+            else:
+                raise OverflowError("Integer too large to be packed.")
+    elif obj_type is float:
+        out.append(0xcb)
+        out += _FLOAT.pack(obj)
+    elif obj_type is str:
+        data = obj.encode()
+        _pack_header(out, len(data), 0xa0, 32, (0xd9, 0xda, 0xdb))
+        out += data
+    elif obj_type in (bytes, bytearray):
+        _pack_header(out, len(obj), None, 0, (0xc4, 0xc5, 0xc6))
+        out += obj
+    elif obj_type is list or (obj_type is tuple and not strict_types):
+        _pack_header(out, len(obj), 0x90, 16, (None, 0xdc, 0xdd))
+        for item in obj:
+            _pack(item, out, default, strict_types)
+    elif obj_type is dict:
+        _pack_header(out, len(obj), 0x80, 16, (None, 0xde, 0xdf))
+        for key, value in obj.items():
+            _pack(key, out, default, strict_types)
+            _pack(value, out, default, strict_types)
+    elif obj_type is ExtType:
+        size = len(obj.data)
+        fixext = {1: 0xd4, 2: 0xd5, 4: 0xd6, 8: 0xd7, 16: 0xd8}.get(size)
+        if fixext:
+            out.append(fixext)
+        else:
+            _pack_header(out, size, None, 0, (0xc7, 0xc8, 0xc9))
+        out += struct.pack('>b', obj.code)
+        out += obj.data
+    else:
+        _pack(default(obj), out, default, strict_types)
+
+
+def _pack_header(out: bytearray, size: int, fix_code, fix_limit: int, codes: tuple) -> None:
+    """
+    Writes the header of a sized type: fix format if it fits, else 8, 16 or 32-bit length.
+    """
+    if size < fix_limit:
+        out.append(fix_code | size)
+    elif size < 0x100 and codes[0] is not None:
+        out.append(codes[0])
+        out.append(size)
+    elif size < 0x10000:
+        out.append(codes[1])
+        out += struct.pack('>H', size)
+    elif size < 0x100000000:
+        out.append(codes[2])
+        out += struct.pack('>I', size)
+    else:
+        raise OverflowError("Object too large to be packed.")
+
+
+# Fixed-size formats: code -> struct format
+_FIXED = {
+    0xcc: struct.Struct('>B'), 0xcd: struct.Struct('>H'), 0xce: struct.Struct('>I'), 0xcf: struct.Struct('>Q'),
+    0xd0: struct.Struct('>b'), 0xd1: struct.Struct('>h'), 0xd2: struct.Struct('>i'), 0xd3: struct.Struct('>q'),
+    0xca: struct.Struct('>f'), 0xcb: _FLOAT,
+}
+# Sized formats: code -> (kind, struct format of the length)
+_SIZED = {
+    0xd9: ('str', struct.Struct('>B')), 0xda: ('str', struct.Struct('>H')), 0xdb: ('str', struct.Struct('>I')),
+    0xc4: ('bin', struct.Struct('>B')), 0xc5: ('bin', struct.Struct('>H')), 0xc6: ('bin', struct.Struct('>I')),
+    0xdc: ('array', struct.Struct('>H')), 0xdd: ('array', struct.Struct('>I')),
+    0xde: ('map', struct.Struct('>H')), 0xdf: ('map', struct.Struct('>I')),
+    0xc7: ('ext', struct.Struct('>B')), 0xc8: ('ext', struct.Struct('>H')), 0xc9: ('ext', struct.Struct('>I')),
+}
+_FIXEXT = {0xd4: 1, 0xd5: 2, 0xd6: 4, 0xd7: 8, 0xd8: 16}
+_CONSTANTS = {0xc0: None, 0xc2: False, 0xc3: True}
+
+
+def _unpack(data: bytes, position: int, ext_hook) -> Tuple[object, int]:
+    try:
+        code = data[position]
+    except IndexError:
+        raise SerializationError("Truncated data.")
+    position += 1
+
+    if code < 0x80:
+        return code, position
+    if code >= 0xe0:
+        return code - 0x100, position
+    if code in _CONSTANTS:
+        return _CONSTANTS[code], position
+
+    if code in _FIXED:
+        fmt = _FIXED[code]
+        return fmt.unpack_from(data, position)[0], position + fmt.size
+
+    if 0xa0 <= code < 0xc0:
+        kind, size = 'str', code & 0x1f
+    elif 0x90 <= code < 0xa0:
+        kind, size = 'array', code & 0x0f
+    elif 0x80 <= code < 0x90:
+        kind, size = 'map', code & 0x0f
+    elif code in _FIXEXT:
+        kind, size = 'ext', _FIXEXT[code]
+    elif code in _SIZED:
+        kind, fmt = _SIZED[code]
+        size = fmt.unpack_from(data, position)[0]
+        position += fmt.size
+    else:
+        raise SerializationError("Unknown type code: 0x{:02x}".format(code))
+
+    if kind == 'array':
+        items = []
+        for _ in range(size):
+            item, position = _unpack(data, position, ext_hook)
+            items.append(item)
+        return items, position
+    if kind == 'map':
+        mapping = {}
+        for _ in range(size):
+            key, position = _unpack(data, position, ext_hook)
+            mapping[key], position = _unpack(data, position, ext_hook)
+        return mapping, position
+
+    if kind == 'ext':
+        ext_code = struct.unpack_from('>b', data, position)[0]
+        position += 1
+    end = position + size
+    if end > len(data):
+        raise SerializationError("Truncated data.")
+    chunk = data[position:end]
+    if kind == 'str':
+        return chunk.decode(), end
+    if kind == 'bin':
+        return bytes(chunk), end
+    return ext_hook(ext_code, bytes(chunk)), end
+
+
+#
+# Registry
+#
+
+_REGISTRY: Dict[str, Serializer] = {}
+
+
+def register(serializer: Serializer) -> Serializer:
+    if not serializer.name:
+        raise ValueError("Serializers must have a name.")
+    _REGISTRY[serializer.name] = serializer
+    return serializer
+
+
+def get_serializer(name: str = DEFAULT_SERIALIZER) -> Serializer:
+    try:
+        return _REGISTRY[name]
+    except KeyError:
+        raise SerializationError("Unknown serializer: '{}'".format(name))
+
+
+def serializers() -> tuple:
+    return tuple(_REGISTRY)
+
+
+register(PackSerializer())
+register(PickleSerializer())
+
+
+#
+# Response framing
+#
+
+def encode_response(response, serializer: Serializer) -> Tuple[str, bytes]:
+    """
+    Encodes a command response as sent by the CPUServer: (data_type name, payload).
+    str and bytes are sent as they are; anything else goes through the serializer.
+    """
+    response_type = type(response)
+    if response_type is bytes:
+        return 'bytes', response
+    if response_type is str:
+        return 'str', response.encode()
+    try:
+        return response_type.__name__, serializer.dumps(response)
+    except (TypeError, ValueError, OverflowError, pickle.PicklingError) as e:
+        raise SerializationError(str(e)) from e
+
+
+def decode_response(data_type: str, payload: bytes, serializer: Serializer):
+    if data_type == 'str':
+        return payload.decode()
+    if data_type == 'bytes':
+        return payload
+    try:
+        return serializer.loads(payload)
+    except SerializationError:
+        raise
+    except Exception as e:
+        # Corrupt payloads can fail in many ways depending on the serializer.
+        raise SerializationError(str(e)) from e
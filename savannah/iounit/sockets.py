@@ -4,14 +4,18 @@
 # For P2P communications other models should be used.
 #
 
+import select
 import socket
-from pydoc import locate
-import pickle
+import time
 from typing import *
 from enum import Enum
 
 from savannah.asynchrony import threads
-from savannah.iounit.interpreter import CPUInterpreter
+from savannah.iounit.interpreter import CPUInterpreter, Stream, Utils as InterpreterUtils
+from savannah.iounit.serializers import (Serializer, SerializationError, DEFAULT_SERIALIZER,
+                                         get_serializer, decode_response)
+from savannah.core import metrics
+from savannah.core.profiling import profiled
 from savannah.core.interpreter import EvaluationException
 from savannah.core.logging import logger
 
@@ -44,6 +48,27 @@ class ConnectionResponseStatus(Enum):
 ConnStatus = ConnectionResponseStatus  # Alias
 
 
+#
+# Metrics
+#
+
+REQUESTS = metrics.counter('server_requests_total', 'Requests responded by the CPUServer.')
+REQUEST_ERRORS = metrics.counter('server_request_errors_total', 'Requests that raised an evaluation error.')
+REQUEST_SECONDS = metrics.histogram('server_request_seconds', 'Time to interpret and respond a request.')
+BYTES_SENT = metrics.counter('server_bytes_sent_total', 'Payload bytes sent in responses and stream frames.')
+STREAM_FRAMES = metrics.counter('stream_frames_total', 'Frames pushed to stream subscribers.')
+STREAM_DROPPED = metrics.counter('stream_samples_dropped_total', 'Samples dropped by slow stream subscribers.')
+
+
+# First message of a persistent connection. Connections that do not start with it
+# are closed after one request, as usual.
+KEEP_ALIVE = b'KEEP_ALIVE'
+
+# Prefix of the message that selects the serializer of a connection (e.g. b'SERIALIZER:pickle').
+# It can be sent before any request; connections that do not send it use DEFAULT_SERIALIZER.
+SERIALIZER = b'SERIALIZER:'
+
+
 #
 # Classes
 #
@@ -62,6 +87,7 @@ class CPUServer:
         self.close_flag = False
 
         self.__thread: threads.Thread = None
+        self.handlers: Set[threads.Thread] = set()
 
         self.socket.bind((self.host, self.port))
 
@@ -89,30 +115,25 @@ class CPUServer:
 
                 self._mother.curr_conn, self._mother.curr_addr = curr_conn, curr_addr = self._mother.socket.accept()
                 logger.info("[CPUServer]: New incoming connection at {addr}".format(addr=curr_addr))
+                keep_alive = False
                 try:
+                    Utils.no_delay(curr_conn)
+                    serializer = get_serializer()
                     raw_message = Utils.recv_message(curr_conn)
+                    if raw_message and raw_message.startswith(SERIALIZER):
+                        serializer = self._mother.negotiate(curr_conn, curr_addr, raw_message)
+                        raw_message = Utils.recv_message(curr_conn) if serializer else b''
+
+                    if raw_message == KEEP_ALIVE:
+                        # Persistent connections are served in their own thread
+                        # so that they do not block the rest of the clients.
+                        CPUServer.ConnectionHandler(self._mother, curr_conn, curr_addr, serializer).start()
+                        keep_alive = True
 
                     # The empty connection to close the thread can contain anything, but using
                     # a conventional word saves up time since the interpreter is not involved.
-                    if raw_message and raw_message != b'NEXT':
-                        message = raw_message.decode()
-                        logger.info("[CPUServer]: {addr} sent: \"{msg}\"".format(addr=curr_addr, msg=message))
-
-                        response = self._mother.interpret_and_execute(message)
-                        response_type = type(response)
-
-                        if response_type not in (bytes, str):
-                            response = pickle.dumps(response)
-                        elif response_type is str:
-                            response = response.encode()
-
-                        Utils.send_message(curr_conn, b'exec_ok:1')
-                        logger.info("[CPUServer]: {addr} request [EXEC_OK]".format(addr=curr_addr))
-
-                        Utils.send_message(curr_conn, 'data_type:{}'.format(response_type.__name__).encode())
-                        Utils.send_message(curr_conn, response)
-                        logger.info("[CPUServer]: {addr} request was successfully responded with data_type {dt}"
-                                    .format(addr=curr_addr, dt=response_type.__name__))
+                    elif raw_message and raw_message != b'NEXT':
+                        keep_alive = self._mother.respond(curr_conn, curr_addr, raw_message, serializer)
 
                 except (ConnectionError, OSError) as e:
                     # TODO: This should be carefully tested in the future.
@@ -121,17 +142,158 @@ class CPUServer:
                     logger.warning("[CPUServer]: {addr} [ERROR]: {msg}".format(addr=curr_addr,
                                                                                msg=Utils.exception_message(e)))
 
-                except EvaluationException as e:
-                    Utils.send_message(curr_conn, b'exec_ok:0')
-                    Utils.send_message(curr_conn, Utils.exception_message(e).encode())
-                    logger.warning("[CPUServer]: {addr} [EVALUATION_EXCEPTION]: {msg}"
-                                   .format(addr=curr_addr, msg=Utils.exception_message(e)))
-
                 finally:
-                    self._mother.curr_conn.close()
-                    logger.info("[CPUServer]: {addr} connection closed.".format(addr=curr_addr))
+                    if not keep_alive:
+                        curr_conn.close()
+                        logger.info("[CPUServer]: {addr} connection closed.".format(addr=curr_addr))
                     del curr_addr, curr_conn
 
+    class ConnectionHandler(threads.Thread):
+        """
+        Serves a persistent connection: requests are read and responded in order
+        until the client closes the connection. Clients can pipeline requests
+        (send several before reading the responses).
+        """
+        def __init__(self, mother: 'CPUServer', conn: socket.socket, addr, serializer: Serializer):
+            self._mother = mother
+            self.conn = conn
+            self.addr = addr
+            self.serializer = serializer
+            super(CPUServer.ConnectionHandler, self).__init__(name='ConnectionHandler{}'.format(addr),
+                                                              is_daemon=True)
+
+        def task(self):
+            self._mother.handlers.add(self)
+            handed_over = False
+            try:
+                while not self._mother.close_flag and not handed_over:
+                    raw_message = Utils.recv_message(self.conn)
+                    if not raw_message:
+                        break
+                    if raw_message.startswith(SERIALIZER):
+                        self.serializer = self._mother.negotiate(self.conn, self.addr, raw_message)
+                        if self.serializer is None:
+                            break
+                        continue
+                    handed_over = self._mother.respond(self.conn, self.addr, raw_message, self.serializer)
+
+            except (ConnectionError, OSError) as e:
+                logger.warning("[CPUServer]: {addr} [ERROR]: {msg}".format(addr=self.addr,
+                                                                           msg=Utils.exception_message(e)))
+            finally:
+                self._mother.handlers.discard(self)
+                if not handed_over:
+                    self.conn.close()
+                    logger.info("[CPUServer]: {addr} persistent connection closed.".format(addr=self.addr))
+
+    class StreamHandler(threads.Thread):
+        """
+        Pushes the frames of a Stream through the connection until
+        the client disconnects or the server is closed.
+        """
+        def __init__(self, mother: 'CPUServer', conn: socket.socket, addr, stream: Stream, serializer: Serializer):
+            self._mother = mother
+            self.conn = conn
+            self.addr = addr
+            self.stream = stream
+            self.serializer = serializer
+            super(CPUServer.StreamHandler, self).__init__(name='StreamHandler{}'.format(addr),
+                                                          is_daemon=True)
+
+        def task(self):
+            self._mother.handlers.add(self)
+            self.stream.open()
+            last_frame = 0.
+            try:
+                while not self._mother.close_flag:
+                    # Frames are rate limited; samples arriving meanwhile are coalesced.
+                    delay = last_frame + self.stream.min_interval - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+
+                    frame = self.stream.next_frame(timeout=0.5)
+                    if frame is not None:
+                        payload = self.serializer.dumps(frame)
+                        Utils.send_message(self.conn, payload)
+                        last_frame = time.monotonic()
+                        STREAM_FRAMES.inc()
+                        BYTES_SENT.inc(len(payload))
+                        if frame['dropped']: STREAM_DROPPED.inc(frame['dropped'])
+                    elif self.peer_closed():
+                        # Without new samples there are no failing sends to tell that the client left.
+                        break
+
+            except (ConnectionError, OSError) as e:
+                logger.info("[CPUServer]: {addr} stream ended: {msg}".format(addr=self.addr,
+                                                                            msg=Utils.exception_message(e)))
+            finally:
+                self.stream.close()
+                self._mother.handlers.discard(self)
+                self.conn.close()
+
+        def peer_closed(self) -> bool:
+            # Clients do not send anything after subscribing: a readable socket means EOF.
+            readable, _, _ = select.select([self.conn], [], [], 0)
+            return bool(readable) and not self.conn.recv(1, socket.MSG_PEEK)
+
+    def negotiate(self, conn: socket.socket, addr, raw_message: bytes) -> Union[Serializer, None]:
+        """
+        Selects the serializer requested by a SERIALIZER message.
+        If it is unknown, an error response is sent and None is returned (the connection must be closed).
+        """
+        try:
+            return get_serializer(raw_message[len(SERIALIZER):].decode())
+        except SerializationError as e:
+            Utils.send_messages(conn, b'exec_ok:0', Utils.exception_message(e).encode())
+            logger.warning("[CPUServer]: {addr} [SERIALIZER]: {msg}"
+                           .format(addr=addr, msg=Utils.exception_message(e)))
+            return None
+
+    def respond(self, conn: socket.socket, addr, raw_message: bytes, serializer: Serializer = None) -> bool:
+        """
+        Interprets and executes one request, and sends the response through `conn`
+        encoded with `serializer` (the default one if None).
+        Returns True if the connection has been handed over to a stream (and must not be closed).
+        """
+        start = time.perf_counter()
+        message = raw_message.decode()
+        serializer = serializer or get_serializer()
+        logger.info("[CPUServer]: {addr} sent: \"{msg}\"".format(addr=addr, msg=message))
+        REQUESTS.inc()
+
+        try:
+            response = self.interpret_and_serialize(message, serializer)
+        except (EvaluationException, SerializationError) as e:
+            REQUEST_ERRORS.inc()
+            Utils.send_messages(conn, b'exec_ok:0', Utils.exception_message(e).encode())
+            logger.warning("[CPUServer]: {addr} [EVALUATION_EXCEPTION]: {msg}"
+                           .format(addr=addr, msg=Utils.exception_message(e)))
+            return False
+        except Exception as e:
+            # Any other error of a command is answered too: it must not end the accept loop
+            REQUEST_ERRORS.inc()
+            Utils.send_messages(conn, b'exec_ok:0', Utils.exception_message(e).encode())
+            logger.error("[CPUServer]: {addr} [UNEXPECTED_EXCEPTION]: {msg}"
+                         .format(addr=addr, msg=Utils.exception_message(e)))
+            return False
+
+        if isinstance(response, Stream):
+            Utils.send_messages(conn, b'exec_ok:1', b'data_type:stream')
+            CPUServer.StreamHandler(self, conn, addr, response, serializer).start()
+            logger.info("[CPUServer]: {addr} subscribed to a stream".format(addr=addr))
+            return True
+
+        data_type, payload = response
+
+        # Status, data type and payload are sent at once (see Utils.send_messages)
+        Utils.send_messages(conn, b'exec_ok:1', 'data_type:{}'.format(data_type).encode(), payload)
+        logger.info("[CPUServer]: {addr} request [EXEC_OK]".format(addr=addr))
+        BYTES_SENT.inc(len(payload))
+        REQUEST_SECONDS.observe(time.perf_counter() - start)
+        logger.info("[CPUServer]: {addr} request was successfully responded with data_type {dt}"
+                    .format(addr=addr, dt=data_type))
+        return False
+
     def run(self):
         self.__listen()
         self.__thread = CPUServer.BackgroundLoop(self)
@@ -149,79 +311,242 @@ class CPUServer:
 
         self.thread.thread.join(timeout=timeout)
 
+        # Persistent connections are ended from this side.
+        for handler in list(self.handlers):
+            try:
+                handler.conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
         # Al terminal el hilo se cierra el socket.
         self.socket.close()
 
     def interpret_and_execute(self, message: str):
         return self.__interpreter.raw_run(message)
 
+    def interpret_and_serialize(self, message: str, serializer: Serializer = None):
+        return self.__interpreter.serialized_run(message, serializer)
+
     @property
     def thread(self) -> threads.Thread:
         return self.__thread
 
 
 class CPUClient:
-    def __init__(self, host, port):
+    def __init__(self, host, port, serializer: str = DEFAULT_SERIALIZER):
+        """
+        serializer: name of the serializer responses are encoded with (see savannah.iounit.serializers).
+                    'pickle' must only be used with trusted servers.
+        """
         self.host = host
         self.port = port
         self.socket: socket.socket = None
+        self.serializer = get_serializer(serializer)
+        self.__persistent: bool = False
+
+    def __open(self) -> socket.socket:
+        sock = Utils.no_delay(socket.socket())
+        sock.connect((self.host, self.port))
+        if self.serializer.name != DEFAULT_SERIALIZER:
+            Utils.send_message(sock, SERIALIZER + self.serializer.name.encode())
+        return sock
 
     def message(self, content: str) -> Tuple[ConnStatus, Any]:
         # Cada vez que se envía un mensaje se crea un nuevo socket porque el servidor está configurado para
         # admitir solamente una petición de cada socket.
-        # Si fuera necesario mantener al servidor en línea con el cliente, se podría modificar su comportamiento y
-        # crear una nueva clase; pedir al principio una confirmación del tipo de petición para dirigir el flujo
-        # acorde.
+        # Para mantener al servidor en línea con el cliente se usa una conexión persistente (ver .connect),
+        # que el servidor reconoce por su primer mensaje.
+
+        if self.__persistent:
+            return self.pipeline([content])[0]
 
         try:
-            self.socket = socket.socket()
-            self.socket.connect((self.host, self.port))
+            self.socket = self.__open()
             Utils.send_message(self.socket, content.encode())
-            exec_message = Utils.recv_message(self.socket)
-            if exec_message:
-                # Server has responded. We will parse response status:
-                status_int = exec_message.decode().split(':')[1]
-                if int(status_int):
-                    # Server response is satisfactory. We will parse received data.
-                    raw_datatype = Utils.recv_message(self.socket)
-                    raw_data = Utils.recv_message(self.socket)
-
-                    if locate(raw_datatype.decode().split(':', 1)[1]) is str:
-                        data = raw_data.decode()
-                    else:
-                        data = pickle.loads(raw_data)
-                    return ConnStatus.CONN_OK, data
-                else:
-                    # Server has responded but repsonse is not ok.
-                    error_str = Utils.recv_message(self.socket).decode()
-                    if error_str:
-                        errname, errmsg = error_str.split(':', 1)
-                        return ConnStatus.KNOWN_ERR, (errname, errmsg)
-
-            # Server has not responded. Server is down.
-            # Statement is not in else clause to provide fallback for nested ifs.
-            return ConnStatus.SERVER_UNKNOWN_ERR, None
+            return self.__read_response()
 
         except ConnectionRefusedError as e:
             return ConnStatus.CONN_REFUSED, e
         except ConnectionError as e:
             return ConnStatus.CONN_UNKNOWN_ERR, e
-        except pickle.UnpicklingError as e:
+        except SerializationError as e:
             return ConnStatus.RESPONSE_DATA_ERR, e
+        finally:
+            if self.socket is not None:
+                self.socket.close()
+
+    def batch(self, commands: Iterable) -> Tuple[ConnStatus, Any]:
+        """
+        Executes several commands in a single request.
+        commands: iterable of command names or (command_name, kwargs) pairs.
+        Data is a list with one `{'ok': bool, 'data' | 'error': ...}` entry per command.
+        Subscriptions cannot be batched, and batched commands are not served from the response cache.
+        """
+        return self.message(InterpreterUtils.build_batch(commands))
+
+    def subscribe(self, sensors: list = None, max_rate: float = None,
+                  buffer: int = None, raw_timestamps: bool = None) -> Tuple[ConnStatus, Any]:
+        """
+        Subscribes to live samples (the server interpreter must include the StreamingMixin).
+        If the status is CONN_OK, data is an iterator of frames:
+        {'data': {sensor_name: [samples...]}, 'dropped': int}
+        The subscription ends when the iterator is closed or garbage-collected.
+        """
+        kwargs = dict(sensors=sensors, buffer=buffer, max_rate=float(max_rate) if max_rate is not None else None,
+                      raw_timestamps=raw_timestamps)
+        content = InterpreterUtils.build_command('subscribe', **{k: v for k, v in kwargs.items() if v is not None})
+        try:
+            sock = self.__open()
+        except ConnectionRefusedError as e:
+            return ConnStatus.CONN_REFUSED, e
+        except ConnectionError as e:
+            return ConnStatus.CONN_UNKNOWN_ERR, e
+
+        try:
+            Utils.send_message(sock, content.encode())
+            exec_message = Utils.recv_message(sock)
+            if not exec_message:
+                sock.close()
+                return ConnStatus.SERVER_UNKNOWN_ERR, None
+            if not int(exec_message.decode().split(':')[1]):
+                errname, errmsg = Utils.recv_message(sock).decode().split(':', 1)
+                sock.close()
+                return ConnStatus.KNOWN_ERR, (errname, errmsg)
+            Utils.recv_message(sock)  # data_type:stream
+
+        except ConnectionError as e:
+            sock.close()
+            return ConnStatus.CONN_UNKNOWN_ERR, e
+
+        def frames():
+            try:
+                while True:
+                    raw_frame = Utils.recv_message(sock)
+                    if not raw_frame:
+                        return
+                    yield self.serializer.loads(raw_frame)
+            finally:
+                sock.close()
+
+        return ConnStatus.CONN_OK, frames()
+
+    #
+    # Persistent connection
+
+    def connect(self) -> 'CPUClient':
+        """
+        Opens a persistent connection. Until .close is called, every message is sent through it.
+        """
+        self.socket = self.__open()
+        Utils.send_message(self.socket, KEEP_ALIVE)
+        self.__persistent = True
+        return self
+
+    def close(self) -> None:
+        if self.__persistent:
+            self.__persistent = False
+            self.socket.close()
+
+    @property
+    def is_connected(self) -> bool:
+        return self.__persistent
+
+    def pipeline(self, contents: Iterable[str], depth: int = 32) -> List[Tuple[ConnStatus, Any]]:
+        """
+        Sends requests through the persistent connection without waiting for each response.
+        At most `depth` requests are in flight at a time (to keep socket buffers from filling up).
+        Returns the responses in the same order as the requests.
+        """
+        if not self.__persistent:
+            raise ConnectionError("Pipelining requires a persistent connection. Call .connect first.")
+
+        contents = list(contents)
+        results = []
+        sent = 0
+        try:
+            while len(results) < len(contents):
+                while sent < len(contents) and sent - len(results) < depth:
+                    Utils.send_message(self.socket, contents[sent].encode())
+                    sent += 1
+                try:
+                    results.append(self.__read_response())
+                except SerializationError as e:
+                    results.append((ConnStatus.RESPONSE_DATA_ERR, e))
+
+        except ConnectionError as e:
+            self.close()
+            results += [(ConnStatus.CONN_UNKNOWN_ERR, e)] * (len(contents) - len(results))
+        return results
+
+    def __enter__(self) -> 'CPUClient':
+        return self.connect()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __read_response(self) -> Tuple[ConnStatus, Any]:
+        exec_message = Utils.recv_message(self.socket)
+        if exec_message:
+            # Server has responded. We will parse response status:
+            status_int = exec_message.decode().split(':')[1]
+            if int(status_int):
+                # Server response is satisfactory. We will parse received data.
+                raw_datatype = Utils.recv_message(self.socket)
+                raw_data = Utils.recv_message(self.socket)
+
+                data_type = raw_datatype.decode().split(':', 1)[1]
+                return ConnStatus.CONN_OK, decode_response(data_type, raw_data, self.serializer)
+            else:
+                # Server has responded but repsonse is not ok.
+                error_str = Utils.recv_message(self.socket).decode()
+                if error_str:
+                    errname, errmsg = error_str.split(':', 1)
+                    return ConnStatus.KNOWN_ERR, (errname, errmsg)
+
+        # Server has not responded. Server is down.
+        # Statement is not in else clause to provide fallback for nested ifs.
+        return ConnStatus.SERVER_UNKNOWN_ERR, None
 
 
 class Utils:
     @staticmethod
+    @profiled('socket.send')
     def send_message(socket: socket.socket, message: bytes):
+        # Length and message go in a single call, so that the message is not split in two segments.
         length = str(len(message)).zfill(8).encode()
-        socket.send(length)
-        socket.send(message)
+        socket.sendall(length + message)
+
+    @staticmethod
+    @profiled('socket.send')
+    def send_messages(socket: socket.socket, *messages: bytes):
+        # The messages of a response go in a single call: consecutive small writes
+        # would be delayed by Nagle's algorithm and delayed ACKs on persistent connections.
+        socket.sendall(b''.join(str(len(message)).zfill(8).encode() + message for message in messages))
+
+    @staticmethod
+    def no_delay(sock: socket.socket) -> socket.socket:
+        # Requests and responses are small and latency-bound: they are sent as soon as they are written
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    @staticmethod
+    def recv_exact(socket: socket.socket, n: int) -> bytes:
+        # recv can return fewer bytes than requested (e.g. with large or pipelined messages).
+        chunks = []
+        while n > 0:
+            chunk = socket.recv(n)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            n -= len(chunk)
+        return b''.join(chunks)
 
     @staticmethod
+    @profiled('socket.recv')
     def recv_message(socket: socket.socket) ->Union[bytes, None]:
-        length = socket.recv(8)
+        length = Utils.recv_exact(socket, 8)
         try:
-            return socket.recv(int(length))
+            return Utils.recv_exact(socket, int(length))
         except ValueError:
             return None
 
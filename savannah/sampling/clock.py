@@ -0,0 +1,86 @@
+#
+# Sample clock
+#
+# Samples are stamped with int nanoseconds since the epoch, read from the monotonic
+# clock and anchored to the wall clock once per process:
+#
+#   - They never go backwards, even if the system clock is stepped (e.g. by NTP).
+#     The price is that they do not follow such steps either.
+#   - An int is cheaper to create and smaller than a datetime, and arrays of them
+#     can be operated at once (e.g. numpy.diff).
+#
+# Drivers may stamp their own samples instead (see Sensor.HARDWARE_TIMESTAMPS).
+# Timestamps are converted to datetime only when they are sent to clients.
+#
+
+import datetime
+import numbers
+import time
+from typing import Iterable, List, Sequence
+
+__all__ = [
+    "now_ns", "to_datetime", "from_datetime", "with_datetimes", "timestamp_columns", "anchor",
+]
+
+# Wall clock time (ns) at monotonic time 0
+_ANCHOR_NS: int = 0
+
+
+def anchor() -> int:
+    """
+    Anchors the monotonic clock to the wall clock. It is done on import; anchoring again
+    follows the steps of the system clock, but timestamps may then go backwards.
+    """
+    global _ANCHOR_NS
+    _ANCHOR_NS = time.time_ns() - time.monotonic_ns()
+    return _ANCHOR_NS
+
+
+anchor()
+
+
+def now_ns(_monotonic_ns=time.monotonic_ns) -> int:
+    return _monotonic_ns() + _ANCHOR_NS
+
+
+def to_datetime(timestamp: int) -> datetime.datetime:
+    """
+    Local (naive) datetime of a timestamp, like datetime.datetime.now(). Microsecond precision.
+    """
+    seconds, ns = divmod(timestamp, 1000000000)
+    return datetime.datetime.fromtimestamp(seconds).replace(microsecond=ns // 1000)
+
+
+def from_datetime(value: datetime.datetime) -> int:
+    # Whole seconds and microseconds apart, to avoid float rounding
+    seconds = int(value.replace(microsecond=0).timestamp())
+    return seconds * 1000000000 + value.microsecond * 1000
+
+
+def timestamp_columns(header: Sequence[str]) -> List[int]:
+    """
+    Indices of the timestamp columns: 'timestamp' and those of the members of a group ('<member>.timestamp').
+    """
+    return [i for i, name in enumerate(header) if name == 'timestamp' or name.endswith('.timestamp')]
+
+
+def with_datetimes(samples: Iterable[tuple], header: Sequence[str] = None) -> List[tuple]:
+    """
+    Samples with their timestamps as datetimes: the columns named as such in `header` (the column
+    titles of the sensor), or the last item of each sample without a header.
+    Values that are not integers (e.g. the column titles, or None) are kept as they are.
+    """
+    columns = timestamp_columns(header) if header is not None else None
+    converted = []
+    for sample in samples:
+        indices = columns if columns is not None else (len(sample) - 1, )
+        if any(_is_timestamp(sample[i]) for i in indices):
+            sample = tuple(to_datetime(int(value)) if i in indices and _is_timestamp(value) else value
+                           for i, value in enumerate(sample))
+        converted.append(sample)
+    return converted
+
+
+def _is_timestamp(value) -> bool:
+    # NumPy integers are Integral too; bools are not timestamps
+    return isinstance(value, numbers.Integral) and not isinstance(value, bool)
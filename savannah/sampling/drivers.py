@@ -1,8 +1,16 @@
+import math
+import random
+import time
 from abc import ABC, abstractmethod
+from typing import Union
 
 from savannah.core.decorators import flag_setter
+from savannah.sampling import clock
 
-__all__ =  ["Sensor", "PortNotOpenError"]
+__all__ =  [
+    "Sensor", "PortNotOpenError",
+    "SyntheticSensor", "SyntheticScalar", "SyntheticVector", "SyntheticWaveform", "BUILTIN_DRIVERS", "find_driver",
+]
 
 class PortNotOpenError(Exception):
     # TODO: Implement appropriate error message to raise when port is not open
@@ -20,6 +28,19 @@ class Sensor(ABC):
 
     MAGNITUDES_VERBOSE: tuple = None
 
+    # If true, read() returns the timestamp of the sample (int nanoseconds since the epoch)
+    # after the values, e.g. as stamped by the device. Otherwise samples are stamped
+    # when read (see sampling.clock).
+    HARDWARE_TIMESTAMPS: bool = False
+
+    # Whether read() may run at the same time as the reads of other sensors (see sampling.groups).
+    # Sensors that share a port or bus with others should set it to False.
+    CONCURRENT_READS: bool = True
+
+    # Processing stages applied to the samples before they are stored (see sampling.processing).
+    # The PIPELINE entry of the sensor settings replaces it.
+    PIPELINE: list = None
+
     def __init__(self, settings: dict = None):
         # self.port = None
         self.is_open = False
@@ -59,3 +80,135 @@ class Sensor(ABC):
     @classmethod
     def name(cls) -> str:
         return cls.__name__
+
+
+#
+# Synthetic drivers
+#
+# Built-in sensors that generate data instead of reading a device, for load testing
+# and development without hardware. They are enabled by name in settings.json,
+# like the sensors of drivers.py (which take precedence):
+#
+#   "enabled_sensors": ["SyntheticVector", "fast"],
+#   "custom_settings": {
+#       "SyntheticVector": {"FREQUENCY": 200, "CHANNELS": 16},
+#       "fast": {"DRIVER": "SyntheticWaveform", "FREQUENCY": 50, "BLOCK": 200, "LATENCY": 0.002}
+#   }
+#
+# DRIVER makes several sensors of the same driver possible, each named after its entry.
+#
+# Settings (all optional):
+#   CHANNELS: number of channels (magnitudes) of vectors and waveforms.
+#   BLOCK: samples per channel of each waveform read.
+#   SAMPLE_RATE: samples per second within a waveform block. Defaults to BLOCK * FREQUENCY,
+#                so that consecutive blocks are continuous.
+#   SIGNAL_FREQUENCY, AMPLITUDE, NOISE: the signal is a sine wave plus gaussian noise.
+#   LATENCY, LATENCY_JITTER: seconds each read blocks for (as a device round trip would),
+#                            plus a random amount up to LATENCY_JITTER.
+#   BURST_PERIOD, DUTY_CYCLE: the sensor produces data during DUTY_CYCLE of every BURST_PERIOD
+#                             seconds; reads return None (no data) the rest of the period.
+#   HARDWARE_TIMESTAMPS: samples are stamped by the driver when the read starts,
+#                        so that the injected latency does not delay the timestamp.
+#
+
+
+class SyntheticSensor(Sensor):
+    SENSOR_MAX_FREQUENCY = 10000
+    SENSOR_DEFAULT_FREQUENCY = 100
+    DEFAULT_CHANNELS = 1
+
+    MAGNITUDES_VERBOSE = ('value',)
+
+    def __init__(self, settings: dict = None):
+        super().__init__(settings)
+        settings = self.settings
+        self.channels = int(settings.get('CHANNELS', self.DEFAULT_CHANNELS))
+        self.signal_frequency = float(settings.get('SIGNAL_FREQUENCY', 1.))
+        self.amplitude = float(settings.get('AMPLITUDE', 1.))
+        self.noise = float(settings.get('NOISE', .05))
+        self.latency = float(settings.get('LATENCY', 0.))
+        self.latency_jitter = float(settings.get('LATENCY_JITTER', 0.))
+        self.burst_period = float(settings.get('BURST_PERIOD', 0.))
+        self.duty_cycle = float(settings.get('DUTY_CYCLE', 1.))
+        self.HARDWARE_TIMESTAMPS = bool(settings.get('HARDWARE_TIMESTAMPS', False))
+        if self.channels < 1 or not 0 < self.duty_cycle <= 1:
+            raise ValueError("{}: CHANNELS must be positive and DUTY_CYCLE in ]0, 1].".format(self.name()))
+
+        self.MAGNITUDES_VERBOSE = tuple('ch{}'.format(i) for i in range(self.channels)) \
+            if self.channels > 1 else ('value',)
+        # Channels are out of phase
+        self.phases = tuple(2 * math.pi * i / self.channels for i in range(self.channels))
+        self.__opened: float = None
+
+    def open(self):
+        self.__opened = time.monotonic()
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    def read(self):
+        if not self.is_open:
+            raise PortNotOpenError
+        timestamp = clock.now_ns()
+        if self.latency or self.latency_jitter:
+            time.sleep(self.latency + random.random() * self.latency_jitter)
+        elapsed = time.monotonic() - self.__opened
+        if self.burst_period and elapsed % self.burst_period >= self.duty_cycle * self.burst_period:
+            return None
+        values = self.generate(elapsed)
+        return (*values, timestamp) if self.HARDWARE_TIMESTAMPS else values
+
+    def generate(self, t: float) -> tuple:
+        """
+        Values of all the channels at `t` seconds since the sensor was opened.
+        """
+        return tuple(self.signal(t, phase) for phase in self.phases)
+
+    def signal(self, t: float, phase: float) -> float:
+        value = self.amplitude * math.sin(2 * math.pi * self.signal_frequency * t + phase)
+        return value + random.gauss(0., self.noise) if self.noise else value
+
+
+class SyntheticScalar(SyntheticSensor):
+    """
+    One value per read.
+    """
+    def __init__(self, settings: dict = None):
+        super().__init__(dict(settings or {}, CHANNELS=1))
+
+
+class SyntheticVector(SyntheticSensor):
+    """
+    One value per channel per read.
+    """
+    DEFAULT_CHANNELS = 8
+
+
+class SyntheticWaveform(SyntheticSensor):
+    """
+    A block of BLOCK consecutive samples per channel per read: (ch0 block, ch1 block, ...).
+    """
+    DEFAULT_CHANNELS = 4
+
+    def __init__(self, settings: dict = None):
+        super().__init__(settings)
+        self.block = int(self.settings.get('BLOCK', 100))
+        frequency = self.settings.get('FREQUENCY', self.settings.get('frequency')) or self.SENSOR_DEFAULT_FREQUENCY
+        self.sample_rate = float(self.settings.get('SAMPLE_RATE', self.block * frequency))
+        if self.block < 1:
+            raise ValueError("{}: BLOCK must be positive.".format(self.name()))
+
+    def generate(self, t: float) -> tuple:
+        times = [t + i / self.sample_rate for i in range(self.block)]
+        return tuple(tuple(self.signal(_, phase) for _ in times) for phase in self.phases)
+
+
+BUILTIN_DRIVERS = {driver.__name__: driver for driver in (SyntheticScalar, SyntheticVector, SyntheticWaveform)}
+
+
+def find_driver(name: str, drivers_module=None) -> Union[type, None]:
+    """
+    Sensor class named `name` in the user drivers module, or else among the built-in drivers.
+    """
+    return getattr(drivers_module, name, None) or BUILTIN_DRIVERS.get(name)
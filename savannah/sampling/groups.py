@@ -0,0 +1,114 @@
+#
+# Synchronized acquisition groups
+#
+# Sensors sampled by their own samplers drift apart: each sampler has its own schedule,
+# so their timestamps never line up. A SensorGroup is a sensor made of other sensors:
+# it is sampled by a single sampler, so every tick triggers all the members, and each
+# tick produces one aligned record with the columns of all of them and a single timestamp.
+#
+# Groups are declared in settings.json. Members are configured in custom_settings,
+# as any other sensor, and are only sampled through their group:
+#
+#   "sensors": {
+#       "enabled_sensors": ["Barometer"],
+#       "groups": {"rig": {"sensors": ["Accelerometer", "Gyroscope"], "frequency": 200}},
+#       "custom_settings": {"Accelerometer": {"DRIVER": "SyntheticVector", "CHANNELS": 3}, ...}
+#   }
+#
+# Columns are named '<member>.<magnitude>'. Members with hardware timestamps keep theirs
+# as a '<member>.timestamp' column, and members without new data at a tick get None
+# in their columns, as members whose read fails (the error is logged). Members are read
+# at the same time, in threads, unless their driver does not allow it (Sensor.CONCURRENT_READS),
+# in which case they are read one after the other in the sampler thread.
+#
+
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Sequence
+
+from savannah.core.logging import logger
+from savannah.sampling import clock
+from savannah.sampling.drivers import Sensor
+
+__all__ = [
+    "SensorGroup",
+]
+
+
+class SensorGroup(Sensor):
+    HARDWARE_TIMESTAMPS = True
+
+    def __init__(self, members: Sequence[Sensor], settings: dict = None):
+        if not members:
+            raise ValueError("Sensor group {} has no sensors.".format(self.name()))
+        super().__init__(settings)
+        self.members: List[Sensor] = list(members)
+
+        self.MAGNITUDES_VERBOSE = tuple(
+            '{}.{}'.format(member.name(), magnitude)
+            for member in self.members
+            for magnitude in (*member.MAGNITUDES_VERBOSE, *(('timestamp', ) if member.HARDWARE_TIMESTAMPS else ()))
+        )
+        frequencies = [member.SENSOR_MAX_FREQUENCY for member in self.members if member.SENSOR_MAX_FREQUENCY]
+        self.SENSOR_MAX_FREQUENCY = min(frequencies) if frequencies else None
+        self.SENSOR_DEFAULT_FREQUENCY = min(member.SENSOR_DEFAULT_FREQUENCY or 1 for member in self.members)
+
+        # Columns of each member, filled with None when the member has no new data
+        self.__empty = [(None, ) * (len(member.MAGNITUDES_VERBOSE) + member.HARDWARE_TIMESTAMPS)
+                        for member in self.members]
+        self.__concurrent = [i for i, member in enumerate(self.members) if member.CONCURRENT_READS]
+        self.__sequential = [i for i, member in enumerate(self.members) if not member.CONCURRENT_READS]
+        self.__pool: ThreadPoolExecutor = None
+
+    def open(self):
+        for member in self.members:
+            member.open()
+        # The sampler thread reads one of the members itself
+        if len(self.__concurrent) > 1 or (self.__concurrent and self.__sequential):
+            workers = len(self.__concurrent) - (0 if self.__sequential else 1)
+            self.__pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=self.name())
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+        if self.__pool is not None:
+            # A hung member read must not block the sampler. Reads still queued fail once
+            # their member is closed, where pending futures cannot be cancelled (before 3.9).
+            if sys.version_info >= (3, 9): self.__pool.shutdown(wait=False, cancel_futures=True)
+            else: self.__pool.shutdown(wait=False)
+            self.__pool = None
+        for member in self.members:
+            member.close()
+
+    def read(self):
+        timestamp = clock.now_ns()
+        reads = [None] * len(self.members)
+        if self.__pool is None:
+            for i in range(len(self.members)):
+                reads[i] = self.__read(i)
+        else:
+            # Without sequential members, the sampler thread reads the last concurrent one
+            pooled = self.__concurrent if self.__sequential else self.__concurrent[:-1]
+            futures = [(i, self.__pool.submit(self.__read, i)) for i in pooled]
+            for i in (self.__sequential or self.__concurrent[-1:]):
+                reads[i] = self.__read(i)
+            for i, future in futures:
+                reads[i] = future.result()
+
+        if all(values is None for values in reads):
+            return None
+        record = []
+        for values, empty in zip(reads, self.__empty):
+            record.extend(empty if values is None else values)
+        record.append(timestamp)
+        return tuple(record)
+
+    def __read(self, i: int):
+        # A failing member must not stop the sampling of the rest: its columns are left empty.
+        # Logged as a warning, so that a member failing at every tick is throttled.
+        try:
+            return self.members[i].read()
+        except Exception as exc:
+            logger.warning("Sensor {} of group {} could not be read: {}: {}".format(
+                self.members[i].name(), self.name(), exc.__class__.__name__, exc))
+            return None
@@ -0,0 +1,497 @@
+#
+# Processing pipelines
+#
+# A chain of stages applied to the samples of a sensor between the read and the storage
+# (data, queue, listeners), so that clients get calibrated, filtered samples:
+#
+#   "custom_settings": {
+#       "Thermometer": {
+#           "FREQUENCY": 100,
+#           "PIPELINE": {
+#               "stages": [
+#                   {"stage": "calibrate", "gain": 1.02, "offset": -0.3},
+#                   {"stage": "convert", "from": "C", "to": "K"},
+#                   {"stage": "reject_outliers", "threshold": 4},
+#                   {"stage": "low_pass", "alpha": 0.2},
+#                   {"stage": "decimate", "factor": 10, "average": true}
+#               ],
+#               "batch": 50, "max_delay": 0.5, "worker": false
+#           }
+#       }
+#   }
+#
+# or in drivers.py, as the PIPELINE attribute of the sensor class (stage specs or Stage objects).
+# Custom stages are registered with @stage('name').
+#
+# Stages work on batches of samples with NumPy (an optional dependency, imported when the
+# first pipeline is built): values are a float array of shape (samples, magnitudes), with NaN
+# for missing values, and timestamps an int64 array. Filters skip missing values. Samples are batched until `batch` samples
+# are pending or the oldest one has waited `max_delay` seconds, and processed in the sampler
+# thread, or in a thread of their own if `worker` is true.
+#
+# Pipelines are meant for scalar and vector sensors (one number per magnitude).
+# The '<member>.timestamp' columns of groups are not processed: they are int nanoseconds, kept
+# as they are with the samples that come out of the stages (matched by the sample timestamp),
+# and the columns of the stages only count the other ones.
+#
+
+import math
+import queue
+import threading
+import time
+import warnings
+from typing import Callable, Dict, List, Sequence, Tuple, Union
+
+from savannah.core import metrics
+from savannah.core.logging import logger
+from savannah.sampling import clock
+
+__all__ = [
+    "Stage", "Calibrate", "Convert", "MovingAverage", "LowPass", "RejectOutliers", "Decimate",
+    "Pipeline", "PipelineWorker", "STAGES", "stage", "build_stage", "build_pipeline",
+]
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError as exc:
+        raise ImportError("Processing pipelines require NumPy (pip install numpy).") from exc
+    return numpy
+
+
+#
+# Stages
+#
+
+class Stage:
+    """
+    Processing stage. Stages may keep state between batches (e.g. filters), and may drop samples.
+    columns: indices of the magnitudes processed (all of them by default).
+    """
+
+    def __init__(self, columns: Sequence[int] = None) -> None:
+        self.columns = list(columns) if columns is not None else slice(None)
+
+    def process(self, values, timestamps) -> tuple:
+        """
+        values: float array (samples, magnitudes). timestamps: int64 array (samples, ).
+        Returns the processed (values, timestamps).
+        """
+        raise NotImplementedError
+
+    def reset(self) -> None:
+        """
+        Forgets the state kept between batches.
+        """
+        pass
+
+
+STAGES: Dict[str, type] = dict()
+
+
+def stage(name: str) -> Callable:
+    """
+    Registers a Stage class, so that it can be used by name in settings.
+    """
+    def decorator(cls):
+        STAGES[name] = cls
+        return cls
+    return decorator
+
+
+@stage('calibrate')
+class Calibrate(Stage):
+    """
+    value * gain + offset. Gain and offset are numbers, or lists with one number per column.
+    """
+
+    def __init__(self, gain: Union[float, list] = 1., offset: Union[float, list] = 0., columns=None) -> None:
+        super().__init__(columns)
+        np = _numpy()
+        self.gain = np.asarray(gain, dtype=float)
+        self.offset = np.asarray(offset, dtype=float)
+
+    def process(self, values, timestamps) -> tuple:
+        values[:, self.columns] = values[:, self.columns] * self.gain + self.offset
+        return values, timestamps
+
+
+# unit: (quantity, scale, offset) such that value_in_si = value * scale + offset
+UNITS = {
+    # Temperature
+    'K': ('temperature', 1., 0.), 'C': ('temperature', 1., 273.15), 'F': ('temperature', 5 / 9, 273.15 - 32 * 5 / 9),
+    # Pressure
+    'Pa': ('pressure', 1., 0.), 'hPa': ('pressure', 100., 0.), 'kPa': ('pressure', 1000., 0.),
+    'bar': ('pressure', 1e5, 0.), 'mbar': ('pressure', 100., 0.), 'atm': ('pressure', 101325., 0.),
+    'psi': ('pressure', 6894.757293168, 0.), 'mmHg': ('pressure', 133.322387415, 0.),
+    # Length
+    'm': ('length', 1., 0.), 'cm': ('length', .01, 0.), 'mm': ('length', .001, 0.), 'km': ('length', 1000., 0.),
+    'in': ('length', .0254, 0.), 'ft': ('length', .3048, 0.),
+    # Speed
+    'm/s': ('speed', 1., 0.), 'km/h': ('speed', 1 / 3.6, 0.), 'mph': ('speed', .44704, 0.), 'kn': ('speed', 1852 / 3600, 0.),
+    # Acceleration
+    'm/s2': ('acceleration', 1., 0.), 'g': ('acceleration', 9.80665, 0.),
+    # Angle
+    'rad': ('angle', 1., 0.), 'deg': ('angle', math.pi / 180, 0.),
+    # Electric
+    'V': ('voltage', 1., 0.), 'mV': ('voltage', .001, 0.), 'A': ('current', 1., 0.), 'mA': ('current', .001, 0.),
+}
+
+
+@stage('convert')
+class Convert(Calibrate):
+    """
+    Unit conversion between the units of the same quantity in UNITS.
+    """
+
+    def __init__(self, columns=None, **units) -> None:
+        # 'from' is a keyword: units are given as {'from': ..., 'to': ...}
+        source, target = units.pop('from'), units.pop('to')
+        if units:
+            raise TypeError("Unexpected arguments: {}".format(', '.join(units)))
+        try:
+            (quantity, scale, offset), (target_quantity, target_scale, target_offset) = UNITS[source], UNITS[target]
+        except KeyError as exc:
+            raise ValueError("Unknown unit {}.".format(exc)) from None
+        if quantity != target_quantity:
+            raise ValueError("Cannot convert {} ({}) to {} ({}).".format(source, quantity, target, target_quantity))
+        super().__init__(gain=scale / target_scale, offset=(offset - target_offset) / target_scale, columns=columns)
+
+
+@stage('moving_average')
+class MovingAverage(Stage):
+    """
+    Causal moving average of the last `window` samples (fewer while the first ones arrive).
+    Missing values are left out of the average, which is NaN for windows without any value.
+    """
+
+    def __init__(self, window: int, columns=None) -> None:
+        super().__init__(columns)
+        if window < 1:
+            raise ValueError("The window of a moving average must be positive.")
+        self.window = int(window)
+        self.history = None
+
+    def process(self, values, timestamps) -> tuple:
+        np = _numpy()
+        current = values[:, self.columns]
+        history = self.history if self.history is not None else current[:0]
+        extended = np.concatenate((history, current))
+        valid = ~np.isnan(extended)
+        sums = np.cumsum(np.where(valid, extended, 0.), axis=0)
+        counts = np.cumsum(valid, axis=0)
+        # Sum and count of the values in the window ending at each sample of the batch
+        ends = np.arange(len(history), len(extended))
+        starts = (ends - self.window)[:, None]
+        window_sums = sums[ends] - np.where(starts >= 0, sums[np.maximum(starts[:, 0], 0)], 0.)
+        window_counts = counts[ends] - np.where(starts >= 0, counts[np.maximum(starts[:, 0], 0)], 0)
+        with np.errstate(invalid='ignore'):
+            values[:, self.columns] = window_sums / window_counts
+        self.history = extended[-(self.window - 1):] if self.window > 1 else extended[:0]
+        return values, timestamps
+
+    def reset(self) -> None:
+        self.history = None
+
+
+@stage('low_pass')
+class LowPass(Stage):
+    """
+    First-order IIR low-pass filter (exponential smoothing): y[n] = y[n-1] + alpha * (x[n] - y[n-1]).
+    alpha in ]0, 1]: the smaller, the smoother.
+    Missing values are skipped: the output holds the last state until the next value.
+    """
+
+    def __init__(self, alpha: float, columns=None) -> None:
+        super().__init__(columns)
+        if not 0 < alpha <= 1:
+            raise ValueError("The alpha of a low-pass filter must be in ]0, 1].")
+        self.alpha = float(alpha)
+        self.state = None
+        # With d[k] = w for values and 1 for missing ones, and P[n] = d[0] * ... * d[n],
+        # y[n] = P[n] * (y[-1] + alpha * sum(x[k] / P[k])) is computed with cumulative sums,
+        # in chunks short enough for 1 / P[k] (at most w^-k) not to overflow.
+        decay = 1 - self.alpha
+        self.chunk = max(1, int(-200 / math.log10(decay))) if decay > 0 else None
+
+    def process(self, values, timestamps) -> tuple:
+        np = _numpy()
+        x = values[:, self.columns]
+        if not len(x):
+            return values, timestamps
+        valid = ~np.isnan(x)
+        state = self.state if self.state is not None else np.full(x.shape[1], np.nan)
+        # Columns without a state yet start at their first value
+        unset = np.isnan(state)
+        if unset.any():
+            state = np.where(unset, x[valid.argmax(axis=0), np.arange(x.shape[1])], state)
+        y = np.empty_like(x)
+        if self.chunk is None:
+            # alpha = 1: the output is the last value
+            last = np.maximum.accumulate(np.where(valid, np.arange(len(x))[:, None], -1), axis=0)
+            y[:] = np.where(last >= 0, x[np.maximum(last, 0), np.arange(x.shape[1])], state)
+        else:
+            inputs = np.where(valid, x, 0.)
+            decays = np.where(valid, 1 - self.alpha, 1.)
+            for start in range(0, len(x), self.chunk):
+                end = min(start + self.chunk, len(x))
+                products = np.cumprod(decays[start:end], axis=0)
+                y[start:end] = products * (state + self.alpha * np.cumsum(inputs[start:end] / products, axis=0))
+                state = y[end - 1]
+        # Columns are NaN until their first value
+        if unset.any():
+            y[:, unset] = np.where(np.cumsum(valid[:, unset], axis=0) > 0, y[:, unset], np.nan)
+        self.state = y[-1].copy()
+        values[:, self.columns] = y
+        return values, timestamps
+
+    def reset(self) -> None:
+        self.state = None
+
+
+@stage('reject_outliers')
+class RejectOutliers(Stage):
+    """
+    Drops the samples with values out of [low, high], or further than `threshold` robust
+    standard deviations (median absolute deviation) from the median of the last `window` samples.
+    With drop false, outliers are replaced by NaN instead.
+    """
+
+    def __init__(self, threshold: float = None, window: int = 100, low: float = None, high: float = None,
+                 drop: bool = True, columns=None) -> None:
+        super().__init__(columns)
+        self.threshold = threshold
+        self.window = int(window)
+        self.low, self.high = low, high
+        self.drop = drop
+        self.history = None
+
+    def process(self, values, timestamps) -> tuple:
+        np = _numpy()
+        current = values[:, self.columns]
+        outliers = np.zeros(current.shape, dtype=bool)
+        if self.low is not None: outliers |= current < self.low
+        if self.high is not None: outliers |= current > self.high
+
+        if self.threshold is not None:
+            reference = current if self.history is None else np.concatenate((self.history, current))
+            with warnings.catch_warnings(), np.errstate(invalid='ignore'):
+                # All-NaN columns have no median
+                warnings.simplefilter('ignore', RuntimeWarning)
+                median = np.nanmedian(reference, axis=0)
+                # 1.4826 MAD estimates the standard deviation of normal data
+                deviation = 1.4826 * np.nanmedian(np.abs(reference - median), axis=0)
+                outliers |= np.abs(current - median) > self.threshold * np.where(deviation > 0, deviation, np.inf)
+            accepted = current[~outliers.any(axis=1)]
+            kept = self.history if self.history is not None else accepted[:0]
+            self.history = np.concatenate((kept, accepted))[-self.window:]
+
+        if self.drop:
+            keep = ~outliers.any(axis=1)
+            return values[keep], timestamps[keep]
+        selected = values[:, self.columns]
+        selected[outliers] = np.nan
+        values[:, self.columns] = selected
+        return values, timestamps
+
+    def reset(self) -> None:
+        self.history = None
+
+
+@stage('decimate')
+class Decimate(Stage):
+    """
+    Keeps one out of `factor` samples, or their average if `average` is true
+    (with the timestamp of the last one). All the columns are decimated.
+    """
+
+    def __init__(self, factor: int, average: bool = False, columns=None) -> None:
+        super().__init__(columns)
+        if factor < 1:
+            raise ValueError("The decimation factor must be positive.")
+        self.factor = int(factor)
+        self.average = average
+        self.pending = None
+
+    def process(self, values, timestamps) -> tuple:
+        np = _numpy()
+        if self.pending is not None:
+            values = np.concatenate((self.pending[0], values))
+            timestamps = np.concatenate((self.pending[1], timestamps))
+        complete = len(timestamps) - len(timestamps) % self.factor
+        self.pending = (values[complete:], timestamps[complete:])
+        values, timestamps = values[:complete], timestamps[:complete]
+        if self.average:
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', RuntimeWarning)
+                values = np.nanmean(values.reshape(-1, self.factor, *values.shape[1:]), axis=1)
+        else:
+            values = values[self.factor - 1::self.factor]
+        return values, timestamps[self.factor - 1::self.factor]
+
+    def reset(self) -> None:
+        self.pending = None
+
+
+def build_stage(spec: Union[Stage, dict]) -> Stage:
+    """
+    spec: a Stage, or {'stage': <registered name>, **arguments}.
+    """
+    if isinstance(spec, Stage):
+        return spec
+    arguments = dict(spec)
+    name = arguments.pop('stage', None)
+    try:
+        cls = STAGES[name]
+    except KeyError:
+        raise ValueError("Unknown processing stage {!r}.".format(name)) from None
+    return cls(**arguments)
+
+
+#
+# Pipeline
+#
+
+class Pipeline:
+
+    def __init__(self, stages: Sequence[Union[Stage, dict]], batch: int = 32, max_delay: float = .1,
+                 worker: bool = False, name: str = '', header: Sequence[str] = None) -> None:
+        """
+        batch: samples processed at once.
+        max_delay: maximum seconds a sample waits for its batch to be complete.
+        worker: process the batches in a thread of its own instead of the sampler thread.
+        header: column titles of the samples, to find the timestamp columns of the members of a group.
+        """
+        _numpy()
+        self.stages: List[Stage] = [build_stage(spec) for spec in stages]
+        self.batch = max(1, int(batch))
+        self.max_delay = max_delay
+        self.worker = worker
+        self.name = name
+        # Member timestamps are kept out of the stages, by the timestamp of their sample
+        self.__timestamp_columns = clock.timestamp_columns(header or ())[:-1]
+        self.__value_columns = [i for i in range(len(header or ()) - 1) if i not in self.__timestamp_columns]
+        self.__member_timestamps: Dict[int, tuple] = dict()
+        self.__errors = metrics.counter('pipeline_errors_total', 'Batches dropped because processing failed.',
+                                        sensor=name)
+        self.__seconds = metrics.histogram('pipeline_batch_seconds', 'Time to process a batch of samples.',
+                                           sensor=name)
+
+    def process(self, samples: Sequence[tuple]) -> List[tuple]:
+        """
+        Processes samples (values..., timestamp) and returns the resulting ones.
+        Batches that cannot be processed are logged and dropped, so that sampling goes on.
+        """
+        if not samples:
+            return []
+        np = _numpy()
+        start = time.perf_counter()
+        try:
+            if self.__timestamp_columns:
+                values = np.array([[sample[i] for i in self.__value_columns] for sample in samples], dtype=float)
+                for sample in samples:
+                    self.__member_timestamps[sample[-1]] = tuple(sample[i] for i in self.__timestamp_columns)
+            else:
+                values = np.array([sample[:-1] for sample in samples], dtype=float)
+            timestamps = np.fromiter((sample[-1] for sample in samples), dtype=np.int64, count=len(samples))
+            for processing_stage in self.stages:
+                values, timestamps = processing_stage.process(values, timestamps)
+                if not len(timestamps):
+                    break
+            # Back to Python numbers, as samples without processing
+            processed = [(*row, timestamp) for row, timestamp in zip(values.tolist(), timestamps.tolist())]
+            if self.__timestamp_columns:
+                processed = [self.__with_member_timestamps(sample) for sample in processed]
+                self.__forget_member_timestamps(processed[-1][-1] if processed else None)
+        except Exception as exc:
+            self.__errors.inc()
+            # A warning, throttled if it happens at every batch (counted by pipeline_errors_total)
+            logger.warning("Pipeline of {} dropped {} samples: {}: {}".format(
+                self.name or 'sensor', len(samples), exc.__class__.__name__, exc))
+            return []
+        self.__seconds.observe(time.perf_counter() - start)
+        return processed
+
+    def __with_member_timestamps(self, sample: tuple) -> tuple:
+        # Stages keep the timestamp of one of their input samples (None for the ones they make up)
+        timestamp = sample[-1]
+        member_timestamps = self.__member_timestamps.get(timestamp, (None, ) * len(self.__timestamp_columns))
+        row = [None] * (len(self.__value_columns) + len(self.__timestamp_columns))
+        for i, value in zip(self.__value_columns, sample[:-1]):
+            row[i] = value
+        for i, value in zip(self.__timestamp_columns, member_timestamps):
+            row[i] = value
+        return (*row, timestamp)
+
+    def __forget_member_timestamps(self, last: int = None) -> None:
+        # Samples come out in order: the ones up to the last one are not needed anymore.
+        # Stages may hold samples back (e.g. decimate), but not more than a few batches.
+        kept = [(t, m) for t, m in self.__member_timestamps.items() if last is None or t > last]
+        self.__member_timestamps = dict(kept[-64 * self.batch:])
+
+    def reset(self) -> None:
+        self.__member_timestamps = dict()
+        for processing_stage in self.stages:
+            processing_stage.reset()
+
+
+class PipelineWorker(threading.Thread):
+    """
+    Processes the samples of a sensor out of its sampler thread and hands the results to `store`.
+    """
+
+    def __init__(self, pipeline: Pipeline, store: Callable[[List[tuple]], None], name: str = None) -> None:
+        super().__init__(name=name, daemon=True)
+        self.pipeline = pipeline
+        self.store = store
+        self.queue = queue.Queue()
+        self.__stopped = threading.Event()
+
+    def put(self, sample: tuple) -> None:
+        self.queue.put(sample)
+
+    def run(self) -> None:
+        batch: List[tuple] = []
+        deadline: float = None
+        while not (self.__stopped.is_set() and self.queue.empty()):
+            timeout = self.pipeline.max_delay if deadline is None else max(0., deadline - time.monotonic())
+            try:
+                sample = self.queue.get(timeout=min(timeout, .1))
+                if not batch: deadline = time.monotonic() + self.pipeline.max_delay
+                batch.append(sample)
+            except queue.Empty:
+                pass
+            if batch and (len(batch) >= self.pipeline.batch or time.monotonic() >= deadline):
+                self.__store(batch)
+                batch, deadline = [], None
+        if batch:
+            self.__store(batch)
+
+    def __store(self, batch: List[tuple]) -> None:
+        # The worker must outlive failing listeners: its queue would grow with nobody to empty it
+        try:
+            self.store(self.pipeline.process(batch))
+        except Exception as exc:
+            logger.warning("Samples of {} could not be stored: {}: {}".format(
+                self.pipeline.name or 'sensor', exc.__class__.__name__, exc))
+
+    def stop(self, timeout: float = None) -> None:
+        """
+        Processes the pending samples and stops.
+        """
+        self.__stopped.set()
+        self.join(timeout)
+
+
+def build_pipeline(spec: Union[dict, list, None], name: str = '',
+                   header: Sequence[str] = None) -> Union[Pipeline, None]:
+    """
+    spec: {'stages': [...], 'batch': ..., 'max_delay': ..., 'worker': ...} or just the list of stages.
+    header: column titles of the samples (see Pipeline).
+    """
+    if not spec:
+        return None
+    if isinstance(spec, (list, tuple)):
+        spec = {'stages': spec}
+    return Pipeline(name=name, header=header, **spec)
@@ -1,10 +1,12 @@
-import os, sys, random, pickle, datetime, csv
+import os, sys, random, pickle, datetime, csv, time, math, threading
 from base64 import b32encode
 from dataclasses import dataclass
 from typing import *
 
 from savannah.asynchrony import threads, processes
-from savannah.sampling import drivers
+from savannah.sampling import clock, drivers, processing
+from savannah.core import metrics
+from savannah.core.profiling import profiled
 from savannah.core.exceptions import MisconfiguredSettings
 from savannah.core.logging import logger
 
@@ -65,8 +67,24 @@ class SensorReader:
         #   - Easy data conversion
         # Note: data is 1-indexed because first row are the column titles.
         self.sensor = sensor
+        # Timestamps are int nanoseconds since the epoch (see sampling.clock)
         self.__data: list = [(*self.sensor.MAGNITUDES_VERBOSE, 'timestamp',), ]
         self.__dump: bool = False
+        # Callables notified of every new sample (e.g. server-push streams).
+        # A tuple is replaced instead of mutated so that the sampler thread can iterate it safely.
+        self.__listeners: tuple = ()
+        # Metrics are looked up once, they are updated on every sample
+        self.__samples = metrics.counter('samples_total', 'Samples taken.', sensor=self.sensor.name())
+        self.__read_seconds = metrics.histogram('sensor_read_seconds', 'Time to read a sample from the sensor.',
+                                                sensor=self.sensor.name())
+
+        # Processing pipeline between the reads and the storage (see sampling.processing)
+        self.__pipeline: processing.Pipeline = None
+        self.__worker: processing.PipelineWorker = None
+        self.__pending: list = []
+        self.__pending_since: float = None
+        self.__pipeline_lock = threading.RLock()
+        self.configure_pipeline()
 
         #
         # Data storage configuration
@@ -132,23 +150,103 @@ class SensorReader:
     def __sread(self):
         """
         Se comunica con el módulo sensor para tomar los datos del aparato.
+        Devuelve None si el sensor no tiene datos nuevos.
         """
-        # En principio el código podría transcurrir así;
-        # pero depende de como sea la implementación precisa del sensor.
-
-        # response, errors =   self.sensor.communicate()
-
-        # TODO: replace this
-        return (random.random() * 100, random.random())
+        return self.sensor.read()
 
     def update(self):
         # Rationale: se añade una tupla porque es más eficiente que una lista (el número de columnas no va a variar)
         # (la escalabilidad no es horizontal, sino vertical)
-        read = (*self.__sread(), datetime.datetime.now())
-        self.__data.append(read)
-        if self.__dump:
-            self.queue.put(read)
+        start = time.perf_counter()
+        values = self.__sread()
+        self.__read_seconds.observe(time.perf_counter() - start)
+        if values is None:
+            if self.__pending: self.__process()
+            return
+        read = values if self.sensor.HARDWARE_TIMESTAMPS else (*values, clock.now_ns())
+        self.__samples.inc()
+        if self.__pipeline is None:
+            self.__store((read, ))
+        else:
+            self.__enqueue(read)
+
+    def __enqueue(self, read: tuple):
+        with self.__pipeline_lock:
+            # The pipeline may have been changed since it was checked
+            if self.__worker is not None:
+                self.__worker.put(read)
+            elif self.__pipeline is None:
+                self.__store((read, ))
+            else:
+                if not self.__pending: self.__pending_since = time.monotonic()
+                self.__pending.append(read)
+                self.__process()
+
+    def __process(self, flush: bool = False):
+        # Pending samples are processed once the batch is complete or the oldest one is too old
+        with self.__pipeline_lock:
+            pipeline = self.__pipeline
+            if not self.__pending or not (flush or len(self.__pending) >= pipeline.batch or
+                                          time.monotonic() - self.__pending_since >= pipeline.max_delay):
+                return
+            batch, self.__pending = self.__pending, []
+            self.__store(pipeline.process(batch))
+
+    def __store(self, samples):
+        self.__data.extend(samples)
+        for read in samples:
+            if self.__dump:
+                self.queue.put(read)
+            for listener in self.__listeners:
+                # A failing listener (e.g. a stream) must not stop the sampler: it is removed
+                try:
+                    listener(self.sensor.name(), read)
+                except Exception as exc:
+                    logger.error("Listener {} of {} failed and has been removed: {}: {}".format(
+                        listener, self.sensor.name(), exc.__class__.__name__, exc))
+                    self.remove_listener(listener)
+
+    def configure_pipeline(self) -> None:
+        """
+        (Re)builds the processing pipeline from the sensor settings (PIPELINE), or else from the
+        PIPELINE attribute of the sensor class. Samples pending in the previous one are processed first.
+        """
+        settings = self.sensor.settings
+        spec = settings.get('PIPELINE', settings.get('pipeline')) or self.sensor.PIPELINE
+        pipeline = processing.build_pipeline(spec, name=self.sensor.name(), header=self.__data[0])
+        with self.__pipeline_lock:
+            self.close()
+            self.__pipeline = pipeline
+            if pipeline is not None and pipeline.worker:
+                self.__worker = processing.PipelineWorker(pipeline, self.__store,
+                                                          name='{}Pipeline'.format(self.sensor.name()))
+                self.__worker.start()
+
+    def close(self) -> None:
+        """
+        Processes the samples pending in the pipeline.
+        """
+        with self.__pipeline_lock:
+            if self.__worker is not None:
+                self.__worker.stop()
+                self.__worker = None
+            if self.__pipeline is not None:
+                self.__process(flush=True)
 
+    @property
+    def pipeline(self) -> 'processing.Pipeline':
+        return self.__pipeline
+
+    def add_listener(self, listener: Callable[[str, tuple], None]) -> None:
+        self.__listeners = self.__listeners + (listener,)
+
+    def remove_listener(self, listener: Callable[[str, tuple], None]) -> None:
+        self.__listeners = tuple(_ for _ in self.__listeners if _ != listener)
+
+    @property
+    def sequence(self) -> int:
+        """Number of samples taken. It only changes when new data is available."""
+        return len(self.__data) - 1
 
     def retrieve_last(self, key):
         return {'last_key': len(self.data)-1,
@@ -171,28 +269,73 @@ class SensorSampler(threads.ThreadedLoop):
 
     def __init__(self, reader: SensorReader):
         self.reader = reader
-        self.sampling_frequency = self.reader.sensor.settings.get(
-            'FREQUENCY',
-            self.reader.sensor.SENSOR_DEFAULT_FREQUENCY)
-
-        # Boundary conditions for valid frequency
-        if not isinstance(self.sampling_frequency, (int, float)) and \
-                0 < self.sampling_frequency <= self.reader.sensor.SENSOR_DEFAULT_FREQUENCY:
-            raise ValueError("Sampling frequency must be an integer or float in the interval ]0, {max}]".format(
-                max=self.reader.sensor.SENSOR_MAX_FREQUENCY))
+        self.sampling_frequency = self.validate_frequency(self.settings_frequency(self.reader.sensor))
 
         super().__init__(
             interval=1/self.sampling_frequency,
             name=self.reader.sensor.name(),
             is_daemon=False)
 
+        self.__jitter = metrics.histogram('sampler_jitter_seconds',
+                                          'Delay of the samples from their scheduled time.',
+                                          sensor=self.reader.sensor.name())
+        self.__missed = metrics.counter('sampler_missed_ticks_total',
+                                        'Samples skipped because the previous ones took too long.',
+                                        sensor=self.reader.sensor.name())
+
+    @staticmethod
+    def settings_frequency(sensor: drivers.Sensor) -> float:
+        return sensor.settings.get('FREQUENCY', sensor.settings.get('frequency')) or \
+            sensor.SENSOR_DEFAULT_FREQUENCY
+
+    def validate_frequency(self, frequency) -> float:
+        # Boundary conditions for valid frequency
+        max_frequency = self.reader.sensor.SENSOR_MAX_FREQUENCY
+        if not isinstance(frequency, (int, float)) or isinstance(frequency, bool) or frequency <= 0 or \
+                (max_frequency is not None and frequency > max_frequency):
+            raise ValueError("Sampling frequency must be an integer or float in the interval ]0, {max}]".format(
+                max=max_frequency))
+        return frequency
+
+    def retune(self, frequency: float) -> None:
+        """
+        Changes the sampling frequency while sampling. It takes effect after the ongoing interval.
+        """
+        self.sampling_frequency = self.validate_frequency(frequency)
+        self.interval = 1 / frequency
+        logger.info("Sensor {name} now samples at a frequency {freq}".format(name=self.name, freq=frequency))
+
+    @profiled('sampler.task')
     def task(self):
         self.reader.update()
 
     def _loop_target(self, queue_proxy):
         self.reader.queue = queue_proxy
+        self.reader.sensor.open()
         logger.info("Sensor {name} has started sampling at a frequency {freq}".format(name=self.reader.sensor.name(), freq=self.sampling_frequency))
-        super()._loop_target()
+        try:
+            self.__tick_loop()
+        finally:
+            self.reader.sensor.close()
+            self.reader.close()
+
+    def __tick_loop(self):
+        # Samples are taken on a fixed schedule (a tick every interval from the start),
+        # instead of sleeping an interval after each sample: the time spent sampling
+        # does not accumulate as drift. Ticks that have already passed are skipped.
+        next_tick = time.perf_counter()
+        while self.continue_flag:
+            self.__jitter.observe(max(0., time.perf_counter() - next_tick))
+            self.task()
+            interval = self.interval
+            next_tick += interval
+            delay = next_tick - time.perf_counter()
+            if delay < 0:
+                missed = math.ceil(-delay / interval)
+                self.__missed.inc(missed)
+                next_tick += missed * interval
+                delay += missed * interval
+            time.sleep(delay)
 
 
 class SamplingManager(threads.ReverseManagerMixin):
@@ -200,10 +343,24 @@ class SamplingManager(threads.ReverseManagerMixin):
         for sampler in self.wrappers_list:
             sampler.start(queue_proxy=sampling_proxies[sampler.reader.sensor.name()])
 
-    def stop_all(self):
+    def stop_all(self, timeout: float = None):
         for sampler in self.wrappers_list:
-            sampler.stop()
-            SensorSampler().stop()
+            sampler.stop(timeout=timeout)
+
+    def add_sampler(self, sampler: SensorSampler, queue_proxy) -> None:
+        """
+        Adds and starts a sampler while the rest keep sampling.
+        """
+        self.add_wrapper(wrapper=sampler, reverse=True, manager=self)
+        sampler.start(queue_proxy=queue_proxy)
+
+    def remove_sampler(self, name: str, timeout: float = None) -> SensorSampler:
+        """
+        Stops and removes a sampler while the rest keep sampling.
+        """
+        sampler = self.remove_wrapper(name)
+        sampler.stop(timeout=timeout)
+        return sampler
 
 class Utils:
     make_sampler = lambda sensor: SensorSampler(SensorReader(sensor))
@@ -0,0 +1,17 @@
+#
+# User modules of the project
+#
+# The user modules (interpreter.py, drivers.py...) are registered as savannah.user.<name>
+# by savannah.core.environ, so that they do not shadow other top-level modules.
+# Importing this package loads them: the forkserver imports it to load them once for all
+# the workers (see environ.preload_modules), and processes that unpickle a class of a user
+# module they have not loaded yet get it loaded by the import system.
+#
+
+from savannah.core import environ as _environ
+
+try:
+    _environ.preload()
+except Exception as exc:  # Workers will load them on their own
+    from savannah.core.logging import logger
+    logger.warning("User modules could not be preloaded: {}".format(exc))
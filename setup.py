@@ -12,7 +12,8 @@ setup(
     install_requires=[
         # These are the requisites for an official installation.
         # requirements.txt indicates requirements for testing and development.
-        # 'networkx==2.1',
+        # 'networkx==2.1',  # Optional: only used by PipeNetwork.as_graph for analysis.
+        # 'msgpack>=1.0',  # Optional: C backend of the 'pack' response serializer.
         # 'numpy==1.15.1',
         # 'pandas==0.23.4',
         # 'pyyaml==3.13',
@@ -0,0 +1,66 @@
+#
+# Dispatch benchmark: cost per request of CPUInterpreter.raw_run.
+#
+# "argparse" reproduces the dispatch path before compiled signatures:
+# split + argparse.parse_args + json.loads + set() building from co_varnames
+# + annotation checks on every request.
+# "compiled" is the current fast path (direct tokenizer + precompiled validator).
+#
+# Usage: python bench_dispatch.py [--number 20000]
+#
+
+import argparse
+import json
+import timeit
+
+from savannah.iounit.interpreter import CPUInterpreter, Utils
+
+
+class Interpreter(CPUInterpreter):
+    def __map__(self):
+        self.mapped_commands.update({
+            'status': self.status,
+            'echo': self.echo,
+        })
+
+    def status(self):
+        return 'ok'
+
+    def echo(self, value: int, name: str = 'echo', last_key: dict = None):
+        return value
+
+
+def legacy_run(interpreter: CPUInterpreter, content: str):
+    namespace = interpreter.parser.parse_args(content.split(' ', 2))
+    arg_str = namespace.kwargs.strip() if namespace.kwargs else str()
+    parsed_args = json.loads(arg_str) if arg_str is not str() else None
+    selected_func = interpreter.mapped_commands[namespace.command]
+    if parsed_args:
+        if not set(parsed_args.keys()) < set(selected_func.__code__.co_varnames):
+            raise ValueError
+        if not all(type(value) is selected_func.__annotations__.get(key) for key, value in parsed_args.items()):
+            raise ValueError
+    return selected_func(**parsed_args) if parsed_args else selected_func()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='CPUInterpreter dispatch benchmark.')
+    parser.add_argument('--number', type=int, default=20000)
+    args = parser.parse_args()
+
+    interpreter = Interpreter()
+    requests = {
+        'no kwargs': Utils.build_command('status'),
+        '3 kwargs': Utils.build_command('echo', value=1, name='x', last_key={'a': 1}),
+    }
+
+    print('{:<12} {:>16} {:>16} {:>10}'.format('request', 'argparse (us)', 'compiled (us)', 'speedup'))
+    for label, content in requests.items():
+        assert legacy_run(interpreter, content) == interpreter.raw_run(content)
+        before = timeit.timeit(lambda: legacy_run(interpreter, content), number=args.number) / args.number
+        after = timeit.timeit(lambda: interpreter.raw_run(content), number=args.number) / args.number
+        print('{:<12} {:>16.2f} {:>16.2f} {:>9.1f}x'.format(label, before * 1e6, after * 1e6, before / after))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+#
+# Processing pipeline benchmark: cost per sample of a calibration, moving average and
+# low-pass chain, processed per sample in Python (as clients do today) and in NumPy
+# batches by a Pipeline.
+#
+# Usage: python bench_processing.py [--channels 8] [--batch 64] [--samples 20000]
+#
+
+import argparse
+import collections
+import random
+import time
+
+from savannah.sampling.processing import Pipeline
+
+
+def python_chain(samples, channels: int):
+    windows = [collections.deque(maxlen=5) for _ in range(channels)]
+    states = [None] * channels
+    out = []
+    for sample in samples:
+        row = []
+        for i in range(channels):
+            value = sample[i] * 1.02 - .3
+            windows[i].append(value)
+            value = sum(windows[i]) / len(windows[i])
+            states[i] = value if states[i] is None else states[i] + .2 * (value - states[i])
+            row.append(states[i])
+        out.append((*row, sample[-1]))
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Processing pipeline benchmark.')
+    parser.add_argument('--channels', type=int, default=8)
+    parser.add_argument('--batch', type=int, default=64)
+    parser.add_argument('--samples', type=int, default=20000)
+    args = parser.parse_args()
+
+    samples = [(*(random.random() for _ in range(args.channels)), i) for i in range(args.samples)]
+    pipeline = Pipeline([{'stage': 'calibrate', 'gain': 1.02, 'offset': -.3},
+                         {'stage': 'moving_average', 'window': 5},
+                         {'stage': 'low_pass', 'alpha': .2}])
+
+    start = time.perf_counter()
+    python_chain(samples, args.channels)
+    per_sample = (time.perf_counter() - start) / args.samples
+
+    start = time.perf_counter()
+    for i in range(0, args.samples, args.batch):
+        pipeline.process(samples[i:i + args.batch])
+    batched = (time.perf_counter() - start) / args.samples
+
+    print('{:<14} {:>12}'.format('processing', 'time (us)'))
+    print('{:<14} {:>12.2f}'.format('per sample', per_sample * 1e6))
+    print('{:<14} {:>12.2f}'.format('batched', batched * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+#
+# Serializer benchmark: encode/decode time and size of typical interpreter responses.
+#
+# "pickle" is the previous response path; "pack" is the default serializer
+# (msgpack backend if installed) and "pack (python)" its pure-Python fallback.
+#
+# Usage: python bench_serializers.py [--number 2000]
+#
+
+import argparse
+import datetime
+import random
+import timeit
+
+import numpy as np
+
+from savannah.iounit.serializers import PackSerializer, PickleSerializer
+
+
+def responses() -> dict:
+    now = datetime.datetime.now()
+    samples = [(random.random() * 100, random.random(), now + datetime.timedelta(seconds=i)) for i in range(500)]
+    return {
+        'status': {'running': True, 'sensors': ['temperature', 'humidity', 'pressure'], 'uptime': 3600.5},
+        'updates': {'last_key': 500, 'data': [('temperature', 'humidity', 'timestamp')] + samples},
+        'summary': {name: {'mean': random.random(), 'std': random.random(), 'n': 500}
+                    for name in ('temperature', 'humidity', 'pressure', 'wind', 'light')},
+        'array': np.random.random((500, 3)),
+        'batch': [{'ok': True, 'data': {'value': i}} for i in range(50)],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Response serializers benchmark.')
+    parser.add_argument('--number', type=int, default=2000)
+    args = parser.parse_args()
+
+    serializers = {'pickle': PickleSerializer(), 'pack': PackSerializer(),
+                   'pack (python)': PackSerializer(use_msgpack=False)}
+    print('pack backend: {}'.format(serializers['pack'].backend))
+    print('{:<10} {:<14} {:>12} {:>12} {:>10}'.format('response', 'serializer', 'encode (us)', 'decode (us)', 'bytes'))
+
+    for label, response in responses().items():
+        for name, serializer in serializers.items():
+            payload = serializer.dumps(response)
+            number = max(args.number // (20 if 'python' in name else 1), 1)
+            encode = timeit.timeit(lambda: serializer.dumps(response), number=number) / number
+            decode = timeit.timeit(lambda: serializer.loads(payload), number=number) / number
+            print('{:<10} {:<14} {:>12.1f} {:>12.1f} {:>10}'.format(label, name, encode * 1e6, decode * 1e6,
+                                                                   len(payload)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+#
+# Settings benchmark: cost of loading a large settings file and accessing it during startup.
+#
+# "deepcopy" reproduces the previous Configuration.data: every access deep-copied
+# the whole tree and created new namedtuple classes recursively.
+# "cached" is the current behaviour: the Box is built once (sharing namedtuple classes).
+#
+# Usage: python bench_settings.py [--sensors 200] [--accesses 20]
+#
+
+import argparse
+import collections.abc
+import copy
+import json
+import os
+import tempfile
+import time
+
+from savannah.core.extensions.config import Configuration
+
+
+def legacy_box(mapping):
+    _mapping = copy.deepcopy(mapping)
+    if isinstance(_mapping, collections.abc.Mapping):
+        for key, value in _mapping.items():
+            _mapping[key] = legacy_box(value)
+        return collections.namedtuple('Box', _mapping.keys())(**_mapping)
+    return _mapping
+
+
+def make_settings(sensors: int) -> dict:
+    return {
+        'workflow': {'live_upload': False, 'temp_data': {'enable': True, 'path': 'temp'},
+                     'server': {'address': {'host': '127.0.0.1', 'port': 8000}},
+                     'localui': {'enabled': False, 'address': {'host': '127.0.0.1', 'port': 8001}}},
+        'log': {'brief': {'path': 'logs'}, 'detailed': {'path': 'logs'}},
+        'sensors': {
+            'enabled_sensors': ['Sensor{}'.format(i) for i in range(sensors)],
+            'custom_settings': {'Sensor{}'.format(i): {'port': '/dev/tty{}'.format(i), 'frequency': 10,
+                                                       'calibration': {'offset': 0.1, 'gain': 1.02},
+                                                       'channels': list(range(8))}
+                                for i in range(sensors)},
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Settings loading benchmark.')
+    parser.add_argument('--sensors', type=int, default=200)
+    parser.add_argument('--accesses', type=int, default=20,
+                        help='Configuration.data accesses during startup (settings module, loggers, units...)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'settings.json')
+        with open(path, 'w') as file:
+            json.dump(make_settings(args.sensors), file)
+        print('settings.json: {} bytes, {} accesses'.format(os.path.getsize(path), args.accesses))
+
+        start = time.perf_counter()
+        config = Configuration(path)
+        for _ in range(args.accesses):
+            legacy_box(config.as_dict).workflow.server.address.port
+        before = time.perf_counter() - start
+
+        start = time.perf_counter()
+        config = Configuration(path)
+        for _ in range(args.accesses):
+            config.data.workflow.server.address.port
+        after = time.perf_counter() - start
+
+    print('{:<10} {:>12}'.format('', 'total (ms)'))
+    print('{:<10} {:>12.2f}'.format('deepcopy', before * 1e3))
+    print('{:<10} {:>12.2f}'.format('cached', after * 1e3))
+    print('speedup: {:.1f}x'.format(before / after))
+
+
+if __name__ == '__main__':
+    main()
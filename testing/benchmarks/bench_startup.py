@@ -0,0 +1,86 @@
+#
+# Startup benchmark: time-to-first-task of ProcessManager workers.
+#
+# For each start method, N workers are started and each one reports the
+# (system-wide) monotonic time at which its task began. The time-to-first-task
+# is the time from the first .start call until the last worker began.
+# Workers import the modules a unit process needs, so preloading them
+# (forkserver) is reflected in the results.
+#
+# The forkserver is global to the interpreter, so every configuration is
+# measured in a fresh interpreter.
+#
+# Usage: python bench_startup.py [--workers 1 16] [--repeat 3]
+#
+
+import argparse
+import json
+import subprocess
+import sys
+import time
+import multiprocessing as mp
+
+from savannah.asynchrony import processes
+
+
+PRELOAD = ['savannah.asynchrony.processes', 'savannah.sampling.sampler', 'numpy']
+
+
+class BenchProcess(processes.Process):
+    @staticmethod
+    def task(pipe_map: dict, queue):
+        import importlib
+        for module in PRELOAD:
+            importlib.import_module(module)
+        queue.put(time.monotonic())
+
+
+def time_to_first_task(workers: int, start_method: str, preload: bool) -> float:
+    manager = processes.ProcessManager(enable_ioserver=False, start_method=start_method,
+                                       preload=PRELOAD if preload else None)
+    queue = manager.context.Queue()
+    pool = [BenchProcess(manager=manager, name='Bench{}'.format(i)) for i in range(workers)]
+
+    t0 = time.monotonic()
+    for process in pool:
+        process.start(queue=queue)
+    elapsed = max(queue.get() for _ in pool) - t0
+
+    for process in pool:
+        process.wait()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ProcessManager time-to-first-task benchmark.')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 16])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--run', nargs=2, metavar=('START_METHOD', 'PRELOAD'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        # Child interpreter: measure a single configuration and report it as JSON.
+        start_method, preload = args.run[0], args.run[1] == '1'
+        print(json.dumps({workers: min(time_to_first_task(workers, start_method, preload)
+                                       for _ in range(args.repeat))
+                          for workers in args.workers}))
+        return
+
+    configurations = [('fork', False), ('fork', True), ('spawn', False),
+                      ('forkserver', False), ('forkserver', True)]
+    available = mp.get_all_start_methods()
+
+    print('{:<24} {:>8} {:>14}'.format('start method', 'workers', 'ttft (ms)'))
+    for start_method, preload in configurations:
+        if start_method not in available:
+            continue
+        out = subprocess.check_output([sys.executable, __file__, '--run', start_method, str(int(preload)),
+                                       '--repeat', str(args.repeat),
+                                       '--workers', *map(str, args.workers)])
+        label = start_method + (' + preload' if preload else '')
+        for workers, elapsed in json.loads(out).items():
+            print('{:<24} {:>8} {:>14.1f}'.format(label, workers, elapsed * 1000))
+
+
+if __name__ == '__main__':
+    main()
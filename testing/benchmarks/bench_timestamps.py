@@ -0,0 +1,45 @@
+#
+# Sample timestamps benchmark: datetime.now() (the previous stamp) against
+# int nanoseconds of the anchored monotonic clock.
+#
+# "time" is the cost of stamping a sample; "memory" is what a stored sample
+# of two values and its timestamp takes (the tuple included).
+#
+# Usage: python bench_timestamps.py [--samples 100000]
+#
+
+import argparse
+import datetime
+import random
+import timeit
+import tracemalloc
+
+from savannah.sampling import clock
+
+
+def stored(stamp, samples: int) -> float:
+    tracemalloc.start()
+    data = [(random.random(), random.random(), stamp()) for _ in range(samples)]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del data
+    return size / samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sample timestamps benchmark.')
+    parser.add_argument('--samples', type=int, default=100000)
+    args = parser.parse_args()
+
+    cases = {
+        'datetime.now': datetime.datetime.now,
+        'clock.now_ns': clock.now_ns,
+    }
+    print('{:<14} {:>10} {:>14}'.format('timestamp', 'time (ns)', 'memory (bytes)'))
+    for name, stamp in cases.items():
+        time = timeit.timeit(stamp, number=args.samples) / args.samples
+        print('{:<14} {:>10.1f} {:>14.1f}'.format(name, time * 1e9, stored(stamp, args.samples)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+#
+# Detailed log benchmark: cost of the stack trace of a WARNING record.
+#
+# "format_stack" is the previous DetailedStyler (traceback.format_stack of the whole stack);
+# "capture" walks the frames without reading the source, and "deduplicated" is what is
+# written for a trace already seen (a one-line summary).
+#
+# Usage: python bench_traces.py [--depth 30] [--number 20000]
+#
+
+import argparse
+import logging
+import timeit
+import traceback
+
+from savannah.core.logging.traces import capture_stack, TraceDeduplicator
+
+
+def nested(depth: int, func):
+    if depth: return nested(depth - 1, func)
+    return func()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Detailed log traces benchmark.')
+    parser.add_argument('--depth', type=int, default=30, help='Frames below the log call.')
+    parser.add_argument('--number', type=int, default=20000)
+    args = parser.parse_args()
+
+    # As if the log call was `return func()` in nested
+    record = logging.makeLogRecord({'pathname': __file__, 'lineno': nested.__code__.co_firstlineno + 2})
+    deduplicator = TraceDeduplicator()
+    stack = nested(args.depth, lambda: capture_stack(record))
+    assert len(stack) > args.depth
+    deduplicator.format(stack)
+
+    cases = {
+        'format_stack': lambda: traceback.format_stack(),
+        'capture': lambda: capture_stack(record),
+        'deduplicated': lambda: deduplicator.format(capture_stack(record)),
+    }
+    print('{:<14} {:>12}'.format('trace', 'time (us)'))
+    for name, func in cases.items():
+        time = timeit.timeit(lambda: nested(args.depth, func), number=args.number) / args.number
+        print('{:<14} {:>12.2f}'.format(name, time * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,31 @@
+import json
+
+from savannah.core.actions.bench import Bench, compare, percentile, slope
+
+
+def test_bench(tmp_path):
+    output = str(tmp_path / 'bench.json')
+    report = Bench.action(sensors=2, frequency=20., clients=2, poll=.05, duration=1.5, warmup=.5, output=output)
+    with open(output) as file:
+        assert json.load(file) == json.loads(json.dumps(report))
+
+    results = report['results']
+    assert results['target_rate'] == 40.
+    assert 20. < results['sample_rate'] < 60.
+    assert results['requests'] > 20 and results['request_errors'] == 0
+    # Every client receives every sample
+    assert results['delivered_rate'] > 20.
+    assert 0 < results['latency_p50'] <= results['latency_p99'] <= results['latency_max']
+    assert results['cpu_per_sample'] > 0 and results['memory_end'] > 0
+    assert set(results['per_sensor']) == {'Bench0', 'Bench1'}
+
+
+def test_compare():
+    baseline = {'sample_rate': 100., 'latency_p99': .01, 'memory_growth_per_hour': 0.}
+    assert compare(baseline, {'sample_rate': 95., 'latency_p99': .0105, 'memory_growth_per_hour': -1.}, .1) == []
+    assert compare(baseline, {'sample_rate': 80., 'latency_p99': .02}, .1) == ['sample_rate', 'latency_p99']
+
+
+def test_statistics():
+    assert percentile([1, 2, 3, 4], .5) == 2 and percentile([1, 2, 3, 4], .99) == 4
+    assert slope([(0, 1), (1, 3), (2, 5)]) == 2.
@@ -0,0 +1,51 @@
+import datetime
+import time
+
+import numpy as np
+from savannah.iounit.interpreter import Stream
+from savannah.sampling import clock
+from savannah.sampling.drivers import SyntheticScalar
+
+
+def test_timestamps():
+    before = time.time_ns()
+    stamps = [clock.now_ns() for _ in range(1000)]
+    assert stamps == sorted(stamps) and all(type(stamp) is int for stamp in stamps)
+    # Anchored to the wall clock
+    assert abs(stamps[0] - before) < 50000000
+
+    stamp = clock.from_datetime(datetime.datetime(2020, 2, 29, 23, 59, 59, 999999))
+    assert clock.to_datetime(stamp + 999) == datetime.datetime(2020, 2, 29, 23, 59, 59, 999999)
+
+
+def test_with_datetimes():
+    stamp = clock.now_ns()
+    rows = clock.with_datetimes([('value', 'timestamp'), (1.5, stamp)])
+    assert rows == [('value', 'timestamp'), (1.5, clock.to_datetime(stamp))]
+
+    # Every timestamp column of a group is converted, NumPy integers included
+    header = ('A.value', 'B.value', 'B.timestamp', 'timestamp')
+    rows = clock.with_datetimes([(1.5, 2.5, np.int64(stamp), stamp), (1.5, None, None, stamp)], header)
+    assert rows == [(1.5, 2.5, clock.to_datetime(stamp), clock.to_datetime(stamp)),
+                    (1.5, None, None, clock.to_datetime(stamp))]
+
+
+def test_stream_timestamps():
+    class Reader:
+        data = [('value', 'timestamp')]
+        def add_listener(self, listener): self.listener = listener
+
+    stamp = clock.now_ns()
+    for raw, expected in ((False, clock.to_datetime(stamp)), (True, stamp)):
+        stream = Stream({'temp': Reader()}, raw_timestamps=raw)
+        stream.push('temp', (20.5, stamp))
+        assert stream.next_frame(timeout=1)['data'] == {'temp': [(20.5, expected)]}
+
+
+def test_hardware_timestamps():
+    sensor = SyntheticScalar({'HARDWARE_TIMESTAMPS': True, 'LATENCY': .05})
+    sensor.open()
+    before = clock.now_ns()
+    value, stamp = sensor.read()
+    # Stamped when the read started, not after the latency of the device
+    assert before <= stamp < before + 40000000
@@ -0,0 +1,65 @@
+import json
+import os
+
+import pytest
+from savannah.core.extensions.config import Configuration
+from savannah.core.extensions.tupperware import unbox
+
+SETTINGS = {
+    'workflow': {'live_upload': False, 'server': {'address': {'host': '127.0.0.1', 'port': 8000}}},
+    'sensors': {'enabled_sensors': ['Thermometer'], 'custom_settings': {'Thermometer': {'port': 1}}},
+}
+
+
+@pytest.fixture
+def config(tmpdir):
+    path = str(tmpdir.join('settings.json'))
+    with open(path, 'w') as file:
+        json.dump(SETTINGS, file)
+    return Configuration(path)
+
+
+def test_box_is_cached_and_immutable(config):
+    data = config.data
+    assert data is config.data
+    assert data.workflow.server.address.port == 8000
+    assert data.sensors.enabled_sensors == ('Thermometer',)
+    with pytest.raises(AttributeError):
+        data.workflow.live_upload = True
+    # Boxing does not touch the loaded data
+    assert unbox(data) == SETTINGS == config.as_dict
+
+
+def test_box_invalidation(config):
+    data = config.data
+    config.as_dict['workflow']['live_upload'] = True
+    assert config.data is data
+    assert config.save()
+    assert config.data.workflow.live_upload is True
+
+    # Changes made by someone else are picked up by refresh
+    assert not config.refresh()
+    with open(config.config_path, 'w') as file:
+        json.dump(dict(SETTINGS, info={'name': 'changed'}), file)
+    os.utime(config.config_path, (0, 0))
+    assert config.is_stale and config.refresh()
+    assert config.data.info.name == 'changed'
+
+
+def test_invalid_file_is_read_once(config, monkeypatch):
+    from savannah.core.extensions import config as config_module
+    warnings = []
+    monkeypatch.setattr(config_module, 'logger', type('Logger', (), {'warning': staticmethod(warnings.append)}))
+
+    with open(config.config_path, 'w') as file:
+        file.write('{"workflow": ')
+    os.utime(config.config_path, (0, 0))
+    for _ in range(3):
+        assert config.refresh() == []
+    assert len(warnings) == 1 and config.data.workflow.server.address.port == 8000
+
+    # It is read again once it is modified
+    with open(config.config_path, 'w') as file:
+        json.dump(dict(SETTINGS, info={'name': 'fixed'}), file)
+    os.utime(config.config_path, (1, 1))
+    assert config.refresh() and config.data.info.name == 'fixed'
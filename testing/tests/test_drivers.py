@@ -0,0 +1,56 @@
+import time
+
+import pytest
+
+from savannah.sampling.drivers import (PortNotOpenError, SyntheticScalar, SyntheticVector, SyntheticWaveform,
+                                       find_driver)
+
+
+def opened(sensor):
+    sensor.open()
+    return sensor
+
+
+def test_payload_shapes():
+    scalar = opened(SyntheticScalar({'CHANNELS': 4}))
+    assert scalar.MAGNITUDES_VERBOSE == ('value', ) and len(scalar.read()) == 1
+
+    vector = opened(SyntheticVector({'CHANNELS': 3, 'NOISE': 0, 'AMPLITUDE': 2.}))
+    assert vector.MAGNITUDES_VERBOSE == ('ch0', 'ch1', 'ch2')
+    values = vector.read()
+    assert len(values) == 3 and all(-2. <= value <= 2. for value in values)
+
+    waveform = opened(SyntheticWaveform({'CHANNELS': 2, 'BLOCK': 50, 'FREQUENCY': 20}))
+    assert waveform.sample_rate == 1000.
+    block = waveform.read()
+    assert len(block) == 2 and all(len(channel) == 50 for channel in block)
+
+
+def test_closed_sensor():
+    sensor = SyntheticVector()
+    with pytest.raises(PortNotOpenError):
+        sensor.read()
+    opened(sensor).close()
+    with pytest.raises(PortNotOpenError):
+        sensor.read()
+
+
+def test_bursts_and_latency():
+    sensor = opened(SyntheticScalar({'BURST_PERIOD': .1, 'DUTY_CYCLE': .5, 'LATENCY': .001}))
+    reads, start = [], time.monotonic()
+    while time.monotonic() - start < .3:
+        reads.append(sensor.read())
+    assert any(read is None for read in reads) and any(read is not None for read in reads)
+    # Each read takes at least the injected latency
+    assert len(reads) <= .3 / .001
+
+    with pytest.raises(ValueError):
+        SyntheticVector({'DUTY_CYCLE': 0})
+
+
+def test_find_driver():
+    class Module:
+        SyntheticVector = object
+    assert find_driver('SyntheticVector') is SyntheticVector
+    assert find_driver('SyntheticVector', Module) is object
+    assert find_driver('Missing', Module) is None
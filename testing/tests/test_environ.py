@@ -0,0 +1,52 @@
+import os
+import pickle
+import sys
+
+import pytest
+
+from savannah.core import environ
+
+
+@pytest.fixture
+def user_module(tmp_path):
+    path = tmp_path / 'user_drivers.py'
+    path.write_text('class Sensor:\n    VERSION = 1\n')
+    yield str(path)
+    environ.clear_cache()
+    sys.modules.pop('savannah.user.user_drivers', None)
+
+
+def test_load_module_is_cached(user_module):
+    module = environ.load_module('user_drivers', file_path=user_module)
+    assert environ.load_module('user_drivers', file_path=user_module) is module
+    # Registered in the user package, so that it does not shadow top-level modules
+    assert sys.modules['savannah.user.user_drivers'] is module and 'user_drivers' not in sys.modules
+    # Classes can be pickled by reference since the module is registered
+    assert pickle.loads(pickle.dumps(module.Sensor)) is module.Sensor
+
+
+def test_load_module_reloads_changed_file(user_module):
+    module = environ.load_module('user_drivers', file_path=user_module)
+    with open(user_module, 'w') as file:
+        file.write('class Sensor:\n    VERSION = 2\n')
+    stat = os.stat(user_module)
+    os.utime(user_module, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+    reloaded = environ.load_module('user_drivers', file_path=user_module)
+    assert reloaded is not module and reloaded.Sensor.VERSION == 2
+    assert environ.load_module('user_drivers', file_path=user_module, reload=True) is not reloaded
+
+
+def test_load_module_failure_is_not_registered(user_module):
+    with open(user_module, 'w') as file:
+        file.write('raise ValueError\n')
+    with pytest.raises(ValueError):
+        environ.load_module('user_drivers', file_path=user_module)
+    assert 'savannah.user.user_drivers' not in sys.modules
+
+
+def test_preload_modules():
+    assert environ.preload_modules('fork') == []
+    assert environ.preload_modules('forkserver') == ['savannah.user']
+    # Nothing is left in the environment of later subprocesses
+    assert not any(name.startswith('SAVANNAH_PRELOAD') for name in os.environ)
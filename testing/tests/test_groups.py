@@ -0,0 +1,115 @@
+import threading
+import time
+
+import pytest
+
+from savannah.sampling.drivers import SyntheticScalar, SyntheticVector
+from savannah.sampling.groups import SensorGroup
+
+
+class Recorder(SyntheticScalar):
+    """
+    Records the threads its reads run in.
+    """
+    def __init__(self, settings: dict = None):
+        super().__init__(settings)
+        self.threads = set()
+
+    def read(self):
+        self.threads.add(threading.current_thread().name)
+        return super().read()
+
+
+class Exclusive(Recorder):
+    CONCURRENT_READS = False
+
+
+def group(*members, **settings):
+    return type('Rig', (SensorGroup, ), {})(members, settings)
+
+
+def test_aligned_records():
+    rig = group(SyntheticScalar(), SyntheticVector({'CHANNELS': 2, 'HARDWARE_TIMESTAMPS': True}))
+    assert rig.name() == 'Rig'
+    assert rig.MAGNITUDES_VERBOSE == ('SyntheticScalar.value', 'SyntheticVector.ch0', 'SyntheticVector.ch1',
+                                      'SyntheticVector.timestamp')
+    rig.open()
+    try:
+        record = rig.read()
+    finally:
+        rig.close()
+    assert len(record) == len(rig.MAGNITUDES_VERBOSE) + 1
+    assert type(record[-1]) is int and record[-1] <= record[-2]
+
+    with pytest.raises(ValueError):
+        group()
+
+
+def test_members_without_data():
+    rig = group(SyntheticScalar(), SyntheticScalar({'BURST_PERIOD': 10, 'DUTY_CYCLE': .01}))
+    rig.open()
+    time.sleep(.15)
+    try:
+        value, missing, _ = rig.read()
+    finally:
+        rig.close()
+    assert value is not None and missing is None
+
+
+def test_parallel_reads():
+    members = [Recorder({'LATENCY': .05}) for _ in range(3)]
+    rig = group(*members)
+    rig.open()
+    try:
+        start = time.perf_counter()
+        rig.read()
+        assert time.perf_counter() - start < .12
+    finally:
+        rig.close()
+    assert len(set.union(*(member.threads for member in members))) == 3
+
+    # Exclusive members are read in the sampler thread
+    members = [Exclusive(), Exclusive(), Recorder()]
+    rig = group(*members)
+    rig.open()
+    try:
+        rig.read()
+    finally:
+        rig.close()
+    assert members[0].threads == members[1].threads == {threading.current_thread().name}
+    assert members[2].threads != {threading.current_thread().name}
+
+
+class Faulty(SyntheticScalar):
+    def read(self):
+        raise OSError("disconnected")
+
+
+class Hung(SyntheticScalar):
+    def read(self):
+        time.sleep(1)
+        return super().read()
+
+
+def test_member_failures():
+    # Failing members get empty columns, in the sampler thread and in the pool
+    for members in ((SyntheticScalar(), Faulty()), (Faulty(), SyntheticScalar(), SyntheticScalar())):
+        rig = group(*members)
+        rig.open()
+        try:
+            record = rig.read()
+        finally:
+            rig.close()
+        faulty = [isinstance(member, Faulty) for member in members]
+        assert [value is None for value in record[:-1]] == faulty
+
+    # Closing does not wait for hung reads
+    rig = group(Hung(), SyntheticScalar())
+    rig.open()
+    reader = threading.Thread(target=rig.read, daemon=True)
+    reader.start()
+    time.sleep(.1)
+    start = time.perf_counter()
+    rig.close()
+    assert time.perf_counter() - start < .5
+    reader.join(2)
@@ -0,0 +1,227 @@
+import importlib
+import json
+import os
+import queue
+import sys
+import time
+
+import pytest
+
+from savannah.core import metrics
+from savannah.sampling.drivers import SyntheticScalar
+
+DRIVERS = '''
+from savannah.sampling.drivers import Sensor
+
+
+class _Fake(Sensor):
+    SENSOR_MAX_FREQUENCY = 100
+    SENSOR_DEFAULT_FREQUENCY = 20
+    MAGNITUDES_VERBOSE = ('value', 'error')
+
+    def open(self): pass
+    def read(self): pass
+    def close(self): pass
+
+
+class A(_Fake): pass
+class B(_Fake): pass
+'''
+
+
+def write_settings(path, enabled, custom, groups=None):
+    settings = {
+        'workflow': {'live_upload': True, 'temp_data': {'enable': False, 'path': 'temp/'}},
+        'sensors': {'enabled_sensors': enabled, 'custom_settings': custom, 'groups': groups or {}},
+        'log': {'brief': {'path': ''}, 'detailed': {'path': ''}},
+    }
+    with open(path, 'w') as file:
+        json.dump(settings, file)
+    # Make sure that the change is visible even with coarse mtime resolution
+    os.utime(path, (time.time() + 1, time.time() + 1))
+
+
+@pytest.fixture
+def settings(tmpdir, monkeypatch):
+    tmpdir.join('drivers.py').write(DRIVERS)
+    write_settings(str(tmpdir.join('settings.json')), ['A'], {'A': {'FREQUENCY': 10}})
+    monkeypatch.setenv('SAVANNAH_BASEDIR', str(tmpdir))
+    sys.modules.pop('savannah.core.settings', None)
+    import savannah.core
+    settings = importlib.import_module('savannah.core.settings')
+    yield settings
+    settings.unwatch()
+    sys.modules.pop('savannah.core.settings', None)
+    if hasattr(savannah.core, 'settings'):
+        del savannah.core.settings
+
+
+def test_settings_change_events(settings):
+    events = []
+    settings.subscribe(events.append)
+    watcher = settings.watch(interval=0.05)
+    write_settings(settings.CONFIG_PATH, ['A', 'B'], {'A': {'FREQUENCY': 10}})
+
+    deadline = time.monotonic() + 2
+    while not events and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert watcher.is_running
+    assert [type(e).__name__ for e in events[0]] == ['SettingModified']
+    assert events[0][0].path == ('sensors', 'enabled_sensors')
+    # The module is updated before the subscribers are notified
+    assert settings.sensors.enabled_sensors == ('A', 'B')
+
+
+def test_live_sampler_changes(settings):
+    from savannah.core.app.units import SamplingUnit
+    unit = SamplingUnit()
+    unit.init({'A': queue.Queue()}, queue_factory=queue.Queue)
+    settings.subscribe(unit.apply_settings)
+    sampler_a = unit.manager.find_by_name('A')
+    try:
+        write_settings(settings.CONFIG_PATH, ['A', 'B'], {'A': {'FREQUENCY': 50}})
+        settings._config_obj.refresh()
+        assert sampler_a.interval == 1 / 50 and sampler_a.is_running
+        assert unit.manager.find_by_name('B').is_running
+        assert 'B' in unit.sampling_proxies
+        assert 'sensor=B' in metrics.snapshot()['sampling_queue_depth']
+
+        write_settings(settings.CONFIG_PATH, ['B'], {'A': {'FREQUENCY': 50}})
+        settings._config_obj.refresh()
+        assert not sampler_a.is_running
+        assert list(unit.manager.wrappers_dict) == ['B'] and list(unit.sensor_dict) == ['B']
+        # Removed sensors do not keep their gauges
+        assert 'sensor=A' not in metrics.snapshot()['sampling_queue_depth']
+
+        # Invalid frequencies are rejected without affecting the sampler
+        write_settings(settings.CONFIG_PATH, ['B'], {'B': {'FREQUENCY': 1000}})
+        settings._config_obj.refresh()
+        assert unit.manager.find_by_name('B').interval == 1 / 20
+    finally:
+        settings.unsubscribe(unit.apply_settings)
+        unit.stop(timeout=1)
+
+
+def test_builtin_drivers(settings):
+    from savannah.core.app.units import SamplingUnit
+    write_settings(settings.CONFIG_PATH, ['SyntheticVector', 'fast'],
+                   {'SyntheticVector': {'CHANNELS': 2}, 'fast': {'DRIVER': 'SyntheticScalar', 'FREQUENCY': 50}})
+    settings._config_obj.refresh()
+    unit = SamplingUnit()
+    # Sensors of the same driver are named after their entry
+    assert unit.sensor_dict['fast'].name() == 'fast' and isinstance(unit.sensor_dict['fast'], SyntheticScalar)
+    unit.init({'SyntheticVector': queue.Queue(), 'fast': queue.Queue()})
+    try:
+        time.sleep(.2)
+        reader = unit.manager.find_by_name('fast').reader
+        assert reader.sequence > 0 and len(reader.data[1]) == 2
+        assert reader.sensor.is_open
+        assert len(unit.manager.find_by_name('SyntheticVector').reader.data[1]) == 3
+    finally:
+        unit.stop(timeout=1)
+    assert not reader.sensor.is_open
+
+
+def test_sampling_schedule(settings):
+    from savannah.core.app.units import SamplingUnit
+    # Reads take a third of the interval: it must not be added to the interval
+    write_settings(settings.CONFIG_PATH, ['S'], {'S': {'DRIVER': 'SyntheticScalar', 'FREQUENCY': 100,
+                                                       'LATENCY': .003}})
+    settings._config_obj.refresh()
+    unit = SamplingUnit()
+    unit.init({'S': queue.Queue()})
+    try:
+        time.sleep(1)
+    finally:
+        unit.stop(timeout=1)
+    assert 90 <= unit.manager.find_by_name('S').reader.sequence <= 102
+
+
+def test_sampling_groups(settings):
+    from savannah.core.app.units import SamplingUnit
+    from savannah.core.exceptions import MisconfiguredSettings
+    custom = {'a': {'DRIVER': 'SyntheticScalar'}, 'b': {'DRIVER': 'SyntheticVector', 'CHANNELS': 2}}
+    write_settings(settings.CONFIG_PATH, ['A'], custom, {'rig': {'sensors': ['a', 'b'], 'frequency': 50}})
+    settings._config_obj.refresh()
+    unit = SamplingUnit()
+    assert list(unit.sensor_dict) == ['A', 'rig']
+    unit.init({'A': queue.Queue(), 'rig': queue.Queue()}, queue_factory=queue.Queue)
+    settings.subscribe(unit.apply_settings)
+    try:
+        time.sleep(.2)
+        rig = unit.manager.find_by_name('rig')
+        assert rig.sampling_frequency == 50
+        assert rig.reader.data[0] == ('a.value', 'b.ch0', 'b.ch1', 'timestamp')
+        assert rig.reader.sequence > 0 and len(rig.reader.data[-1]) == 4
+
+        # Changing the settings of a member creates the group again
+        custom['b']['CHANNELS'] = 3
+        write_settings(settings.CONFIG_PATH, ['A'], custom, {'rig': {'sensors': ['a', 'b'], 'frequency': 50}})
+        settings._config_obj.refresh()
+        assert not rig.is_running
+        assert unit.manager.find_by_name('rig').reader.data[0] == ('a.value', 'b.ch0', 'b.ch1', 'b.ch2', 'timestamp')
+
+        write_settings(settings.CONFIG_PATH, ['A'], custom, {})
+        settings._config_obj.refresh()
+        assert list(unit.sensor_dict) == ['A'] and not unit.groups
+    finally:
+        settings.unsubscribe(unit.apply_settings)
+        unit.stop(timeout=1)
+
+    # A sensor cannot be sampled alone and in a group
+    write_settings(settings.CONFIG_PATH, ['a'], custom, {'rig': {'sensors': ['a', 'b']}})
+    settings._config_obj.refresh()
+    with pytest.raises(MisconfiguredSettings):
+        SamplingUnit()
+
+
+def test_processing_pipelines(settings):
+    from savannah.core.app.units import SamplingUnit
+    custom = {'S': {'DRIVER': 'SyntheticScalar', 'FREQUENCY': 100, 'NOISE': 0, 'AMPLITUDE': .5,
+                    'PIPELINE': {'stages': [{'stage': 'calibrate', 'offset': 10}], 'batch': 5, 'max_delay': 1}}}
+    write_settings(settings.CONFIG_PATH, ['S'], custom)
+    settings._config_obj.refresh()
+    unit = SamplingUnit()
+    proxy = queue.Queue()
+    unit.init({'S': proxy})
+    settings.subscribe(unit.apply_settings)
+    reader = unit.manager.find_by_name('S').reader
+    try:
+        time.sleep(.2)
+        assert reader.sequence % 5 == 0 and all(9.5 <= value <= 10.5 for value, _ in reader.data[1:])
+
+        # Pipelines can be changed live: pending samples are processed with the previous one
+        custom['S']['PIPELINE'] = {'stages': [{'stage': 'decimate', 'factor': 10}], 'worker': True}
+        write_settings(settings.CONFIG_PATH, ['S'], custom)
+        settings._config_obj.refresh()
+        changed = reader.sequence
+        time.sleep(.3)
+        assert reader.pipeline.worker and 0 < reader.sequence - changed <= 4
+        assert all(-.5 <= value <= .5 for value, _ in reader.data[changed + 1:])
+    finally:
+        settings.unsubscribe(unit.apply_settings)
+        unit.stop(timeout=1)
+    # Everything stored was also queued
+    assert proxy.qsize() == reader.sequence
+
+
+def test_failing_listeners(settings):
+    from savannah.core.app.units import SamplingUnit
+    write_settings(settings.CONFIG_PATH, ['S'], {'S': {'DRIVER': 'SyntheticScalar', 'FREQUENCY': 100}})
+    settings._config_obj.refresh()
+    unit = SamplingUnit()
+    unit.init({'S': queue.Queue()})
+    sampler = unit.manager.find_by_name('S')
+    received = []
+
+    def failing(sensor_name, sample):
+        raise IndexError("listener")
+
+    try:
+        sampler.reader.add_listener(failing)
+        sampler.reader.add_listener(lambda sensor_name, sample: received.append(sample))
+        time.sleep(.2)
+        # The failing listener is removed, the sampler and the other listeners go on
+        assert sampler.is_running and len(received) > 5
+    finally:
+        unit.stop(timeout=1)
@@ -0,0 +1,45 @@
+import os
+import subprocess
+import sys
+
+import savannah
+
+# Modules that must only be imported when the App is started, not to run the CLI.
+HEAVY_MODULES = (
+    'savannah.core.app.units', 'savannah.asynchrony.processes', 'savannah.iounit.sockets',
+    'savannah.sampling', 'multiprocessing.managers', 'pydoc', 'networkx', 'numpy',
+)
+
+# Cumulative import time budget of the CLI (microseconds). It is loose on purpose:
+# the test is meant to catch heavy imports sneaking in, not to benchmark the machine.
+CLI_IMPORT_BUDGET = 500000
+
+ENV = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(savannah.__file__)))
+
+
+def import_times(statement: str) -> dict:
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement], env=ENV,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_cli_import_is_lazy():
+    times = import_times('import savannah.core.management')
+    assert not [module for module in HEAVY_MODULES if module in times]
+    assert times['savannah.core.management'] < CLI_IMPORT_BUDGET
+
+
+def test_command_import_is_lazy():
+    statement = ('import sys; from savannah.core.management import CLInterpreter; CLInterpreter(command="run");'
+                 'print("\\n".join(sys.modules))')
+    modules = subprocess.run([sys.executable, '-c', statement], env=ENV, stdout=subprocess.PIPE,
+                             universal_newlines=True, check=True).stdout.split()
+    assert 'savannah.core.actions.run' in modules
+    assert 'savannah.core.actions.test' not in modules
+    assert 'savannah.core.app.units' not in modules
@@ -0,0 +1,99 @@
+import time
+
+import pytest
+from savannah.iounit.interpreter import CPUInterpreter, Utils, cached, ALL_SENSORS
+from savannah.iounit.serializers import get_serializer
+from savannah.core.interpreter import InvalidArgumentsError, InvalidCommandError, UnrecognizedCommandError
+
+
+class Interpreter(CPUInterpreter):
+    def __map__(self):
+        self.mapped_commands.update({
+            'echo': self.echo,
+        })
+
+    def echo(self, value: int, name: str = 'echo'):
+        return '{}:{}'.format(name, value)
+
+
+def test_dispatch():
+    interpreter = Interpreter()
+    assert interpreter.raw_run(Utils.build_command('echo', value=1)) == 'echo:1'
+    assert interpreter.raw_run(Utils.build_command('echo', value=2, name='x')) == 'x:2'
+    # Non-canonical syntax goes through argparse
+    assert interpreter.raw_run('--kwargs {"value":3} echo') == 'echo:3'
+
+
+def test_dispatch_errors():
+    interpreter = Interpreter()
+    with pytest.raises(UnrecognizedCommandError):
+        interpreter.raw_run('unknown')
+    with pytest.raises(InvalidArgumentsError):
+        interpreter.raw_run(Utils.build_command('echo', value='1'))
+    with pytest.raises(InvalidArgumentsError):
+        interpreter.raw_run(Utils.build_command('echo', value=1, other=2))
+    with pytest.raises(InvalidCommandError):
+        interpreter.raw_run('echo --kwargs {value')
+
+
+def test_commands_mapped_later_are_compiled():
+    interpreter = Interpreter()
+    interpreter.mapped_commands['double'] = lambda value: value * 2
+    interpreter.verify_data_types = False
+    assert interpreter.raw_run(Utils.build_command('double', value=2)) == 4
+
+
+class Reader:
+    sequence = 0
+
+
+class CachedInterpreter(CPUInterpreter):
+    def __map__(self):
+        self.calls = 0
+        self.mapped_commands.update({
+            'summary': self.summary,
+            'recent': self.recent,
+        })
+
+    @cached(sensors=ALL_SENSORS)
+    def summary(self, window: int = 10):
+        self.calls += 1
+        return {'window': window}
+
+    @cached(ttl=0.05)
+    def recent(self):
+        self.calls += 1
+        return 'recent'
+
+
+def test_response_cache():
+    reader = Reader()
+    manager = type('SamplingManager', (), {'wrappers_dict': {'temp': type('Wrapper', (), {'reader': reader})}})
+    interpreter = CachedInterpreter(manager)
+
+    first = interpreter.serialized_run(Utils.build_command('summary', window=5))
+    assert first == ('dict', get_serializer().dumps({'window': 5}))
+    # Hits are served already serialized
+    assert interpreter.serialized_run(Utils.build_command('summary', window=5)) is first
+    assert interpreter.calls == 1
+    interpreter.serialized_run(Utils.build_command('summary', window=6))
+    assert interpreter.calls == 2
+
+    # New samples invalidate the responses depending on the sensor
+    reader.sequence += 1
+    interpreter.serialized_run(Utils.build_command('summary', window=5))
+    assert interpreter.calls == 3
+
+    assert interpreter.serialized_run('recent') == ('str', b'recent')
+    interpreter.serialized_run('recent')
+    assert interpreter.calls == 4
+    time.sleep(0.06)
+    interpreter.serialized_run('recent')
+    assert interpreter.calls == 5
+
+    stats = interpreter.raw_run('cache_stats')
+    assert (stats['hits'], stats['misses']) == (2, 5)
+
+    interpreter.cache.max_entries = 1
+    interpreter.serialized_run(Utils.build_command('summary', window=7))
+    assert len(interpreter.cache) == 1 and interpreter.cache.evictions == 3
@@ -26,3 +26,211 @@ def test_send_messages():
     logger.error("txt")
     logger.info("txt")
 
+
+
+def log_from_child(queue_connection):
+    import logging
+    from savannah.core.logging.logging import attach_queue
+    attach_queue(*queue_connection)
+    logging.getLogger('savannah.core.logging.logging').warning("from child")
+
+
+def test_queued_messages(tmp_path):
+    import logging
+    import multiprocessing
+    brief, detailed = str(tmp_path / 'brief.log'), str(tmp_path / 'detailed.log')
+    manager = Logger('queued', brief_log_file=brief, detailed_log_file=detailed, reload=True,
+                     do_brief=True, do_detailed=True, do_queue=True)
+    manager.logger.warning("queued %s", "warning")
+    manager.logger.debug("queued debug")
+
+    # Other processes log to the same writer
+    child = multiprocessing.get_context('spawn').Process(target=log_from_child, args=(manager.queue_connection, ))
+    child.start()
+    child.join(30)
+    manager.writer.stop(5)
+
+    with open(brief) as file:
+        content = file.read()
+    assert 'queued warning' in content and 'queued debug' in content and 'from child' in content
+    with open(detailed) as file:
+        content = file.read()
+    # The detailed log holds the stack of the log call, not of the writer thread
+    assert 'queued debug' not in content and 'test_queued_messages' in content
+    assert manager.writer.stats()['dropped'] == 0
+    logging.getLogger('queued').handlers = []
+
+
+def test_reload_keeps_one_exit_handler(tmp_path, monkeypatch):
+    import logging
+    from savannah.core.logging import logging as logging_module
+    handlers = []
+    monkeypatch.setattr(logging_module, 'atexit', type('atexit', (), {
+        'register': staticmethod(handlers.append),
+        'unregister': staticmethod(lambda func: handlers.remove(func) if func in handlers else None)}))
+
+    brief = str(tmp_path / 'brief.log')
+    manager = Logger('reloaded', brief_log_file=brief, reload=True, do_brief=True, do_queue=True)
+    for _ in range(3):
+        manager.__init__('reloaded', brief_log_file=brief, reload=True, do_brief=True, do_queue=True)
+    assert handlers == [manager.close]
+    manager.close()
+    assert not manager.writer.is_running
+    logging.getLogger('reloaded').handlers = []
+
+
+def test_queue_overflow_is_counted(tmp_path):
+    import logging
+    from savannah.core.logging.handlers import QueueWriter, BatchFileHandler
+    path = str(tmp_path / 'overflow.log')
+    writer = QueueWriter([BatchFileHandler(path)], maxsize=2)
+    logger = logging.getLogger('overflow')
+    logger.addHandler(writer.handler())
+    for i in range(5):
+        logger.warning("record %d", i)
+    assert writer.stats()['dropped'] == 3
+
+    writer.start().stop(5)
+    with open(path) as file:
+        content = file.read()
+    assert 'record 1' in content and 'record 2' not in content
+    assert '3 log records dropped' in content
+    logger.handlers = []
+
+
+def test_detailed_traces_are_deduplicated(tmp_path):
+    import logging
+    from savannah.core.logging.logging import traces
+    traces.clear()
+    brief, detailed = str(tmp_path / 'brief.log'), str(tmp_path / 'detailed.log')
+    logger = Logger('traces', brief_log_file=brief, detailed_log_file=detailed, reload=True,
+                    do_brief=True, do_detailed=True).logger
+    for _ in range(3):
+        logger.warning("repeated")
+    logger.info("not detailed")
+    logger.handlers = []
+
+    with open(detailed) as file:
+        content = file.read()
+    # The source line of the log call is only in the first (full) trace
+    assert content.count('logger.warning("repeated")') == 1
+    assert 'same trace seen 2 times' in content and 'same trace seen 3 times' in content
+    assert 'not detailed' not in content
+
+
+@pytest.mark.parametrize('fmt', ['jsonl', 'binary'])
+def test_structured_records(tmp_path, fmt):
+    import logging
+    from savannah.core.logging.structured import StructuredFileHandler, read_records
+    path = str(tmp_path / 'structured.log')
+    handler = StructuredFileHandler(path, fmt=fmt)
+    logger = logging.getLogger('structured.' + fmt)
+    logger.handlers = [handler]
+    logger.warning("sample %d", 1)
+    try:
+        raise ValueError("failed")
+    except ValueError:
+        logger.exception("error")
+    handler.close()
+
+    records = list(read_records(path, fmt))
+    assert [r['message'].splitlines()[0] for r in records] == ['sample 1', 'error']
+    assert records[0]['level'] == 'WARNING' and records[0]['function'] == 'test_structured_records'
+    assert records[0]['path'].endswith('test_logging.py')
+    assert 'ValueError: failed' in records[1]['message']
+
+
+def test_structured_rotation(tmp_path):
+    import logging
+    from savannah.core.logging.structured import StructuredFileHandler, read_records
+    path = str(tmp_path / 'structured.log')
+    handler = StructuredFileHandler(path, max_bytes=2000, retention_bytes=1000)
+    logger = logging.getLogger('structured.rotation')
+    logger.handlers = [handler]
+    for i in range(200):
+        logger.warning("record %d", i)
+    handler.wait_compression()
+    handler.close()
+
+    segments = handler.segments()
+    assert segments and all(segment.endswith('.gz') for segment in segments)
+    # The oldest segments are deleted to keep within the retention budget
+    assert sum(os.path.getsize(segment) for segment in segments) <= 1000
+    records = [r for segment in segments + [path] for r in read_records(segment)]
+    assert records[-1]['message'] == 'record 199'
+    assert [r['message'] for r in records] == ['record {}'.format(i) for i in range(200 - len(records), 200)]
+
+
+def test_rate_limit_filter():
+    import logging
+    from savannah.core.logging.throttling import RateLimitFilter
+
+    class ListHandler(logging.Handler):
+        def __init__(self):
+            super().__init__()
+            self.records = []
+
+        def emit(self, record):
+            self.records.append(record)
+
+    throttle = RateLimitFilter(rate=.001, burst=3, summary_interval=3600, modules={'test_logging': {'burst': 2}})
+    handler = ListHandler()
+    logger = logging.getLogger('throttled')
+    logger.propagate = False
+    logger.handlers, logger.filters = [handler], [throttle]
+
+    for i in range(10):
+        logger.warning("sample %d failed", i)
+    logger.warning("other call site")
+    # The limits of this module replace the default burst
+    assert [r.getMessage() for r in handler.records] == ['sample 0 failed', 'sample 1 failed', 'other call site']
+
+    throttle.flush()
+    summary = handler.records[-1]
+    assert summary.getMessage().startswith('8 records suppressed in the last')
+    assert summary.getMessage().endswith('sample %d failed') and summary.lineno == handler.records[0].lineno
+    throttle.flush()
+    assert len(handler.records) == 4
+
+    # Errors are never throttled
+    for i in range(10):
+        logger.error("sample %d failed", i)
+    assert len(handler.records) == 14
+    logger.filters = []
+
+
+def test_throttle_summaries_on_reload(tmp_path):
+    import logging
+    brief = str(tmp_path / 'brief.log')
+    manager = Logger('flooded', brief_log_file=brief, reload=True, do_brief=True, do_throttle=True)
+    for i in range(100):
+        manager.logger.warning("sample %d failed", i)
+    # The summary does not wait for other records to pass through the filter
+    manager.__init__('flooded', brief_log_file=brief, reload=True, do_brief=True, do_throttle=True)
+    with open(brief) as file:
+        content = file.read()
+    assert 'records suppressed in the last' in content
+    manager.close()
+    logging.getLogger('flooded').handlers = []
+    logging.getLogger('flooded').filters = []
+
+
+def test_throttle_is_opt_in_and_close_skips_closed_streams(tmp_path, monkeypatch):
+    import io
+    import logging
+    monkeypatch.delenv('LOG_DO_THROTTLE', raising=False)
+    brief = str(tmp_path / 'brief.log')
+    manager = Logger('closing', brief_log_file=brief, reload=True, do_brief=True, do_console=True)
+    assert manager.throttle is None
+
+    # As at exit, when the captured streams are closed before the exit handlers run
+    stream = io.StringIO()
+    console, = [h for h in manager.logger.handlers if not isinstance(h, logging.FileHandler)]
+    console.setStream(stream)
+    stream.close()
+    manager.close()
+    manager.logger.warning("after close")
+    assert console not in manager.logger.handlers
+    with open(brief) as file:
+        assert 'after close' in file.read()
+    logging.getLogger('closing').handlers = []
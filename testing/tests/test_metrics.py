@@ -0,0 +1,64 @@
+import threading
+import urllib.request
+
+from savannah.core.metrics import MetricsRegistry, MetricsServer
+from savannah.iounit.interpreter import CPUInterpreter, Utils
+
+
+def test_counters_are_merged_across_threads():
+    registry = MetricsRegistry()
+    counter = registry.counter('samples_total', sensor='a')
+    assert registry.counter('samples_total', sensor='a') is counter
+
+    def work():
+        for _ in range(1000):
+            counter.inc()
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    counter.inc(5)
+    # The shards of finished threads are kept
+    assert counter.value == 4005 and counter.value == 4005
+    assert registry.snapshot() == {'samples_total': {'sensor=a': 4005}}
+
+
+def test_histogram_quantiles():
+    registry = MetricsRegistry()
+    histogram = registry.histogram('latency_seconds')
+    for i in range(1, 1001):
+        histogram.observe(i / 1000)
+
+    snapshot = histogram.snapshot()
+    assert snapshot['count'] == 1000 and snapshot['min'] == .001 and snapshot['max'] == 1.
+    # Log-linear buckets: relative error below 1/16
+    for q, expected in ((.5, .5), (.9, .9), (.99, .99)):
+        assert abs(snapshot['p{:g}'.format(q * 100)] - expected) / expected < 1 / 16
+
+
+def test_prometheus_endpoint():
+    registry = MetricsRegistry()
+    registry.counter('requests_total', 'Requests.').inc(3)
+    registry.gauge('queue_depth', func=lambda: 7, sensor='a"b')
+    registry.histogram('request_seconds').observe(.25)
+
+    server = MetricsServer('127.0.0.1', 0, registry)
+    server.run()
+    try:
+        with urllib.request.urlopen('http://{}:{}/metrics'.format(*server.address), timeout=5) as response:
+            text = response.read().decode()
+    finally:
+        server.close(5)
+
+    assert '# HELP savannah_requests_total Requests.\n# TYPE savannah_requests_total counter\n' in text
+    assert 'savannah_requests_total 3\n' in text
+    assert 'savannah_queue_depth{sensor="a\\"b"} 7\n' in text
+    assert '# TYPE savannah_request_seconds summary' in text
+    assert 'savannah_request_seconds_count 1\n' in text and 'savannah_request_seconds{quantile="0.5"}' in text
+
+
+def test_metrics_command():
+    interpreter = CPUInterpreter()
+    snapshot = interpreter.raw_run(Utils.build_command('metrics'))
+    assert isinstance(snapshot, dict)
+    assert interpreter.raw_run(Utils.build_command('metrics', prometheus=True)).endswith('\n')
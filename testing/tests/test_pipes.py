@@ -0,0 +1,42 @@
+import pytest
+from savannah.asynchrony.pipes import PipeNetwork, PipeNameError
+
+
+def make_chain():
+    # A <-> B <-> C, with no direct pipe between A and C
+    network = PipeNetwork()
+    network.insert_pipe(('A', 'B'))
+    network.insert_pipe(('B', 'C'))
+    return network
+
+
+def test_adjacency_is_compiled_once():
+    network = make_chain()
+    assert network.get_pipes('A') is network.get_pipes('A')
+    assert set(network.get_pipes('B')) == {'A', 'C'}
+
+    network.insert_pipe(('A', 'C'))
+    assert set(network.get_pipes('A')) == {'B', 'C'}
+
+
+def test_multi_hop_routing():
+    network = make_chain()
+    assert network.get_routes('A') == {'B': 'B', 'C': 'B'}
+    assert network.route('A', 'C') == ['A', 'B', 'C']
+
+
+def test_routed_message_is_forwarded():
+    network = make_chain()
+    a, b, c = (network.get_pipes(node) for node in 'ABC')
+    a.send('C', 'hello')
+    assert b.receive('A') is None  # Forwarded to C
+    assert c.receive('B') == 'hello'
+
+
+def test_unidirectional_pipes_are_routed_one_way():
+    network = PipeNetwork()
+    network.insert_pipe(('B', 'A'), duplex=False)
+    network.insert_pipe(('C', 'B'), duplex=False)
+    assert network.route('A', 'C') == ['A', 'B', 'C']
+    with pytest.raises(PipeNameError):
+        network.route('C', 'A')
@@ -50,6 +50,33 @@ class ReceiverProcess(processes.Process):
 
         namespace.msg['ReceiverProcess'] = msg
 
+class CounterProcess(processes.Process):
+    @staticmethod
+    def task(pipe_map: dict, state):
+        while state.cont:
+            state.increment('count')
+            time.sleep(0.01)
+        state.last = (state.count, 1.5)
+
+class SubscriberProcess(processes.Process):
+    @staticmethod
+    def task(pipe_map: dict, channels: dict, namespace: Namespace):
+        subscription = channels['readings'].subscription(namespace.subscriber)
+        namespace.received = [subscription.receive(timeout=5) for _ in range(3)]
+
+class FanOutSubscriberProcess(processes.Process):
+    @staticmethod
+    def task(channels: dict, namespace: Namespace, **kwargs):
+        import multiprocessing
+        name = multiprocessing.current_process().name
+        subscription = channels['readings'].subscription(name)
+        namespace.received[name] = [subscription.receive(timeout=5) for _ in range(3)]
+
+class PlainProcess(processes.Process):
+    @staticmethod
+    def task(pipe_map: dict, namespace: Namespace):
+        namespace.plain = True
+
 
 #
 # Tests
@@ -98,7 +125,77 @@ def test_environ():
     p = EnvironProcess()
     p.start()
 
+def test_broadcast_channel():
+    manager = processes.ProcessManager()
+    subscriber = SubscriberProcess(manager=manager)
+    manager.create_channel('readings', slots=4, slot_size=256)
+    manager.subscribe('readings', subscriber.name)
+    manager.namespace.subscriber = subscriber.name
 
+    subscriber.start()
+    for i in range(3):
+        manager.channels['readings'].publish({'value': i})
 
+    assert subscriber.wait(timeout=5) is True
+    assert manager.namespace.received == [{'value': i} for i in range(3)]
+    manager.close_channels()
 
-
+def test_broadcast_channel_fan_out():
+    manager = processes.ReverseProcessManager()
+    subscribers = [FanOutSubscriberProcess(name='Subscriber{}'.format(i)) for i in range(3)]
+    plain = PlainProcess()
+    manager.propagate([*subscribers, plain])
+    manager.create_channel('readings', slots=4, slot_size=256)
+    for subscriber in subscribers:
+        manager.subscribe('readings', subscriber.name)
+    manager.namespace.received = manager.ioserver.dict()
+
+    # Tasks that do not take channels still start once a channel exists
+    manager.start_all()
+    for i in range(3):
+        manager.channels['readings'].publish({'value': i})
+
+    assert all(p.wait(timeout=5) is True for p in (*subscribers, plain))
+    assert manager.namespace.plain
+    assert dict(manager.namespace.received) == {s.name: [{'value': i} for i in range(3)] for s in subscribers}
+    manager.close_channels()
+
+def test_broadcast_channel_policies():
+    from queue import Full
+    manager = processes.ProcessManager(enable_ioserver=False)
+
+    dropping = manager.create_channel('drop', slots=2, slot_size=64)
+    slow = manager.subscribe('drop', 'slow')
+    for i in range(5):
+        dropping.publish(i)
+    assert [slow.receive(block=False) for _ in range(2)] == [3, 4]
+    assert slow.dropped == 3
+
+    blocking = manager.create_channel('block', slots=2, slot_size=64, policy='block')
+    slow = manager.subscribe('block', 'slow')
+    blocking.publish(0); blocking.publish(1)
+    with pytest.raises(Full):
+        blocking.publish(2, timeout=0.05)
+    assert slow.receive() == 0
+    blocking.publish(2, block=False)
+    manager.close_channels()
+
+def test_shared_state():
+    manager = processes.ProcessManager(enable_ioserver=False)
+    manager.enable_shared_state({'cont': bool, 'count': int, 'last': 'qd'}, cont=True)
+    p = CounterProcess(manager=manager)
+    # Tasks without a state parameter are not passed the state
+    plain = processes.EasyProcess(manager=manager).map(lambda pipe_map: None)
+    p.start()
+    plain.start()
+    time.sleep(0.5)
+    manager.shared_state.cont = False
+
+    assert p.wait(timeout=2) is True
+    assert plain.wait(timeout=2) is True
+    count = manager.shared_state.count
+    assert count > 0
+    assert manager.shared_state.last == (count, 1.5)
+    with pytest.raises(AttributeError):
+        manager.shared_state.undeclared = 1
+    manager.close_shared_state()
@@ -0,0 +1,152 @@
+import time
+
+import numpy as np
+import pytest
+
+from savannah.sampling.processing import (Calibrate, Convert, Decimate, LowPass, MovingAverage, Pipeline,
+                                          PipelineWorker, RejectOutliers, build_pipeline, stage, Stage)
+
+
+def run(processing_stage, values, batch=7):
+    """
+    Processes values in batches, as the reader would.
+    """
+    values = np.asarray(values, dtype=float).reshape(len(values), -1)
+    timestamps = np.arange(len(values), dtype=np.int64)
+    results, stamps = [], []
+    for start in range(0, len(values), batch):
+        v, t = processing_stage.process(values[start:start + batch].copy(), timestamps[start:start + batch])
+        results.append(v)
+        stamps.append(t)
+    return np.concatenate(results), np.concatenate(stamps)
+
+
+def test_calibration_and_units():
+    values, _ = run(Calibrate(gain=[2, 1], offset=[1, 0]), [[1, 1], [2, 2]])
+    assert values.tolist() == [[3, 1], [5, 2]]
+    values, _ = run(Convert(**{'from': 'C', 'to': 'F'}, columns=[1]), [[0, 100]])
+    assert values[0] == pytest.approx([0, 212])
+    with pytest.raises(ValueError):
+        Convert(**{'from': 'C', 'to': 'Pa'})
+
+
+def test_filters():
+    x = np.random.RandomState(0).normal(size=100)
+
+    values, _ = run(MovingAverage(window=5), x)
+    expected = [x[max(0, i - 4):i + 1].mean() for i in range(len(x))]
+    assert values[:, 0] == pytest.approx(expected)
+
+    values, _ = run(LowPass(alpha=.3), x)
+    y, expected = x[0], []
+    for value in x:
+        y += .3 * (value - y)
+        expected.append(y)
+    assert values[:, 0] == pytest.approx(expected)
+    # Long batches do not overflow
+    values, _ = run(LowPass(alpha=.99), np.ones(5000), batch=5000)
+    assert values[:, 0] == pytest.approx(1.)
+
+
+def test_outliers_and_decimation():
+    x = np.random.RandomState(1).normal(size=200)
+    x[[50, 120]] = 100
+    values, timestamps = run(RejectOutliers(threshold=5, high=3.5), x, batch=20)
+    assert 50 not in timestamps and 120 not in timestamps and len(timestamps) >= 190
+
+    values, timestamps = run(Decimate(factor=3), np.arange(10))
+    assert values[:, 0].tolist() == [2, 5, 8] and timestamps.tolist() == [2, 5, 8]
+    values, _ = run(Decimate(factor=3, average=True), np.arange(10))
+    assert values[:, 0].tolist() == [1, 4, 7]
+
+
+def test_pipeline():
+    @stage('double')
+    class Double(Stage):
+        def process(self, values, timestamps):
+            return values * 2, timestamps
+
+    pipeline = build_pipeline([{'stage': 'double'}, {'stage': 'calibrate', 'offset': 1}])
+    (a, missing, t1), second = pipeline.process([(1, None, 10), (2, 3, 20)])
+    assert (a, t1) == (3., 10) and np.isnan(missing) and second == (5., 7., 20)
+    assert type(t1) is int
+    assert build_pipeline(None) is None
+    with pytest.raises(ValueError):
+        build_pipeline([{'stage': 'unknown'}])
+
+
+def test_worker():
+    stored = []
+    worker = PipelineWorker(Pipeline([Decimate(2)], batch=4, max_delay=.05), stored.extend)
+    worker.start()
+    for i in range(6):
+        worker.put((i, i))
+    time.sleep(.2)
+    # The first batch is complete, the rest is processed after max_delay
+    assert stored == [(1., 1), (3., 3), (5., 5)]
+    worker.stop(timeout=1)
+    assert not worker.is_alive()
+
+
+def test_missing_values():
+    x = np.random.RandomState(2).normal(size=60)
+    x[[0, 10, 11, 12, 40]] = np.nan
+
+    values, _ = run(MovingAverage(window=3), x)
+    for i in range(len(x)):
+        window = x[max(0, i - 2):i + 1]
+        window = window[~np.isnan(window)]
+        if len(window): assert values[i, 0] == pytest.approx(window.mean())
+        else: assert np.isnan(values[i, 0])
+
+    values, _ = run(LowPass(alpha=.3), x)
+    y, expected = np.nan, []
+    for value in x:
+        if not np.isnan(value):
+            y = value if np.isnan(y) else y + .3 * (value - y)
+        expected.append(y)
+    assert np.isnan(values[0, 0]) and values[1:, 0] == pytest.approx(expected[1:])
+
+    # Missing values do not stay in the state of the filters
+    pipeline = build_pipeline([{'stage': 'low_pass', 'alpha': .5}, {'stage': 'moving_average', 'window': 2}])
+    assert pipeline.process([(1., 1), (None, 2), (1., 3)]) == [(1., 1), (1., 2), (1., 3)]
+    assert pipeline.process([(3., 4), (3., 5)]) == [(1.5, 4), (2.25, 5)]
+
+
+def test_failures():
+    @stage('broken')
+    class Broken(Stage):
+        def process(self, values, timestamps):
+            if values[0, 0] < 0: raise ValueError("negative")
+            return values, timestamps
+
+    # Failing batches are dropped
+    pipeline = build_pipeline([{'stage': 'broken'}])
+    assert pipeline.process([(-1, 1)]) == [] and pipeline.process([(1, 2)]) == [(1., 2)]
+
+    stored = []
+
+    def store(samples):
+        if samples and samples[0][0] == 2: raise RuntimeError("listener")
+        stored.extend(samples)
+
+    worker = PipelineWorker(Pipeline([Broken()], batch=1), store)
+    worker.start()
+    for i in (-1, 2, 3):
+        worker.put((i, i))
+    worker.stop(timeout=1)
+    assert stored == [(3., 3)] and not worker.is_alive()
+
+
+def test_member_timestamps():
+    # Columns of a group with a member with hardware timestamps
+    header = ('a.x', 'a.timestamp', 'b.y', 'timestamp')
+    stamp = 1600000000123456789
+    pipeline = build_pipeline({'stages': [{'stage': 'calibrate', 'gain': 2},
+                                          {'stage': 'decimate', 'factor': 2}]}, header=header)
+    assert pipeline.process([(1, stamp, 2, 10)]) == []
+    first, = pipeline.process([(3, stamp + 1, None, 20)])
+    # Nanosecond timestamps are not turned into floats, nor calibrated
+    assert first[:2] == (6., stamp + 1) and type(first[1]) is int and first[3] == 20
+    (x, member, y, timestamp), = pipeline.process([(4, None, 5, 30), (5, stamp + 3, 6, 40)])
+    assert (x, member, y, timestamp) == (10., stamp + 3, 12., 40)
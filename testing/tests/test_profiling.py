@@ -0,0 +1,72 @@
+import threading
+import time
+
+import pytest
+from savannah.core.interpreter import InvalidArgumentsError
+from savannah.core.profiling import Profiler, profiled, profiler
+from savannah.iounit.interpreter import CPUInterpreter, Utils
+
+
+@profiled('test.busy')
+def busy(seconds: float):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_profiler(tmp_path):
+    busy(.001)  # Not recorded: profiling is off
+    assert profiler.start(interval=.001) and not profiler.start()
+    worker = threading.Thread(target=busy, args=(.2, ), name='Worker')
+    worker.start()
+    busy(.01)
+    worker.join()
+    assert profiler.stop() and not profiler.stop()
+
+    report = profiler.report()
+    assert report['samples'] > 10
+    assert report['spans']['span=test.busy']['count'] == 2
+    assert any(stack.startswith('Worker;') and 'busy (test_profiling.py' in stack
+               for stack, _ in report['top_stacks'])
+
+    folded, summary = profiler.write(str(tmp_path / 'profile.folded'))
+    with open(folded) as file:
+        lines = file.read().splitlines()
+    # Collapsed stacks: 'frame;frame;... count'
+    assert lines and all(line.rsplit(' ', 1)[1].isdigit() for line in lines)
+
+
+def test_collapse_frames():
+    import sys
+    stack = Profiler.collapse('Main;Thread', sys._getframe())
+    assert stack.startswith('Main:Thread;') and stack.endswith('test_collapse_frames (test_profiling.py:{})'.format(
+        test_collapse_frames.__code__.co_firstlineno))
+
+
+def test_profile_command():
+    interpreter = CPUInterpreter()
+    assert interpreter.raw_run(Utils.build_command('profile', action='start', interval=.005))['enabled']
+    interpreter.raw_run(Utils.build_command('profile'))
+    report = interpreter.raw_run(Utils.build_command('profile', action='stop'))
+    assert not report['enabled'] and 'span=interpreter.run' in report['spans']
+
+
+def test_profile_arguments_and_concurrent_reports():
+    interpreter = CPUInterpreter()
+    for interval in (0., -1., .0001):
+        with pytest.raises(InvalidArgumentsError):
+            interpreter.raw_run(Utils.build_command('profile', action='start', interval=interval))
+    assert not profiler.enabled
+
+    # Reports are read while the sampler thread counts new stacks
+    threads = [threading.Thread(target=busy, args=(.3, ), name='Worker{}'.format(i)) for i in range(4)]
+    profiler.start(interval=.001)
+    try:
+        for thread in threads: thread.start()
+        end = time.perf_counter() + .3
+        while time.perf_counter() < end:
+            profiler.report()
+            profiler.collapsed()
+    finally:
+        for thread in threads: thread.join()
+        profiler.stop()
@@ -0,0 +1,67 @@
+import datetime
+from collections import OrderedDict
+
+import numpy as np
+import pytest
+from savannah.iounit.serializers import PackSerializer, SerializationError, get_serializer, \
+    encode_response, decode_response
+
+
+RESPONSE = {
+    'last_key': 3,
+    'data': [('temperature', 'humidity', 'timestamp'),
+             (21.5, 0.45, datetime.datetime(2018, 9, 1, 12, 30, 15, 250)),
+             (-1, 2 ** 40, -2 ** 40)],
+    'flags': [True, False, None],
+    'name': 'x' * 40,
+    'blob': b'\x00\x01' * 200,
+    'nested': {1: {'a': list(range(20))}},
+}
+
+
+def as_lists(obj):
+    if isinstance(obj, (list, tuple)):
+        return [as_lists(item) for item in obj]
+    if isinstance(obj, dict):
+        return {key: as_lists(value) for key, value in obj.items()}
+    return obj
+
+
+@pytest.mark.parametrize('use_msgpack', [True, False])
+def test_pack_round_trip(use_msgpack):
+    serializer = PackSerializer(use_msgpack=use_msgpack)
+    assert serializer.loads(serializer.dumps(RESPONSE)) == as_lists(RESPONSE)
+    preserving = PackSerializer(use_msgpack=use_msgpack, preserve_tuples=True)
+    assert preserving.loads(preserving.dumps(RESPONSE)) == RESPONSE
+    assert serializer.loads(serializer.dumps(OrderedDict(a=1))) == {'a': 1}
+
+    array = np.arange(12, dtype='<f4').reshape(3, 4)
+    decoded = serializer.loads(serializer.dumps({'array': array, 'mean': array.mean()}))
+    assert decoded['array'].dtype == array.dtype and np.array_equal(decoded['array'], array)
+    assert decoded['mean'] == pytest.approx(5.5)
+
+    with pytest.raises(TypeError):
+        serializer.dumps(object())
+    with pytest.raises(TypeError):
+        serializer.dumps(np.array([object()]))
+
+
+def test_pack_backends_are_compatible():
+    pytest.importorskip('msgpack')
+    for preserve_tuples in (False, True):
+        fast = PackSerializer(preserve_tuples=preserve_tuples)
+        pure = PackSerializer(use_msgpack=False, preserve_tuples=preserve_tuples)
+        assert fast.backend == 'msgpack'
+        assert fast.dumps(RESPONSE) == pure.dumps(RESPONSE)
+        assert pure.loads(fast.dumps(RESPONSE)) == fast.loads(fast.dumps(RESPONSE))
+
+
+def test_response_framing():
+    serializer = get_serializer('pack')
+    assert encode_response('ok', serializer) == ('str', b'ok')
+    assert decode_response(*encode_response(b'\x00', serializer), serializer) == b'\x00'
+    assert decode_response(*encode_response([1, 2], serializer), serializer) == [1, 2]
+    with pytest.raises(SerializationError):
+        decode_response('dict', b'\xc1', serializer)
+    with pytest.raises(SerializationError):
+        get_serializer('unknown')
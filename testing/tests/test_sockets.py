@@ -0,0 +1,154 @@
+import socket
+import time
+
+import pytest
+from savannah.iounit import CPUServer, CPUClient
+from savannah.iounit.sockets import ConnStatus
+from savannah.iounit.interpreter import CPUInterpreter
+from savannah.iounit.interpreter.blueprints import StreamingMixin
+
+
+class Interpreter(CPUInterpreter):
+    def __map__(self):
+        self.mapped_commands.update({
+            'echo': self.echo,
+            'fail': self.fail,
+        })
+
+    def echo(self, value: int):
+        return {'value': value}
+
+    def fail(self):
+        raise ValueError("failed")
+
+
+@pytest.fixture
+def server():
+    server = CPUServer('127.0.0.1', 0, Interpreter())
+    server.port = server.socket.getsockname()[1]
+    server.run()
+    yield server
+    server.close(timeout=2)
+
+
+def test_batch(server):
+    status, results = CPUClient(server.host, server.port).batch([
+        ('echo', {'value': 1}), 'unknown', ('echo', {'value': 'x'}), 'fail'])
+
+    assert status == ConnStatus.CONN_OK
+    assert results[0] == {'ok': True, 'data': {'value': 1}}
+    assert [r['ok'] for r in results] == [True, False, False, False]
+    assert results[1]['error'].startswith('UnrecognizedCommandError')
+    assert results[3]['error'] == 'ValueError:failed'
+
+
+def test_pipelining(server):
+    with CPUClient(server.host, server.port) as client:
+        results = client.pipeline(['echo --kwargs {"value": %d}' % i for i in range(100)], depth=8)
+        assert results == [(ConnStatus.CONN_OK, {'value': i}) for i in range(100)]
+        # Messages go through the persistent connection too
+        assert client.message('unknown')[0] == ConnStatus.KNOWN_ERR
+
+    # Other clients are not blocked by persistent connections
+    assert CPUClient(server.host, server.port).message('echo --kwargs {"value": 1}') == \
+        (ConnStatus.CONN_OK, {'value': 1})
+
+
+class FakeReader:
+    def __init__(self):
+        self.listeners = []
+        self.data = [('value', 'timestamp')]
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self.listeners.remove(listener)
+
+
+class FakeSamplingManager:
+    def __init__(self, **readers):
+        self.wrappers_dict = {name: type('Wrapper', (), {'reader': reader}) for name, reader in readers.items()}
+
+
+def test_stream_subscription():
+    reader = FakeReader()
+    server = CPUServer('127.0.0.1', 0, type('StreamingInterpreter', (StreamingMixin, Interpreter), {})(
+        FakeSamplingManager(temp=reader)))
+    server.port = server.socket.getsockname()[1]
+    server.run()
+    try:
+        client = CPUClient(server.host, server.port)
+        assert client.subscribe(sensors=['unknown'])[0] == ConnStatus.KNOWN_ERR
+        # Invalid arguments are answered with an error, without stopping the server
+        assert client.subscribe(sensors=['temp'], max_rate=-1)[0] == ConnStatus.KNOWN_ERR
+        assert client.subscribe(sensors=['temp'], buffer=0)[0] == ConnStatus.KNOWN_ERR
+        assert server.thread.is_running
+        # Streams are the whole response, not an item of a batch
+        status, results = client.batch([('subscribe', {'sensors': ['temp']}), ('echo', {'value': 1})])
+        assert status == ConnStatus.CONN_OK and results[1] == {'ok': True, 'data': {'value': 1}}
+        assert results[0]['ok'] is False and results[0]['error'].startswith('InvalidCommandError')
+        assert not reader.listeners
+
+        status, frames = client.subscribe(sensors=['temp'], max_rate=50)
+        assert status == ConnStatus.CONN_OK
+        deadline = time.monotonic() + 2
+        while not reader.listeners and time.monotonic() < deadline:
+            time.sleep(0.01)
+        for i in range(5):
+            reader.listeners[0]('temp', (i, 20.5))
+
+        received = []
+        while len(received) < 5:
+            received.extend(next(frames)['data']['temp'])
+        assert received == [[i, 20.5] for i in range(5)]
+
+        frames.close()
+        deadline = time.monotonic() + 2
+        while reader.listeners and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert not reader.listeners
+    finally:
+        server.close(timeout=2)
+
+
+def test_serializer_negotiation(server):
+    assert CPUClient(server.host, server.port, serializer='pickle').message(
+        'echo --kwargs {"value": 1}') == (ConnStatus.CONN_OK, {'value': 1})
+    with CPUClient(server.host, server.port, serializer='pickle') as client:
+        assert client.batch([('echo', {'value': 2})]) == (ConnStatus.CONN_OK, [{'ok': True, 'data': {'value': 2}}])
+
+
+def test_empty_connection(server):
+    # Port probes connect and close without sending anything
+    probe = socket.create_connection((server.host, server.port))
+    probe.close()
+    time.sleep(.1)
+
+    assert CPUClient(server.host, server.port).message('echo --kwargs {"value": 1}') == \
+        (ConnStatus.CONN_OK, {'value': 1})
+
+
+
+def test_response_is_sent_at_once(server):
+    class Connection:
+        def __init__(self):
+            self.writes = []
+
+        def sendall(self, data):
+            self.writes.append(data)
+
+    # Status, data type and payload go in a single write, errors too
+    for message in (b'echo --kwargs {"value": 1}', b'unknown'):
+        conn = Connection()
+        server.respond(conn, None, message)
+        assert len(conn.writes) == 1 and conn.writes[0].startswith(b'00000009exec_ok:')
+
+
+def test_unexpected_errors(server):
+    # Errors other than evaluation errors are answered as well and do not end the accept loop
+    status, message = CPUClient(server.host, server.port).message('fail')
+    assert status == ConnStatus.KNOWN_ERR and message == ('ValueError', 'failed')
+    assert server.thread.is_running
+    assert CPUClient(server.host, server.port).message('echo --kwargs {"value": 1}') == \
+        (ConnStatus.CONN_OK, {'value': 1})
@@ -0,0 +1,77 @@
+import pytest
+import time
+from savannah.asynchrony import processes
+from savannah.asynchrony.supervisor import Supervisor, RestartPolicy, RestartType
+
+
+#
+# Process definitions
+#
+
+class CrashingProcess(processes.Process):
+    @staticmethod
+    def task(pipe_map: dict):
+        raise SystemExit(3)
+
+class HangingProcess(processes.Process):
+    @staticmethod
+    def task(pipe_map: dict, heartbeat):
+        heartbeat.beat()
+        time.sleep(30)
+
+class PoliteProcess(processes.Process):
+    @staticmethod
+    def task(pipe_map: dict, heartbeat):
+        while not heartbeat.stopping:
+            heartbeat.beat()
+            time.sleep(0.05)
+
+class StubbornProcess(processes.Process):
+    @staticmethod
+    def task(pipe_map: dict):
+        import signal
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        time.sleep(30)
+
+
+def make_supervisor(**policy):
+    return Supervisor(RestartPolicy(**policy), interval=0.05, enable_ioserver=False)
+
+
+#
+# Tests
+#
+
+def test_restart_until_max_restarts():
+    supervisor = make_supervisor(max_restarts=2, backoff=0.05)
+    supervisor.supervise(CrashingProcess()).start()
+    time.sleep(1.5)
+    assert supervisor.failed == ['CrashingProcess']
+    assert len(supervisor.children['CrashingProcess'].restarts) == 2
+    supervisor.shutdown()
+
+def test_transient_process_is_not_restarted_on_success():
+    supervisor = make_supervisor(backoff=0.05)
+    process = processes.EasyProcess(name='Finisher').map(lambda pipe_map: None)
+    supervisor.supervise(process, restart=RestartType.TRANSIENT).start()
+    time.sleep(0.5)
+    child = supervisor.children['Finisher']
+    assert child.done and not child.failed and not child.restarts
+    supervisor.shutdown()
+
+def test_missed_heartbeat_restarts_process():
+    supervisor = make_supervisor(backoff=0.05)
+    supervisor.supervise(HangingProcess(), heartbeat_timeout=0.3).start()
+    time.sleep(1.5)
+    assert len(supervisor.children['HangingProcess'].restarts) >= 1
+    supervisor.shutdown(graceful=False)
+
+def test_shutdown_tiers():
+    supervisor = make_supervisor()
+    polite, stubborn = PoliteProcess(), StubbornProcess()
+    supervisor.supervise(polite, heartbeat_timeout=5).supervise(stubborn).start()
+    time.sleep(0.5)
+
+    supervisor.shutdown(graceful=True, timeout=1, terminate_timeout=0.5)
+    assert polite.process.exitcode == 0     # Finished on its own
+    assert stubborn.process.exitcode == -9  # Killed